@@ -0,0 +1,394 @@
+"""
+Offline scraper benchmarks
+Times extraction, browser startup and the full detail batch loop against the
+fixture corpus and the local replay server, and saves the numbers so runs
+can be compared between versions
+
+Usage: python bench.py [extract|driver|batch|stations|map|query|all] [--pages N] [--latency S] [--error-rate R] [--throttled] [--no-save]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / 'src'))
+
+import pandas as pd
+from bs4 import BeautifulSoup
+from extraction import extract_search_page, extract_property_details
+from legacy_extraction import legacy_links_from_soup, legacy_property_details
+from metrics import METRICS
+from replay_server import ReplayServer, FIXTURES_DIR
+from osm_server import OsmServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ========== CONFIGURATION ==========
+RESULTS_DIR = BENCH_DIR / 'results'
+EXTRACT_ITERATIONS = 200     # Parses per fixture in the extraction benchmark
+DRIVER_LAUNCHES = 3
+BATCH_PAGES = 300
+MAP_SIZES = [1000, 5000, 20000]  # Listings per map build
+LEGACY_MAP_MAX = 5000            # The per-row legacy map is too slow beyond this
+QUERY_ROWS = 50000               # Listings in the query index
+QUERY_ITERATIONS = 500
+REGRESSION_THRESHOLD = 0.10  # Flag changes worse than 10% against the previous run
+
+DETAIL_FIXTURES = ['detail', 'detail_no_title', 'detail_no_coords']
+
+# ========== MEASUREMENT ==========
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] if values else None
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB (None if unavailable)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+    except (ImportError, AttributeError):
+        return None
+
+def summarize(durations, pages=None, elapsed=None):
+    """pages/min plus p50/p95 latency (ms) for a list of per-page durations in seconds."""
+    pages = len(durations) if pages is None else pages
+    elapsed = sum(durations) if elapsed is None else elapsed
+    return {
+        'pages': pages,
+        'seconds': round(elapsed, 3),
+        'pages_per_min': round(pages / elapsed * 60, 1) if elapsed else None,
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 2) if durations else None,
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 2) if durations else None,
+    }
+
+def time_calls(func, iterations):
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            pass  # Failure variants raise by design; the time still counts
+        durations.append(time.perf_counter() - start)
+    return durations
+
+class StageTimer:
+    """Thread-safe per-stage latency samples for wrapped callables."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.samples[stage].append(time.perf_counter() - start)
+        return timed
+
+# ========== BENCHMARKS ==========
+def bench_extract(iterations=EXTRACT_ITERATIONS):
+    """Search and detail extraction per fixture, single-pass vs the legacy BeautifulSoup path."""
+    fixtures = {path.stem: path.read_text(encoding='utf-8') for path in FIXTURES_DIR.glob('*.html')}
+    results = {}
+    for name in ['search', 'search_empty']:
+        html = fixtures[name]
+        results[f'search_page/{name}'] = summarize(time_calls(lambda: extract_search_page(html, 'pasig', 'condo'), iterations))
+        results[f'legacy_links_from_soup/{name}'] = summarize(time_calls(
+            lambda: legacy_links_from_soup(BeautifulSoup(html, 'html.parser'), 'pasig', 'condo'), iterations))
+    for name in DETAIL_FIXTURES:
+        html = fixtures[name]
+        results[f'property_details/{name}'] = summarize(time_calls(lambda: extract_property_details(html, name), iterations))
+        results[f'legacy_property_details/{name}'] = summarize(time_calls(lambda: legacy_property_details(html, name), iterations))
+
+    # Instrumentation overhead: the same extraction with metrics recording switched off
+    html = fixtures['detail']
+    METRICS.enabled = False
+    try:
+        results['property_details/detail (metrics off)'] = summarize(time_calls(lambda: extract_property_details(html, 'detail'), iterations))
+    finally:
+        METRICS.enabled = True
+    results['metrics/observe'] = summarize(time_calls(lambda: METRICS.observe('bench_seconds', 0.01, stage='bench'), iterations * 10))
+    return results
+
+def bench_driver(launches=DRIVER_LAUNCHES):
+    """Cold start of a configured Chrome driver (create_driver + quit)."""
+    try:
+        from browser import create_driver
+        durations = []
+        for _ in range(launches):
+            start = time.perf_counter()
+            driver = create_driver()
+            durations.append(time.perf_counter() - start)
+            driver.quit()
+    except Exception as e:
+        return {'create_driver': {'skipped': f'{type(e).__name__}: {str(e)[:100]}'}}
+    return {'create_driver': summarize(durations)}
+
+def bench_batch(pages=BATCH_PAGES, latency=0.05, error_rate=0.02, throttled=False):
+    """
+    scrape_details.main() end to end against the replay server: batching,
+    retries, crawl store, parse stage and dataset writes, over HTTP only.
+    """
+    import scrape_details as sd
+    from fetchers import HttpFetcher, ThrottledFetcher
+    from retry import RetryScheduler, CircuitBreaker
+
+    timer = StageTimer()
+    with ReplayServer(latency=latency, error_rate=error_rate) as server, tempfile.TemporaryDirectory() as work_dir:
+        links = pd.DataFrame({
+            'url': [server.detail_url(n) for n in range(pages)],
+            'property_id': [f'bench-{n:06d}' for n in range(pages)],
+            'title': 'Condo For Rent in Ortigas',
+            'city': 'pasig',
+            'property_type': 'condo',
+        })
+        links_file = f'{work_dir}/links.csv'
+        links.to_csv(links_file, index=False)
+
+        sd.LINKS_FILE = links_file
+        sd.OUTPUT_PATH = work_dir
+        sd.STATE_FILE = f'{work_dir}/crawl_state.sqlite'
+        sd.DATASET_DIR = f'{work_dir}/property_details'
+        sd.AGGREGATES_FILE = f'{work_dir}/grid_aggregates.sqlite'
+        sd.PREVIOUS_COMBINED_FILE = None
+        sd.RETRIES = RetryScheduler(sd.RETRY_ATTEMPTS, base_delay=0.2, max_delay=2.0)
+        sd.BREAKER = CircuitBreaker()
+        # HTTP only: the Selenium fallback would need Chrome and is benchmarked separately.
+        # Unthrottled runs measure the pipeline's own ceiling.
+        fetcher = ThrottledFetcher(HttpFetcher()) if throttled else HttpFetcher()
+        fetcher.fetch = timer.wrap('fetch', fetcher.fetch)
+        sd.FETCHER = fetcher
+        sd.setup()
+        sd.PARSER.detail = timer.wrap('parse', sd.PARSER.detail)
+        sd.save_batch = timer.wrap('save_batch', sd.save_batch)
+
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                sd.main()
+        finally:
+            elapsed = time.perf_counter() - start
+            fetcher.close()
+            sd.PARSER.close()
+
+        result = {'batch_loop': summarize([], pages=pages, elapsed=elapsed)}
+        result['batch_loop'].update({
+            'parse_calls': len(timer.samples['parse']),
+            'requests': server.requests,
+            'server_errors': server.errors,
+            'retries': sd.RETRIES.scheduled,
+        })
+        for stage, samples in timer.samples.items():
+            result[f'batch_loop/{stage}'] = summarize(samples)
+        return result
+
+def bench_stations(latency=0.05):
+    """
+    Station data for the fixture line against the OSM stand-in: one request
+    per node (the notebook's old approach) vs stations.py cold, cached and
+    revalidated after the TTL.
+    """
+    import requests
+    import xml.etree.ElementTree as ET
+    from stations import OsmClient, fetch_stations, parse_relation
+
+    lines = {'MRT Line 3': 109159}
+    results = {}
+    with OsmServer(latency=latency) as server, tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        node_ids, _ = parse_relation(requests.get(f'{server.url}/relation/109159', timeout=10).content)
+        for node_id in node_ids:
+            ET.fromstring(requests.get(f'{server.url}/node/{node_id}', timeout=10).content)
+        results['stations/per_node_requests'] = summarize([], pages=len(node_ids), elapsed=time.perf_counter() - start)
+        results['stations/per_node_requests']['requests'] = server.requests
+
+        client = OsmClient(server.url, cache_dir)
+        for name, ttl in [('cold', None), ('cached', None), ('revalidated', 0)]:
+            if ttl is not None:
+                client.ttl = ttl
+            before = server.requests
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                stations = fetch_stations(lines, client=client)
+            results[f'stations/bulk_{name}'] = summarize([], pages=len(stations), elapsed=time.perf_counter() - start)
+            results[f'stations/bulk_{name}']['requests'] = server.requests - before
+        client.close()
+    return results
+
+def synthetic_listings(n, seed=0):
+    """n listings scattered over Metro Manila with prices, titles and distances."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'url': [f'https://www.lamudi.com.ph/property/bench-{i:06d}' for i in range(n)],
+        'title': [f'Furnished Studio Condo For Rent in Ortigas #{i}' for i in range(n)],
+        'price_php': rng.integers(10000, 35000, n),
+        'latitude': rng.uniform(14.50, 14.70, n),
+        'longitude': rng.uniform(120.98, 121.10, n),
+        'nearest_station': 'Ortigas',
+        'station_distance_m': rng.uniform(0, 3000, n),
+        'destination_distance_m': rng.uniform(0, 9000, n),
+    })
+
+def bench_map(sizes=MAP_SIZES):
+    """Map build + render time and HTML size: build_map (auto mode) vs the legacy per-row map."""
+    from maps import build_map, legacy_map, map_mode
+    results = {}
+    for n in sizes:
+        df = synthetic_listings(n)
+        builders = [(f'map/build_map_{map_mode(n)}/{n}', build_map)]
+        if n <= LEGACY_MAP_MAX:
+            builders.append((f'map/legacy_map/{n}', legacy_map))
+        for name, builder in builders:
+            start = time.perf_counter()
+            html = builder(df).get_root().render()
+            results[name] = summarize([], pages=n, elapsed=time.perf_counter() - start)
+            results[name]['html_kb'] = round(len(html.encode('utf-8')) / 1024, 1)
+    return results
+
+def bench_query(rows=QUERY_ROWS, iterations=QUERY_ITERATIONS):
+    """Indexed ListingIndex queries vs a pandas boolean-mask scan over the same frame."""
+    import numpy as np
+    from geo import haversine_m
+    from query import ListingIndex
+    rng = np.random.default_rng(1)
+    df = synthetic_listings(rows).assign(
+        floor_area_sqm=rng.uniform(18, 150, rows).round(1),
+        bedrooms=rng.integers(0, 4, rows),
+        city=rng.choice(['pasig', 'makati', 'taguig', 'mandaluyong', 'quezon-city'], rows),
+        property_type=rng.choice(['condominium', 'apartment', 'house'], rows),
+        furnishing=rng.choice(['Fully Furnished', 'Semi Furnished', 'Unfurnished'], rows),
+    )
+    start = time.perf_counter()
+    index = ListingIndex(df)
+    results = {'query/build_index': summarize([], pages=rows, elapsed=time.perf_counter() - start)}
+
+    lat, lon = 14.5847, 121.0592
+    queries = {
+        'price_bedrooms_top10': (
+            dict(price_php=(None, 15000), bedrooms=1, sort='price_php', limit=10),
+            lambda: df[(df['price_php'] <= 15000) & (df['bedrooms'] == 1)].nsmallest(10, 'price_php')),
+        'city_furnishing_top20': (
+            dict(city=['pasig', 'makati'], furnishing='Fully Furnished', sort='floor_area_sqm', descending=True, limit=20),
+            lambda: df[df['city'].isin(['pasig', 'makati']) & (df['furnishing'] == 'Fully Furnished')].nlargest(20, 'floor_area_sqm')),
+        'radius_1km_nearest10': (
+            dict(near=(lat, lon, 1000), price_php=(None, 25000), sort='distance_m', limit=10),
+            lambda: df.assign(d=haversine_m(df['latitude'], df['longitude'], lat, lon)).query('d <= 1000 and price_php <= 25000').nsmallest(10, 'd')),
+    }
+    for name, (kwargs, scan) in queries.items():
+        results[f'query/index/{name}'] = summarize(time_calls(lambda: index.find(**kwargs), iterations))
+        results[f'query/pandas_scan/{name}'] = summarize(time_calls(scan, max(iterations // 10, 1)))
+    return results
+
+# ========== RESULTS ==========
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_results(results, previous=None):
+    previous = (previous or {}).get('benchmarks', {})
+    print(f"\n{'benchmark':<45} {'pages/min':>12} {'p50 ms':>10} {'p95 ms':>10}   vs previous")
+    for name, r in results.items():
+        if 'skipped' in r:
+            print(f"{name:<45} skipped: {r['skipped']}")
+            continue
+        change = ''
+        old = previous.get(name, {})
+        if old.get('pages_per_min') and r.get('pages_per_min'):
+            delta = r['pages_per_min'] / old['pages_per_min'] - 1
+            flag = ' ⚠️ regression' if delta < -REGRESSION_THRESHOLD else ''
+            change = f"{delta:+.1%}{flag}"
+        p50 = f"{r['p50_ms']:.2f}" if r.get('p50_ms') is not None else '-'
+        p95 = f"{r['p95_ms']:.2f}" if r.get('p95_ms') is not None else '-'
+        size = f"  ({r['html_kb']:,.0f} KB)" if 'html_kb' in r else ''
+        print(f"{name:<45} {r['pages_per_min'] or 0:>12,.1f} {p50:>10} {p95:>10}   {change}{size}")
+
+def latest_result():
+    files = sorted(RESULTS_DIR.glob('*.json'))
+    return json.loads(files[-1].read_text()) if files else None
+
+def save_results(results, settings):
+    RESULTS_DIR.mkdir(exist_ok=True)
+    revision = git_revision()
+    payload = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': settings,
+        'peak_rss_mb': peak_rss_mb(),
+        'benchmarks': results,
+    }
+    path = RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{revision or 'norev'}.json"
+    path.write_text(json.dumps(payload, indent=2))
+    return path
+
+# ========== MAIN EXECUTION ==========
+def main():
+    parser = argparse.ArgumentParser(description='Offline scraper benchmarks')
+    parser.add_argument('suite', nargs='?', default='all', choices=['extract', 'driver', 'batch', 'stations', 'map', 'query', 'all'])
+    parser.add_argument('--iterations', type=int, default=EXTRACT_ITERATIONS)
+    parser.add_argument('--pages', type=int, default=BATCH_PAGES)
+    parser.add_argument('--latency', type=float, default=0.05, help='replay server latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='share of requests answered with HTTP 503')
+    parser.add_argument('--throttled', action='store_true', help='keep the adaptive throttle at its normal starting limits')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("SCRAPER BENCHMARKS")
+    print("=" * 70)
+    previous = latest_result()
+    results = {}
+    if args.suite in ('extract', 'all'):
+        print("📄 Extraction...")
+        results.update(bench_extract(args.iterations))
+    if args.suite in ('driver', 'all'):
+        print("🌐 Browser startup...")
+        results.update(bench_driver())
+    if args.suite in ('batch', 'all'):
+        print(f"🔁 Batch loop ({args.pages} pages, {args.latency * 1000:.0f} ms latency, {args.error_rate:.0%} errors)...")
+        results.update(bench_batch(args.pages, args.latency, args.error_rate, args.throttled))
+    if args.suite in ('stations', 'all'):
+        print("🚉 Station data...")
+        results.update(bench_stations(args.latency))
+    if args.suite in ('map', 'all'):
+        print("🗺️  Map build...")
+        results.update(bench_map())
+    if args.suite in ('query', 'all'):
+        print("🔎 Listing queries...")
+        results.update(bench_query())
+
+    print_results(results, previous)
+    print(f"\n🧠 Peak RSS: {peak_rss_mb()} MB")
+    if previous:
+        print(f"   Compared with {previous['time']} ({previous.get('revision')})")
+    if not args.no_save:
+        print(f"💾 Saved: {save_results(results, vars(args))}")
+
+if __name__ == '__main__':
+    main()
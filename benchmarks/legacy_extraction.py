@@ -0,0 +1,228 @@
+"""
+Legacy extraction reference
+The original BeautifulSoup extractors (one find() per field), kept as the
+parity fixture for extraction.py and the baseline in bench.py
+"""
+import json
+import re
+import sys
+from pathlib import Path
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from extraction import extract_property_details, extract_search_page, MissingTitleError
+
+# ========== LEGACY EXTRACTORS ==========
+def legacy_property_details(html, url):
+    """Original scrape_property_details extraction, kept as the reference for `verify`."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title_elem = soup.find('div', class_='main-title')
+    title = title_elem.find('h1').get_text(strip=True) if title_elem and title_elem.find('h1') else None
+    if not title:
+        raise MissingTitleError("No title found - page may not have loaded")
+
+    price_elem = soup.find('div', class_='prices-and-fees__price', attrs={'data-test': 'listing-price'})
+    price_text = price_elem.get_text(strip=True) if price_elem else None
+    price = None
+    if price_text:
+        price_match = re.search(r'₱\s*([\d,]+)', price_text)
+        if price_match:
+            price = int(price_match.group(1).replace(',', ''))
+
+    bedrooms_elem = soup.find('div', class_='details-item-value', attrs={'data-test': 'bedrooms-value'})
+    bedrooms_text = bedrooms_elem.get_text(strip=True) if bedrooms_elem else None
+    bedrooms = None
+    if bedrooms_text:
+        bed_match = re.search(r'(\d+)', bedrooms_text)
+        if bed_match:
+            bedrooms = int(bed_match.group(1))
+
+    bathrooms_elem = soup.find('div', class_='details-item-value', attrs={'data-test': 'full-bathrooms-value'})
+    bathrooms_text = bathrooms_elem.get_text(strip=True) if bathrooms_elem else None
+    bathrooms = None
+    if bathrooms_text:
+        bath_match = re.search(r'(\d+)', bathrooms_text)
+        if bath_match:
+            bathrooms = int(bath_match.group(1))
+
+    location_elem = soup.find('div', class_='view-map__text')
+    location = location_elem.get_text(strip=True) if location_elem else None
+
+    desc_elem = soup.find('div', id='description-text', class_='content')
+    description = desc_elem.get_text(strip=True)[:500] if desc_elem else None
+
+    furnishing = None
+    facilities_items = soup.find_all('div', class_='facilities__item')
+    for item in facilities_items:
+        text = item.get_text(strip=True).lower()
+        if 'furnished' in text:
+            furnishing = item.get_text(strip=True)
+            break
+
+    amenities = []
+    for item in facilities_items:
+        amenity_text = item.get_text(strip=True)
+        if amenity_text and amenity_text not in ['Garage', 'Alarm']:
+            amenities.append(amenity_text)
+    amenities_str = ', '.join(amenities[:10]) if amenities else None
+
+    floor_area = None
+    floor_items = soup.find_all('div', class_='details-item-value')
+    for item in floor_items:
+        text = item.get_text(strip=True)
+        if 'sqm' in text.lower() or 'm²' in text:
+            area_match = re.search(r'([\d,\.]+)\s*(?:sqm|m²)', text, re.I)
+            if area_match:
+                floor_area = float(area_match.group(1).replace(',', ''))
+                break
+
+    latitude = None
+    longitude = None
+    for script in soup.find_all('script'):
+        if script.string:
+            for lat_pattern in [r'["\']?lat(?:itude)?["\']?\s*[:=]\s*([\d\.\-]+)', r'lat:\s*([\d\.\-]+)', r'"lat":\s*([\d\.\-]+)']:
+                lat_match = re.search(lat_pattern, script.string, re.I)
+                if lat_match:
+                    latitude = float(lat_match.group(1))
+                    break
+            for lng_pattern in [r'["\']?lon(?:g|gitude)?["\']?\s*[:=]\s*([\d\.\-]+)', r'lng:\s*([\d\.\-]+)', r'"lng":\s*([\d\.\-]+)']:
+                lng_match = re.search(lng_pattern, script.string, re.I)
+                if lng_match:
+                    longitude = float(lng_match.group(1))
+                    break
+            if latitude and longitude:
+                break
+
+    if not latitude or not longitude:
+        map_elem = soup.find('div', id='map')
+        if map_elem:
+            latitude = map_elem.get('data-lat') or map_elem.get('data-latitude')
+            longitude = map_elem.get('data-lng') or map_elem.get('data-longitude')
+            if latitude:
+                latitude = float(latitude)
+            if longitude:
+                longitude = float(longitude)
+
+    if not latitude or not longitude:
+        json_ld = soup.find('script', type='application/ld+json')
+        if json_ld:
+            try:
+                data_json = json.loads(json_ld.string)
+                if isinstance(data_json, dict):
+                    if '@graph' in data_json:
+                        for item in data_json['@graph']:
+                            if isinstance(item, dict) and 'geo' in item:
+                                geo = item.get('geo', {})
+                                latitude = float(geo.get('latitude')) if geo.get('latitude') else None
+                                longitude = float(geo.get('longitude')) if geo.get('longitude') else None
+                                if latitude and longitude:
+                                    break
+                    else:
+                        geo = data_json.get('geo', {})
+                        latitude = float(geo.get('latitude')) if geo.get('latitude') else None
+                        longitude = float(geo.get('longitude')) if geo.get('longitude') else None
+            except:
+                pass
+
+    return {
+        'url': url,
+        'title': title,
+        'price_php': price,
+        'bedrooms': bedrooms,
+        'bathrooms': bathrooms,
+        'floor_area_sqm': floor_area,
+        'location': location,
+        'latitude': latitude,
+        'longitude': longitude,
+        'description': description,
+        'furnishing': furnishing,
+        'amenities': amenities_str,
+        'scrape_status': 'success'
+    }
+
+def legacy_links_from_soup(soup, city, prop_type):
+    """Original extract_links_from_soup logic, kept as the reference for `verify`."""
+    property_data = []
+    for snippet in soup.find_all('div', class_='snippet'):
+        link_elem = snippet.find('a', href=re.compile(r'/property/'))
+        if not link_elem:
+            continue
+
+        href = link_elem.get('href')
+        if href.startswith('/'):
+            href = f'https://www.lamudi.com.ph{href}'
+
+        prop_id = snippet.get('data-idanuncio') or snippet.get('data-alternateid')
+
+        title_elem = snippet.find('span', class_='snippet__content__title')
+        title = title_elem.get_text(strip=True) if title_elem else None
+
+        location_elem = snippet.find('span', attrs={'data-test': 'snippet-content-location'})
+        location = location_elem.get_text(strip=True) if location_elem else None
+
+        price_elem = snippet.find('div', class_='snippet__content__price')
+        price_text = price_elem.get_text(strip=True) if price_elem else None
+        price = None
+        if price_text:
+            price_match = re.search(r'₱\s*([\d,]+)', price_text)
+            if price_match:
+                price = int(price_match.group(1).replace(',', ''))
+
+        bedrooms_elem = snippet.find('span', class_='bedrooms', attrs={'data-test': 'bedrooms-value'})
+        bedrooms = bedrooms_elem.get_text(strip=True) if bedrooms_elem else None
+
+        bathrooms_elem = snippet.find('span', class_='bathrooms', attrs={'data-test': 'full-bathrooms-value'})
+        bathrooms = bathrooms_elem.get_text(strip=True) if bathrooms_elem else None
+
+        property_data.append({
+            'property_id': prop_id,
+            'url': href,
+            'title': title,
+            'location': location,
+            'price_preview': price,
+            'bedrooms_preview': bedrooms,
+            'bathrooms_preview': bathrooms,
+            'city': city,
+            'property_type': prop_type
+        })
+    return property_data
+
+# ========== VERIFICATION ==========
+def _outcome(func, *args):
+    try:
+        return repr(func(*args))
+    except MissingTitleError as e:
+        return f'error: {e}'
+
+def verify(paths, backend=None):
+    """
+    Compare the single-pass extractor with the legacy path on saved HTML files.
+
+    Detail and search pages are both checked; returns the list of files whose
+    records differ (compared by repr, so types and float formatting must match).
+    """
+    mismatches = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        url = f'file://{path}'
+        new = [_outcome(extract_property_details, html, url, backend),
+               repr(extract_search_page(html, 'city', 'type', backend)[0])]
+        old = [_outcome(legacy_property_details, html, url),
+               repr(legacy_links_from_soup(BeautifulSoup(html, 'html.parser'), 'city', 'type'))]
+        status = '✅' if new == old else '❌'
+        print(f"{status} {path}")
+        if new != old:
+            mismatches.append(path)
+    return mismatches
+
+if __name__ == '__main__':
+    # Usage: python legacy_extraction.py verify page1.html page2.html ...
+    if len(sys.argv) < 3 or sys.argv[1] != 'verify':
+        print("Usage: python legacy_extraction.py verify <html files...>")
+        sys.exit(2)
+    failed = verify(sys.argv[2:])
+    print(f"\n{len(sys.argv) - 2 - len(failed)}/{len(sys.argv) - 2} files identical")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,114 @@
+"""
+Local stand-in for the OpenStreetMap API
+Serves relations and nodes from canned OSM XML with ETags, so the station
+fetcher and its cache can be exercised offline
+"""
+import hashlib
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from replay_server import FIXTURES_DIR
+
+API_PREFIX = '/api/0.6'
+
+class OsmServer:
+    """
+    Threaded HTTP server on 127.0.0.1 answering
+
+    /api/0.6/relation/<id>          the relation element
+    /api/0.6/node/<id>              one node
+    /api/0.6/nodes?nodes=<a>,<b>    the listed nodes (404 if any is missing)
+
+    from the elements in `fixtures` (default: fixtures/osm_*.xml). Every
+    response has an ETag and If-None-Match is answered with 304. Each
+    response waits `latency` seconds. Use as a context manager.
+    """
+
+    def __init__(self, fixtures=None, latency=0.0, port=0):
+        self.latency = latency
+        self.nodes = {}
+        self.relations = {}
+        for path in fixtures or sorted(FIXTURES_DIR.glob('osm_*.xml')):
+            root = ET.parse(path).getroot()
+            self.nodes.update({el.get('id'): el for el in root.findall('node')})
+            self.relations.update({el.get('id'): el for el in root.findall('relation')})
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}{API_PREFIX}'
+
+    @staticmethod
+    def _document(elements):
+        root = ET.Element('osm', version='0.6', generator='osm_server')
+        root.extend(elements)
+        return b'<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding='utf-8')
+
+    def respond(self, path):
+        """(status, body) for a request path."""
+        parsed = urlparse(path)
+        parts = parsed.path[len(API_PREFIX):].strip('/').split('/')
+        if parts[0] == 'nodes':
+            ids = parse_qs(parsed.query).get('nodes', [''])[0].split(',')
+            if not all(node_id in self.nodes for node_id in ids):
+                return 404, b''
+            return 200, self._document(self.nodes[node_id] for node_id in ids)
+        if len(parts) == 2 and parts[0] in ('node', 'relation'):
+            elements = self.nodes if parts[0] == 'node' else self.relations
+            if parts[1] not in elements:
+                return 404, b''
+            return 200, self._document([elements[parts[1]]])
+        return 404, b''
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                status, body = server.respond(self.path)
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    with server._lock:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 200:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='osm-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
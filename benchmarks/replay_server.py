@@ -0,0 +1,135 @@
+"""
+Local stand-in for Lamudi
+Serves the fixture pages over HTTP with configurable latency, error rate and
+share of broken detail pages, so the scrapers can be benchmarked offline
+"""
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+PAGE_OF_RE = re.compile(r'Page\s+\d+\s+of\s+\d+', re.I)
+
+class ReplayServer:
+    """
+    Threaded HTTP server on 127.0.0.1 replaying the fixture corpus.
+
+    /rent/<region>/<city>/<type>/?page=N   search.html, "Page N of `pages`"
+                                           (search_empty.html past the last page)
+    /property/<id>                         detail.html, or detail_no_title.html /
+                                           detail_no_coords.html for a stable
+                                           share of ids
+
+    Every response waits `latency` seconds (+/- `jitter`); `error_rate` of
+    requests get `error_status` instead. Use as a context manager.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, error_status=503,
+                 no_title_rate=0.05, no_coords_rate=0.1, pages=5, port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.no_title_rate = no_title_rate
+        self.no_coords_rate = no_coords_rate
+        self.pages = pages
+        self.fixtures = {path.stem: path.read_bytes() for path in FIXTURES_DIR.glob('*.html')}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def detail_url(self, n):
+        return f'{self.url}/property/bench-{n:06d}'
+
+    def search_url(self, city='pasig', prop_type='condo', page=1):
+        url = f'{self.url}/rent/metro-manila/{city}/{prop_type}/'
+        return url if page == 1 else f'{url}?page={page}'
+
+    def _detail_variant(self, path):
+        # Stable per URL, so a retry of a broken page stays broken
+        share = (zlib.crc32(path.encode()) % 10000) / 10000
+        if share < self.no_title_rate:
+            return 'detail_no_title'
+        if share < self.no_title_rate + self.no_coords_rate:
+            return 'detail_no_coords'
+        return 'detail'
+
+    def respond(self, path):
+        """(status, body) for a request path."""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(delay)
+        if failed:
+            return self.error_status, b'<html><body>Service unavailable</body></html>'
+
+        parsed = urlparse(path)
+        if parsed.path.startswith('/property/'):
+            return 200, self.fixtures[self._detail_variant(parsed.path)]
+        if parsed.path.startswith('/rent/'):
+            page = int(parse_qs(parsed.query).get('page', ['1'])[0])
+            if page > self.pages:
+                return 200, self.fixtures['search_empty']
+            html = self.fixtures['search'].decode('utf-8')
+            return 200, PAGE_OF_RE.sub(f'Page {page} of {self.pages}', html, count=1).encode('utf-8')
+        return 404, b'<html><body>Not found</body></html>'
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = server.respond(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='replay-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == '__main__':
+    # Usage: python replay_server.py [port] - serve the fixtures until Ctrl+C
+    import sys
+    server = ReplayServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765).start()
+    print(f"🛰️  Replaying fixtures at {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
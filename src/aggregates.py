@@ -0,0 +1,311 @@
+"""
+Materialized grid aggregates of rent statistics
+Per grid cell, city, property type and bedrooms: listing count and mergeable
+price and price-per-sqm histograms, updated from new dataset files only
+"""
+import json
+import math
+import sqlite3
+import sys
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dataset import PARTITIONING
+from delta import DELISTED
+
+# ========== CONFIGURATION ==========
+GRID_CELL_DEG = 0.005       # Square cells, ~550 m (maps.py draws the same grid)
+BIN_RATIO = 1.02            # Histogram bins grow by 2%, so quantiles are within ~1%
+QUANTILES = [0.10, 0.25, 0.50, 0.75, 0.90]
+DIMENSIONS = ['cell_lat', 'cell_lon', 'city', 'property_type', 'bedrooms']
+SOURCE_COLUMNS = ['url', 'price_php', 'floor_area_sqm', 'latitude', 'longitude', 'bedrooms', 'property_type', 'scrape_status', 'listing_status', 'crawl_date', 'city']
+
+# Unknown dimension values (NULLs cannot be part of a SQLite key)
+UNKNOWN = ''
+UNKNOWN_BEDROOMS = -1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    cell_lat        INTEGER NOT NULL,
+    cell_lon        INTEGER NOT NULL,
+    city            TEXT NOT NULL,
+    property_type   TEXT NOT NULL,
+    bedrooms        INTEGER NOT NULL,
+    count           INTEGER NOT NULL,
+    price_hist      TEXT NOT NULL,
+    ppsqm_hist      TEXT NOT NULL,
+    PRIMARY KEY (cell_lat, cell_lon, city, property_type, bedrooms)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    url             TEXT PRIMARY KEY,
+    crawl_date      TEXT NOT NULL,
+    cell_lat        INTEGER NOT NULL,
+    cell_lon        INTEGER NOT NULL,
+    city            TEXT NOT NULL,
+    property_type   TEXT NOT NULL,
+    bedrooms        INTEGER NOT NULL,
+    price_bin       INTEGER NOT NULL,
+    ppsqm_bin       INTEGER
+);
+CREATE TABLE IF NOT EXISTS applied_files (
+    path            TEXT PRIMARY KEY,
+    row_count       INTEGER NOT NULL,
+    applied_at      TEXT NOT NULL
+);
+"""
+
+# ========== HISTOGRAM BINS ==========
+# Log-spaced bins: bin b covers [BIN_RATIO**b, BIN_RATIO**(b+1))
+_LOG_RATIO = math.log(BIN_RATIO)
+
+def value_bins(values):
+    """Bin index per value (vectorized); NaN and non-positive values get -1."""
+    values = np.asarray(values, dtype=float)
+    bins = np.full(len(values), -1, dtype=np.int64)
+    valid = np.isfinite(values) & (values > 0)
+    bins[valid] = np.floor(np.log(values[valid]) / _LOG_RATIO).astype(np.int64)
+    return bins
+
+def bin_value(b):
+    """Representative value of a bin (its geometric midpoint)."""
+    return BIN_RATIO ** (b + 0.5)
+
+def hist_quantiles(hist, quantiles=QUANTILES):
+    """Approximate quantiles from a {bin: count} histogram (None when empty)."""
+    total = sum(hist.values())
+    if not total:
+        return [None] * len(quantiles)
+    ordered = sorted(hist.items())
+    results = []
+    for q in quantiles:
+        rank = q * (total - 1)
+        seen = 0
+        for b, n in ordered:
+            seen += n
+            if seen > rank:
+                results.append(bin_value(b))
+                break
+    return results
+
+# ========== STORE ==========
+class GridAggregates:
+    """
+    SQLite table of cell statistics, maintained incrementally.
+
+    `update(dataset_dir)` reads only dataset files it has not applied yet.
+    Each URL contributes once, with its latest crawl: a newer row moves the
+    listing's contribution (different cell, price, bedrooms...), and a
+    delisted row removes it. Histograms add up, so any roll-up (per city,
+    per cell, everything) is exact up to the bin width.
+    """
+
+    def __init__(self, path, cell_deg=GRID_CELL_DEG):
+        self.path = str(path)
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    # ----- incremental update -----
+    def pending_files(self, dataset_dir):
+        applied = {path for (path,) in self._conn.execute("SELECT path FROM applied_files")}
+        files = [str(p) for p in sorted(Path(dataset_dir).rglob('*.parquet')) if str(p) not in applied]
+        # Oldest crawl first, so a later crawl of the same URL wins
+        return sorted(files, key=lambda p: (Path(p).parent.parent.name, p))
+
+    def update(self, dataset_dir):
+        """Apply new dataset files; returns (files applied, rows read)."""
+        with self._lock:
+            files = self.pending_files(dataset_dir)
+            if not files:
+                return 0, 0
+            dataset = ds.dataset(files, format='parquet', partitioning=PARTITIONING, partition_base_dir=str(dataset_dir))
+            rows = dataset.to_table(columns=SOURCE_COLUMNS).to_pandas()
+            with self._conn:
+                self._apply(rows)
+                now = datetime.now().isoformat(timespec='seconds')
+                self._conn.executemany(
+                    "INSERT INTO applied_files (path, row_count, applied_at) VALUES (?, ?, ?)",
+                    [(path, pq.ParquetFile(path).metadata.num_rows, now) for path in files]
+                )
+            return len(files), len(rows)
+
+    def rebuild(self, dataset_dir):
+        """Drop everything and apply the whole dataset again."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cells")
+            self._conn.execute("DELETE FROM listings")
+            self._conn.execute("DELETE FROM applied_files")
+        return self.update(dataset_dir)
+
+    def _listing_rows(self, df):
+        """One candidate contribution per URL from a batch of dataset rows."""
+        df = df.copy()
+        df['crawl_date'] = df['crawl_date'].astype(str)
+        succeeded = df['scrape_status'] == 'success'
+        # Same precedence as dataset.read_details: latest crawl, success first within a date
+        df = df.assign(_succeeded=succeeded).sort_values(['crawl_date', '_succeeded'], kind='stable')
+        df = df.drop_duplicates(subset=['url'], keep='last')
+
+        price = pd.to_numeric(df['price_php'], errors='coerce').to_numpy(dtype=float)
+        area = pd.to_numeric(df['floor_area_sqm'], errors='coerce').to_numpy(dtype=float)
+        lat = pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ppsqm = np.where(area > 0, price / area, np.nan)
+        bedrooms = pd.to_numeric(df['bedrooms'], errors='coerce')
+        cell_lat = np.floor(np.nan_to_num(lat) / self.cell_deg).astype(np.int64)
+        cell_lon = np.floor(np.nan_to_num(lon) / self.cell_deg).astype(np.int64)
+        return pd.DataFrame({
+            'url': df['url'].to_numpy(),
+            'crawl_date': df['crawl_date'].to_numpy(),
+            'usable': (df['_succeeded'].to_numpy() & np.isfinite(price) & (price > 0) & np.isfinite(lat) & np.isfinite(lon)),
+            'delisted': (df['listing_status'].astype(object) == DELISTED).to_numpy(),
+            'cell_lat': cell_lat,
+            'cell_lon': cell_lon,
+            'city': df['city'].astype(object).where(df['city'].notna(), UNKNOWN).astype(str).to_numpy(),
+            'property_type': df['property_type'].astype(object).where(df['property_type'].notna(), UNKNOWN).astype(str).to_numpy(),
+            'bedrooms': bedrooms.fillna(UNKNOWN_BEDROOMS).astype(np.int64).to_numpy(),
+            'price_bin': value_bins(price),
+            'ppsqm_bin': value_bins(ppsqm),
+        })
+
+    def _apply(self, df):
+        candidates = self._listing_rows(df)
+        stored = {}
+        urls = candidates['url'].tolist()
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            query = f"SELECT * FROM listings WHERE url IN ({','.join('?' * len(chunk))})"
+            for row in self._conn.execute(query, chunk):
+                stored[row[0]] = row
+
+        # Per cell key: change in count and histogram counts
+        deltas = defaultdict(lambda: [0, Counter(), Counter()])
+        upserts, deletes = [], []
+        for row in candidates.itertuples(index=False):
+            old = stored.get(row.url)
+            if old is not None and row.crawl_date < old[1]:
+                continue  # Older than what is already counted
+            if not row.delisted and not row.usable:
+                continue  # A failed re-scrape does not remove the listing
+            if old is not None:
+                key = tuple(old[2:7])
+                deltas[key][0] -= 1
+                deltas[key][1][old[7]] -= 1
+                if old[8] is not None:
+                    deltas[key][2][old[8]] -= 1
+            if row.delisted:
+                if old is not None:
+                    deletes.append((row.url,))
+                continue
+            key = (int(row.cell_lat), int(row.cell_lon), row.city, row.property_type, int(row.bedrooms))
+            ppsqm_bin = int(row.ppsqm_bin) if row.ppsqm_bin >= 0 else None
+            deltas[key][0] += 1
+            deltas[key][1][int(row.price_bin)] += 1
+            if ppsqm_bin is not None:
+                deltas[key][2][ppsqm_bin] += 1
+            upserts.append((row.url, row.crawl_date, *key, int(row.price_bin), ppsqm_bin))
+
+        self._conn.executemany("DELETE FROM listings WHERE url = ?", deletes)
+        self._conn.executemany("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", upserts)
+        for key, (count_delta, price_delta, ppsqm_delta) in deltas.items():
+            self._apply_cell_delta(key, count_delta, price_delta, ppsqm_delta)
+
+    def _apply_cell_delta(self, key, count_delta, price_delta, ppsqm_delta):
+        where = "cell_lat = ? AND cell_lon = ? AND city = ? AND property_type = ? AND bedrooms = ?"
+        row = self._conn.execute(f"SELECT count, price_hist, ppsqm_hist FROM cells WHERE {where}", key).fetchone()
+        count, price_hist, ppsqm_hist = (row[0], _load_hist(row[1]), _load_hist(row[2])) if row else (0, Counter(), Counter())
+        count += count_delta
+        price_hist.update(price_delta)
+        ppsqm_hist.update(ppsqm_delta)
+        if count <= 0:
+            self._conn.execute(f"DELETE FROM cells WHERE {where}", key)
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (*key, count, _dump_hist(price_hist), _dump_hist(ppsqm_hist))
+        )
+
+    # ----- reading -----
+    def read(self, by=DIMENSIONS, quantiles=QUANTILES, **where):
+        """
+        Statistics rolled up to the `by` dimensions, e.g. by=['city', 'bedrooms']
+        or by=['cell_lat', 'cell_lon'] for a map layer. Keyword arguments
+        filter on dimension values (city='pasig', bedrooms=1).
+
+        Columns: the `by` dimensions, count, price_p<q> for each quantile
+        (price_p50 is the median), price_per_sqm_p<q>, and south/west/lat/lon
+        of the cell when both cell dimensions are in `by`.
+        """
+        unknown = [name for name in list(by) + list(where) if name not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown dimensions: {unknown}")
+        sql = "SELECT cell_lat, cell_lon, city, property_type, bedrooms, count, price_hist, ppsqm_hist FROM cells"
+        if where:
+            sql += " WHERE " + " AND ".join(f"{name} = ?" for name in where)
+        with self._lock:
+            rows = self._conn.execute(sql, list(where.values())).fetchall()
+
+        positions = [DIMENSIONS.index(name) for name in by]
+        groups = defaultdict(lambda: [0, Counter(), Counter()])
+        for row in rows:
+            group = groups[tuple(row[i] for i in positions)]
+            group[0] += row[5]
+            group[1].update(_load_hist(row[6]))
+            group[2].update(_load_hist(row[7]))
+
+        labels = [f'p{round(q * 100):02d}' for q in quantiles]
+        records = []
+        for key, (count, price_hist, ppsqm_hist) in sorted(groups.items()):
+            record = dict(zip(by, key))
+            record['count'] = count
+            record.update({f'price_{label}': _round(v) for label, v in zip(labels, hist_quantiles(price_hist, quantiles))})
+            record.update({f'price_per_sqm_{label}': _round(v) for label, v in zip(labels, hist_quantiles(ppsqm_hist, quantiles))})
+            records.append(record)
+        df = pd.DataFrame(records, columns=list(by) + ['count'] + [f'price_{l}' for l in labels] + [f'price_per_sqm_{l}' for l in labels])
+        if 'cell_lat' in by and 'cell_lon' in by:
+            df['south'] = df['cell_lat'] * self.cell_deg
+            df['west'] = df['cell_lon'] * self.cell_deg
+            df['lat'] = df['south'] + self.cell_deg / 2
+            df['lon'] = df['west'] + self.cell_deg / 2
+        return df
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _load_hist(text):
+    return Counter({int(b): n for b, n in json.loads(text).items()})
+
+def _dump_hist(hist):
+    return json.dumps({str(b): n for b, n in sorted(hist.items()) if n > 0}, separators=(',', ':'))
+
+def _round(value):
+    return round(value) if value is not None else None
+
+def update_aggregates(path, dataset_dir):
+    """Open the aggregate table at `path`, apply new dataset files and print the result."""
+    aggregates = GridAggregates(path)
+    try:
+        files, rows = aggregates.update(dataset_dir)
+    finally:
+        aggregates.close()
+    print(f"📐 Grid aggregates: {files} new dataset files ({rows} rows) applied - {path}")
+    return files, rows
+
+# ========== MAIN EXECUTION ==========
+if __name__ == '__main__':
+    # Usage: python aggregates.py update|rebuild <dataset_dir> <aggregates.sqlite>
+    command, dataset_dir, path = sys.argv[1:4]
+    aggregates = GridAggregates(path)
+    files, rows = aggregates.rebuild(dataset_dir) if command == 'rebuild' else aggregates.update(dataset_dir)
+    print(f"📐 {command}: {files} dataset files, {rows} rows")
+    print(aggregates.read(by=['city', 'bedrooms']).to_string(index=False))
+    aggregates.close()
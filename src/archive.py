@@ -0,0 +1,267 @@
+"""
+Raw HTML archive
+Every fetched page is zstd-compressed into append-only segment files,
+deduplicated by content hash, with a SQLite index of url -> blob, so pages
+can be re-extracted offline when the markup or the wanted fields change
+"""
+import hashlib
+import mmap
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+from delta import ACTIVE
+from schema import apply_schema, MERGE_SUFFIXES
+from parse_stage import ParseStage, parse_detail_or_failure, parse_search, PARSE_WORKERS
+
+try:
+    import zstandard
+except ImportError:  # Only needed when the archive is enabled
+    zstandard = None
+
+# ========== CONFIGURATION ==========
+COMPRESSION_LEVEL = 3
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024  # Start a new segment file after this size
+
+SEARCH_URL_RE = re.compile(r'/rent/[^/]+/(?P<city>[^/]+)/(?P<prop_type>[^/?]+)/')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256      TEXT PRIMARY KEY,
+    segment     INTEGER NOT NULL,
+    offset      INTEGER NOT NULL,
+    length      INTEGER NOT NULL,
+    size        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url         TEXT NOT NULL,
+    page_type   TEXT NOT NULL,
+    sha256      TEXT NOT NULL,
+    fetched_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_url ON pages (url, fetched_at);
+"""
+
+class HtmlArchive:
+    """
+    Content-addressed store of page sources.
+
+    Blobs are independent zstd frames appended to `segments/NNNNN.zst`; a
+    blob is written once however many times its HTML is fetched. Each writer
+    appends to segments it created, so scrapers running side by side can
+    share one archive. `pages`
+    keeps every fetch (url, page type, hash, time), so the latest version of
+    a URL and its history are both available.
+    """
+
+    def __init__(self, path):
+        if zstandard is None:
+            raise ImportError("The HTML archive needs the zstandard package: pip install zstandard")
+        self.path = Path(path)
+        self.segments_dir = self.path / 'segments'
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path / 'index.sqlite'), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._segment = None
+        self._segment_file = None
+        self.stored = 0
+        self.deduplicated = 0
+
+    def _segment_path(self, segment):
+        return self.segments_dir / f'{segment:05d}.zst'
+
+    def _open_segment(self, size):
+        """Current segment, or a new one; segments are never shared between writers."""
+        if self._segment_file is None or self._segment_file.tell() + size > SEGMENT_MAX_BYTES:
+            if self._segment_file is not None:
+                self._segment_file.close()
+            segments = sorted(self.segments_dir.glob('*.zst'))
+            segment = int(segments[-1].stem) + 1 if segments else 0
+            while True:
+                try:
+                    self._segment_file = open(self._segment_path(segment), 'xb')
+                    break
+                except FileExistsError:  # Another process just took this number
+                    segment += 1
+            self._segment = segment
+        return self._segment_file
+
+    def put(self, url, page_type, html):
+        """Archive one fetched page; returns its content hash."""
+        raw = html.encode('utf-8')
+        sha = hashlib.sha256(raw).hexdigest()
+        with self._lock, self._conn:
+            known = self._conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha,)).fetchone()
+            if known:
+                self.deduplicated += 1
+            else:
+                blob = self._compressor.compress(raw)
+                f = self._open_segment(len(blob))
+                offset = f.tell()
+                f.write(blob)
+                f.flush()
+                self._conn.execute(
+                    "INSERT INTO blobs (sha256, segment, offset, length, size) VALUES (?, ?, ?, ?, ?)",
+                    (sha, self._segment, offset, len(blob), len(raw))
+                )
+                self.stored += 1
+            self._conn.execute(
+                "INSERT INTO pages (url, page_type, sha256, fetched_at) VALUES (?, ?, ?, ?)",
+                (url, page_type, sha, datetime.now().isoformat(timespec='seconds'))
+            )
+        return sha
+
+    def _read_blob(self, segment, offset, length):
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            return self._decompressor.decompress(f.read(length)).decode('utf-8')
+
+    def get(self, url):
+        """Most recently archived HTML for `url`, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT b.segment, b.offset, b.length FROM pages p JOIN blobs b ON b.sha256 = p.sha256
+                   WHERE p.url = ? ORDER BY p.fetched_at DESC, p.rowid DESC LIMIT 1""",
+                (url,)
+            ).fetchone()
+        return self._read_blob(*row) if row else None
+
+    def latest(self, page_type=None):
+        """(url, fetched_at, segment, offset, length) of each URL's latest fetch, in segment order."""
+        where = "WHERE p.page_type = ?" if page_type else ""
+        with self._lock:
+            return self._conn.execute(
+                f"""SELECT p.url, p.fetched_at, b.segment, b.offset, b.length
+                    FROM pages p JOIN blobs b ON b.sha256 = p.sha256
+                    JOIN (SELECT url, MAX(rowid) AS last FROM pages GROUP BY url) l ON l.last = p.rowid
+                    {where} ORDER BY b.segment, b.offset""",
+                (page_type,) if page_type else ()
+            ).fetchall()
+
+    def replay(self, page_type=None):
+        """
+        Yield (url, fetched_at, html) for the latest version of every archived
+        URL. Blobs are read in file order from memory-mapped segments, so a
+        full replay is one sequential pass over each segment.
+        """
+        with self._lock:
+            if self._segment_file is not None:
+                self._segment_file.flush()
+        current, view, handle = None, None, None
+        try:
+            for url, fetched_at, segment, offset, length in self.latest(page_type):
+                if segment != current:
+                    if view is not None:
+                        view.close()
+                        handle.close()
+                    handle = open(self._segment_path(segment), 'rb')
+                    view = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                    current = segment
+                html = self._decompressor.decompress(view[offset:offset + length]).decode('utf-8')
+                yield url, fetched_at, html
+        finally:
+            if view is not None:
+                view.close()
+                handle.close()
+
+    def stats(self):
+        """Pages, unique blobs, raw and compressed bytes."""
+        with self._lock:
+            pages = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            blobs, raw, compressed = self._conn.execute("SELECT COUNT(*), SUM(size), SUM(length) FROM blobs").fetchone()
+        return {'pages': pages, 'blobs': blobs, 'raw_bytes': raw or 0, 'compressed_bytes': compressed or 0}
+
+    def close(self):
+        with self._lock:
+            if self._segment_file is not None:
+                self._segment_file.close()
+                self._segment_file = None
+            self._conn.close()
+
+_archives = {}
+_registry_lock = threading.Lock()
+
+def open_archive(path):
+    """Shared HtmlArchive for `path`, so every fetcher in a process writes through one instance."""
+    key = str(Path(path).resolve())
+    with _registry_lock:
+        if key not in _archives:
+            _archives[key] = HtmlArchive(path)
+        return _archives[key]
+
+# ========== RE-EXTRACTION ==========
+def search_page_params(url):
+    """(city, prop_type) from a search results URL, or None."""
+    match = SEARCH_URL_RE.search(url)
+    return (match.group('city'), match.group('prop_type')) if match else None
+
+def re_extract(archive, output_path=None, workers=PARSE_WORKERS):
+    """
+    Rebuild the details dataset from archived pages without touching the network.
+
+    Search pages are re-parsed into link rows and detail pages into detail
+    records, then merged on url the same way scrape_details saves batches
+    (snippet columns that clash get MERGE_SUFFIXES) and cast to
+    schema.DTYPES. Parsing is spread over `workers` processes. Returns the
+    path of the written CSV.
+    """
+    parser = ParseStage(workers)
+    try:
+        links = {}
+        search_pages = (
+            (html, *search_page_params(url)) for url, _, html in archive.replay('search')
+            if search_page_params(url) is not None
+        )
+        for records, _, _ in parser.map(parse_search, search_pages):
+            for record in records:
+                links.setdefault(record['url'], record)
+
+        fetched = {url: fetched_at for url, fetched_at, *_ in archive.latest('detail')}
+        detail_pages = ((html, url) for url, _, html in archive.replay('detail'))
+        details = []
+        for record in parser.map(parse_detail_or_failure, detail_pages):
+            record['fetched_at'] = fetched[record['url']]
+            details.append(record)
+    finally:
+        parser.close()
+
+    details_df = pd.DataFrame(details)
+    if links:
+        details_df = pd.merge(details_df, pd.DataFrame(list(links.values())), on='url', how='left', suffixes=MERGE_SUFFIXES)
+    details_df['listing_status'] = ACTIVE
+    details_df = apply_schema(details_df)
+
+    output_path = Path(output_path or archive.path)
+    output_file = output_path / f"property_details_reextract_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    details_df.to_csv(output_file, index=False, encoding='utf-8-sig')
+
+    successful = int((details_df['scrape_status'] == 'success').sum()) if not details_df.empty else 0
+    print(f"♻️  Re-extracted {len(details_df)} detail pages ({successful} parsed) and {len(links)} search links")
+    print(f"💾 Saved: {output_file}")
+    return output_file
+
+if __name__ == '__main__':
+    # Usage: python archive.py re-extract <archive dir> [output dir] [parse workers]
+    #        python archive.py stats <archive dir>
+    if len(sys.argv) < 3 or sys.argv[1] not in ('re-extract', 'stats'):
+        print("Usage: python archive.py re-extract <archive dir> [output dir] [parse workers]")
+        print("       python archive.py stats <archive dir>")
+        sys.exit(2)
+    archive = HtmlArchive(sys.argv[2])
+    try:
+        if sys.argv[1] == 'stats':
+            s = archive.stats()
+            ratio = s['raw_bytes'] / s['compressed_bytes'] if s['compressed_bytes'] else 0
+            print(f"📦 {s['pages']} pages | {s['blobs']} unique blobs | {s['raw_bytes'] / 1e6:.1f} MB raw -> {s['compressed_bytes'] / 1e6:.1f} MB ({ratio:.1f}x)")
+        else:
+            re_extract(archive, sys.argv[3] if len(sys.argv) > 3 else None, int(sys.argv[4]) if len(sys.argv) > 4 else PARSE_WORKERS)
+    finally:
+        archive.close()
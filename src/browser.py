@@ -0,0 +1,180 @@
+"""
+Shared Chrome WebDriver helpers
+Driver factory and a pool of long-lived drivers leased to worker threads
+"""
+import queue
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from webdriver_manager.chrome import ChromeDriverManager
+from metrics import METRICS
+
+# ========== CONFIGURATION ==========
+HEADLESS = True
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
+MAX_PAGES_PER_DRIVER = 50  # Recycle a driver after this many leases
+BLOCK_RESOURCES = True
+CLEAR_CACHE_ON_RESET = False  # Also drop the HTTP cache between leases (keeping it is most of the pooling gain)
+
+# Requests the extractors never need; blocked in the browser via CDP
+BLOCKED_URL_PATTERNS = [
+    # Images
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.svg', '*.ico', '*.avif',
+    # Fonts
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    # Video
+    '*.mp4', '*.webm', '*.m3u8', '*youtube.com/embed*',
+    # Third-party trackers and ads
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*googlesyndication.com*', '*facebook.net*', '*facebook.com/tr*',
+    '*hotjar.com*', '*clarity.ms*', '*tiktok.com*', '*criteo.*', '*adnxs.com*',
+]
+
+# ========== HELPER FUNCTIONS ==========
+@lru_cache(maxsize=1)
+def chromedriver_path():
+    """Resolve the ChromeDriver binary once per process."""
+    return ChromeDriverManager().install()
+
+@METRICS.timed('driver_create_seconds')
+def create_driver(headless=HEADLESS, block_resources=BLOCK_RESOURCES):
+    """Create a Chrome WebDriver with anti-detection settings."""
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument('--headless=new')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+
+    # Suppress QUIC errors
+    chrome_options.add_argument('--disable-quic')
+    chrome_options.add_argument('--log-level=3')
+    chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+
+    # User agent
+    chrome_options.add_argument(f'user-agent={USER_AGENT}')
+    chrome_options.add_argument('--window-size=1920,1080')
+
+    # Return from driver.get() at DOMContentLoaded; readiness is awaited per page
+    chrome_options.page_load_strategy = 'eager'
+
+    driver = webdriver.Chrome(
+        service=Service(chromedriver_path()),
+        options=chrome_options
+    )
+
+    # Execute CDP commands
+    driver.execute_cdp_cmd('Network.setUserAgentOverride', {
+        "userAgent": USER_AGENT,
+        "platform": "Windows"
+    })
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+    if block_resources:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+
+    return driver
+
+def reset_driver_state(driver, clear_cache=CLEAR_CACHE_ON_RESET):
+    """Clear cookies and web storage so the next lease starts clean; cached CSS/JS stay unless `clear_cache`."""
+    driver.delete_all_cookies()
+    try:
+        driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+    except Exception:
+        # about:blank and some error pages have no storage
+        pass
+    if clear_cache:
+        driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+
+# ========== DRIVER POOL ==========
+class DriverPool:
+    """
+    Fixed-size pool of Chrome drivers shared by worker threads.
+
+    Drivers are created lazily, handed out with `lease()`, and recycled
+    after `max_pages` leases or whenever the leasing code raises.
+    """
+
+    def __init__(self, size, factory=create_driver, max_pages=MAX_PAGES_PER_DRIVER):
+        self.size = size
+        self.factory = factory
+        self.max_pages = max_pages
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._all = set()
+        self._uses = {}
+        self._closed = False
+        self.launches = 0
+        self.recycles = 0
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            driver = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                driver = self.factory()
+            except Exception:
+                self._slots.release()
+                raise
+            with self._lock:
+                self._all.add(driver)
+                self._uses[driver] = 0
+                self.launches += 1
+        return driver
+
+    def _retire(self, driver, recycled=True):
+        with self._lock:
+            self._all.discard(driver)
+            self._uses.pop(driver, None)
+            if recycled:
+                self.recycles += 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _release(self, driver, broken):
+        try:
+            with self._lock:
+                self._uses[driver] = self._uses.get(driver, 0) + 1
+                worn_out = self._uses[driver] >= self.max_pages
+            if broken or worn_out or self._closed:
+                self._retire(driver)
+                return
+            try:
+                reset_driver_state(driver)
+            except Exception:
+                self._retire(driver)
+                return
+            self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def lease(self):
+        """Lease a driver for one page; a raised exception retires it."""
+        driver = self._acquire()
+        broken = False
+        try:
+            yield driver
+        except BaseException:
+            broken = True
+            raise
+        finally:
+            self._release(driver, broken)
+
+    def close(self):
+        """Quit every driver owned by the pool."""
+        self._closed = True
+        with self._lock:
+            drivers = list(self._all)
+        for driver in drivers:
+            self._retire(driver, recycled=False)
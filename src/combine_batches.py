@@ -1,39 +1,139 @@
 """
 Combine all batch files into a single file
+Incremental merge: a SQLite index keeps one row per URL and remembers which
+batch files are already merged, so each run only streams the new batches
 """
-import pandas as pd
 import glob
+import json
+import os
+import sqlite3
 from datetime import datetime
+import pandas as pd
+from schema import apply_schema
 
 OUTPUT_PATH = 'C:/Users/anhpd/OneDrive/Desktop/projects/phillipine-rental-price/data'
 
-# Find all batch files
-batch_files = sorted(glob.glob(f"{OUTPUT_PATH}/property_details_batch_*.csv"))
+MERGE_INDEX = f"{OUTPUT_PATH}/combine_index.sqlite"
+CHUNK_ROWS = 5000  # Rows per read and write chunk
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    url         TEXT PRIMARY KEY,
+    succeeded   INTEGER NOT NULL,
+    source      TEXT NOT NULL,
+    record      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS columns (
+    position    INTEGER PRIMARY KEY AUTOINCREMENT,
+    name        TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS merged_files (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    row_count   INTEGER NOT NULL,
+    merged_at   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+"""
+
+# A row replaces the stored one unless it would swap a success for a failure
+UPSERT = """
+INSERT INTO rows (url, succeeded, source, record) VALUES (?, ?, ?, ?)
+ON CONFLICT(url) DO UPDATE SET succeeded = excluded.succeeded, source = excluded.source, record = excluded.record
+WHERE excluded.succeeded >= rows.succeeded
+"""
+
+def open_index(path=MERGE_INDEX):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+def pending_files(conn, batch_files):
+    """Batch files that are new or changed since they were last merged."""
+    merged = {path: (size, mtime) for path, size, mtime in conn.execute("SELECT path, size, mtime FROM merged_files")}
+    pending = []
+    for path in batch_files:
+        stat = os.stat(path)
+        if merged.get(path) != (stat.st_size, stat.st_mtime):
+            pending.append(path)
+    return pending
+
+def merge_file(conn, path):
+    """Stream one batch CSV into the index in chunks; returns the number of rows read."""
+    row_count = 0
+    for chunk in pd.read_csv(path, chunksize=CHUNK_ROWS):
+        chunk = chunk.dropna(subset=['url'])
+        conn.executemany("INSERT OR IGNORE INTO columns (name) VALUES (?)", [(c,) for c in chunk.columns])
+        records = chunk.astype(object).where(chunk.notna(), None).to_dict('records')
+        conn.executemany(UPSERT, [
+            (r['url'], int(r.get('scrape_status') == 'success'), path, json.dumps(r, ensure_ascii=False))
+            for r in records
+        ])
+        row_count += len(chunk)
+    stat = os.stat(path)
+    conn.execute(
+        "INSERT OR REPLACE INTO merged_files (path, size, mtime, row_count, merged_at) VALUES (?, ?, ?, ?, ?)",
+        (path, stat.st_size, stat.st_mtime, row_count, datetime.now().isoformat(timespec='seconds'))
+    )
+    return row_count
+
+def write_combined(conn, output_file):
+    """
+    Write every indexed row to `output_file`, CHUNK_ROWS at a time. Each chunk
+    is cast to schema.DTYPES first, so a column is formatted the same way in
+    every chunk (no 25000 in one and 25000.0 in the next).
+    """
+    columns = [name for (name,) in conn.execute("SELECT name FROM columns ORDER BY position")]
+    cursor = conn.execute("SELECT record FROM rows ORDER BY rowid")
+    first = True
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        chunk = apply_schema(pd.DataFrame([json.loads(record) for (record,) in rows], columns=columns))
+        chunk.to_csv(output_file, mode='w' if first else 'a', header=first, index=False, encoding='utf-8-sig' if first else 'utf-8')
+        first = False
 
-print(f"Found {len(batch_files)} batch files")
+def main():
+    # Find all batch files
+    batch_files = sorted(glob.glob(f"{OUTPUT_PATH}/property_details_batch_*.csv"))
+    print(f"Found {len(batch_files)} batch files")
 
-# Combine all batches
-dfs = []
-for file in batch_files:
-    print(f"Loading: {file}")
-    df = pd.read_csv(file)
-    dfs.append(df)
+    conn = open_index()
+    try:
+        new_files = pending_files(conn, batch_files)
+        last_output = conn.execute("SELECT value FROM meta WHERE key = 'last_output'").fetchone()
+        if not new_files and last_output and os.path.exists(last_output[0]):
+            print(f"\n✅ Nothing new to merge - up to date: {last_output[0]}")
+            return
 
-combined_df = pd.concat(dfs, ignore_index=True)
+        # Merge only batches not seen before (each file commits on its own)
+        for path in new_files:
+            with conn:
+                rows = merge_file(conn, path)
+            print(f"Merged: {path} ({rows} rows)")
 
-# Remove duplicates
-combined_df = combined_df.drop_duplicates(subset=['url']).reset_index(drop=True)
+        # Save combined file
+        output_file = f"{OUTPUT_PATH}/property_details_combined_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        write_combined(conn, output_file)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_output', ?)", (output_file,))
 
-# Save combined file
-output_file = f"{OUTPUT_PATH}/property_details_combined_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-combined_df.to_csv(output_file, index=False, encoding='utf-8-sig')
+        total, successful = conn.execute("SELECT COUNT(*), COALESCE(SUM(succeeded), 0) FROM rows").fetchone()
+        print(f"\n✅ Combined {total} properties ({len(new_files)} new batch files merged)")
+        print(f"💾 Saved: {output_file}")
 
-print(f"\n✅ Combined {len(combined_df)} properties")
-print(f"💾 Saved: {output_file}")
+        # Summary
+        print(f"\n📊 FINAL SUMMARY:")
+        print(f"   Successful: {successful}")
+        print(f"   Failed: {total - successful}")
+    finally:
+        conn.close()
 
-# Summary
-successful = len(combined_df[combined_df['scrape_status'] == 'success'])
-failed = len(combined_df[combined_df['scrape_status'] != 'success'])
-print(f"\n📊 FINAL SUMMARY:")
-print(f"   Successful: {successful}")
-print(f"   Failed: {failed}")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
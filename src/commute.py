@@ -0,0 +1,190 @@
+"""
+Commute-time model to the destination
+Builds a small graph of train stations, ride and walking edges, runs one
+reverse Dijkstra from the destination (cached on disk), then estimates each
+listing's commute with a vectorized walk + ride lookup
+"""
+import hashlib
+import heapq
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from config import DESTINATION, COMMUTE_CACHE_DIR
+from geo import haversine_m, STATION_LAT, STATION_LON, STATION_NAME
+
+# ========== CONFIGURATION ==========
+WALK_M_PER_MIN = 80         # ~4.8 km/h
+WALK_DETOUR = 1.3           # Street distance / straight-line distance
+WALK_LIMIT_M = 1500         # Beyond this the rest of a leg is by jeepney/bus
+ROAD_M_PER_MIN = 250        # ~15 km/h door-to-door jeepney/bus in traffic
+ROAD_WAIT_MIN = 5           # Average wait for a jeepney/bus
+TRAIN_M_PER_MIN = 650       # ~39 km/h between stations
+DWELL_MIN = 0.75            # Stop time per intermediate station
+BOARDING_MIN = 6            # Station entry, security and average headway wait
+TRANSFER_RADIUS_M = 600     # Stations of different lines closer than this get a walking transfer
+LOOKUP_CHUNK = 4096         # Listings per block in the station lookup
+
+MODEL_VERSION = 1           # Bump when the graph construction changes (invalidates the cache)
+
+# ========== LEG TIMES ==========
+def access_minutes(distance_m):
+    """
+    Minutes to cover a straight-line distance on the street: walking up to
+    WALK_LIMIT_M, then a jeepney/bus for the remainder.
+    """
+    distance_m = np.asarray(distance_m, dtype=float) * WALK_DETOUR
+    walked = np.minimum(distance_m, WALK_LIMIT_M)
+    ridden = distance_m - walked
+    return walked / WALK_M_PER_MIN + np.where(ridden > 0, ROAD_WAIT_MIN + ridden / ROAD_M_PER_MIN, 0.0)
+
+def ride_minutes(distance_m):
+    return distance_m / TRAIN_M_PER_MIN + DWELL_MIN
+
+# ========== GRAPH ==========
+def line_stops(stations):
+    """
+    One row per stop in route order for each line: stops without
+    coordinates dropped and consecutive members of the same station
+    (stop position + platform) collapsed.
+    """
+    stations = stations.dropna(subset=[STATION_LAT, STATION_LON])
+    stops = []
+    for line_name, line in stations.groupby('line_name', sort=False):
+        previous = None
+        for name, lat, lon in line[[STATION_NAME, STATION_LAT, STATION_LON]].itertuples(index=False, name=None):
+            if name is not None and name == previous:
+                continue
+            previous = name
+            stops.append((line_name, name, float(lat), float(lon)))
+    return pd.DataFrame(stops, columns=['line_name', 'name', 'lat', 'lon'])
+
+def build_edges(stops, destination):
+    """
+    Directed edges (from, to, minutes) between stop positions plus the
+    destination node (index len(stops)): rides between consecutive stops,
+    walking transfers between lines and the walk (or jeepney) from every
+    stop to the destination.
+    """
+    lats, lons = stops['lat'].to_numpy(), stops['lon'].to_numpy()
+    lines = stops['line_name'].to_numpy()
+    target = len(stops)
+    edges = []
+    for i in range(len(stops) - 1):
+        if lines[i] == lines[i + 1]:
+            minutes = float(ride_minutes(haversine_m(lats[i], lons[i], lats[i + 1], lons[i + 1])))
+            edges += [(i, i + 1, minutes), (i + 1, i, minutes)]
+
+    gaps = haversine_m(lats[:, None], lons[:, None], lats[None, :], lons[None, :])
+    for i, j in zip(*np.nonzero((gaps <= TRANSFER_RADIUS_M) & (lines[:, None] != lines[None, :]))):
+        edges.append((int(i), int(j), float(access_minutes(gaps[i, j])) + BOARDING_MIN))
+
+    egress = access_minutes(haversine_m(lats, lons, destination[0], destination[1]))
+    edges += [(i, target, float(egress[i])) for i in range(len(stops))]
+    return edges
+
+def reverse_dijkstra(node_count, edges, target):
+    """Shortest time from every node to `target`: Dijkstra from `target` over the reversed edges."""
+    incoming = [[] for _ in range(node_count)]
+    for source, dest, minutes in edges:
+        incoming[dest].append((source, minutes))
+    best = [np.inf] * node_count
+    best[target] = 0.0
+    heap = [(0.0, target)]
+    while heap:
+        minutes, node = heapq.heappop(heap)
+        if minutes > best[node]:
+            continue
+        for source, weight in incoming[node]:
+            candidate = minutes + weight
+            if candidate < best[source]:
+                best[source] = candidate
+                heapq.heappush(heap, (candidate, source))
+    return np.array(best)
+
+# ========== MODEL ==========
+class CommuteModel:
+    """
+    Minutes from each station platform to the destination, plus the lookup
+    that turns listing coordinates into a commute estimate.
+
+    A listing's commute is the quicker of going straight to the destination
+    (walk, then jeepney/bus past WALK_LIMIT_M) and, over every station,
+    getting to the station, boarding, and the precomputed best onward time.
+    """
+
+    def __init__(self, stops, to_destination, destination):
+        self.stops = stops.reset_index(drop=True)
+        self.to_destination = np.asarray(to_destination, dtype=float)
+        self.destination = tuple(destination)
+        self._lats = self.stops['lat'].to_numpy(dtype=float)
+        self._lons = self.stops['lon'].to_numpy(dtype=float)
+        self._board = BOARDING_MIN + self.to_destination
+
+    @staticmethod
+    def _cache_key(stops, destination):
+        parameters = [MODEL_VERSION, WALK_M_PER_MIN, WALK_DETOUR, WALK_LIMIT_M, ROAD_M_PER_MIN, ROAD_WAIT_MIN,
+                      TRAIN_M_PER_MIN, DWELL_MIN, BOARDING_MIN, TRANSFER_RADIUS_M]
+        payload = json.dumps([parameters, list(destination), stops.to_numpy().tolist()], default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def build(cls, stations, destination=DESTINATION, cache_dir=COMMUTE_CACHE_DIR):
+        """
+        Model for a station frame from stations.fetch_stations. The Dijkstra
+        result is cached per (stations, destination, parameters) in
+        `cache_dir` (None: no cache).
+        """
+        stops = line_stops(stations)
+        if stops.empty:
+            raise ValueError("No stations with coordinates")
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = Path(cache_dir) / f"{cls._cache_key(stops, destination)}.json"
+            try:
+                return cls(stops, json.loads(cache_path.read_text(encoding='utf-8')), destination)
+            except (OSError, ValueError):
+                pass
+
+        best = reverse_dijkstra(len(stops) + 1, build_edges(stops, destination), target=len(stops))
+        to_destination = best[:-1]
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(to_destination.tolist()), encoding='utf-8')
+            tmp_path.replace(cache_path)
+        return cls(stops, to_destination, destination)
+
+    def estimate(self, lats, lons):
+        """
+        (minutes, boarding station names) per point; the station is None
+        when going directly is quicker and minutes are NaN without coordinates.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        minutes = np.full(len(lats), np.nan)
+        boarding = np.full(len(lats), None, dtype=object)
+        valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+        names = self.stops['name'].to_numpy(dtype=object)
+        for start in range(0, len(valid), LOOKUP_CHUNK):
+            rows = valid[start:start + LOOKUP_CHUNK]
+            block_lats, block_lons = lats[rows], lons[rows]
+            via = access_minutes(haversine_m(block_lats[:, None], block_lons[:, None], self._lats[None, :], self._lons[None, :])) + self._board
+            best = np.argmin(via, axis=1)
+            via_best = via[np.arange(len(rows)), best]
+            direct = access_minutes(haversine_m(block_lats, block_lons, self.destination[0], self.destination[1]))
+            use_train = via_best < direct
+            minutes[rows] = np.where(use_train, via_best, direct)
+            boarding[rows] = np.where(use_train, names[best], None)
+        return minutes, boarding
+
+    def enrich(self, df, lat='latitude', lon='longitude'):
+        """Return `df` with commute_estimate (minutes) and commute_station columns."""
+        lats = pd.to_numeric(df[lat], errors='coerce').to_numpy(dtype=float)
+        lons = pd.to_numeric(df[lon], errors='coerce').to_numpy(dtype=float)
+        minutes, boarding = self.estimate(lats, lons)
+        return df.assign(commute_estimate=minutes.round(0), commute_station=boarding)
+
+    def station_table(self):
+        """Stops with their best time to the destination after boarding."""
+        return self.stops.assign(minutes_to_destination=self._board.round(1)).sort_values('minutes_to_destination')
@@ -7,4 +7,25 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 
 # Input data paths
-INPUT_FILE = PROJECT_ROOT / "data" / "property_details_combined_20251209_202026.csv"
\ No newline at end of file
+INPUT_FILE = PROJECT_ROOT / "data" / "property_details_combined_20251209_202026.csv"
+
+# Partitioned Parquet dataset written by scrape_details.py (see dataset.read_details)
+DATASET_DIR = PROJECT_ROOT / "data" / "property_details"
+
+# Grid price statistics maintained from the dataset (see aggregates.GridAggregates)
+AGGREGATES_FILE = PROJECT_ROOT / "data" / "grid_aggregates.sqlite"
+
+# Commute destination (latitude, longitude) for distance enrichment and maps
+DESTINATION_NAME = "Podium West Building"
+DESTINATION = (14.584678675972874, 121.05920053403466)
+
+# Train lines as OpenStreetMap route relation IDs (see stations.fetch_stations)
+TRAIN_LINES = {
+    'MRT Line 3': 109159
+}
+
+# On-disk cache of OpenStreetMap API responses
+OSM_CACHE_DIR = PROJECT_ROOT / "data" / "osm_cache"
+
+# Cached station-to-destination times (see commute.CommuteModel)
+COMMUTE_CACHE_DIR = PROJECT_ROOT / "data" / "commute_cache"
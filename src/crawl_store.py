@@ -0,0 +1,143 @@
+"""
+Durable crawl state
+SQLite (WAL) store keyed by URL so an interrupted crawl resumes where it stopped
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime
+import pandas as pd
+
+# URL lifecycle: pending -> in_progress -> done | failed (set once the record is saved)
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl (
+    url         TEXT PRIMARY KEY,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    record      TEXT,
+    added_at    TEXT NOT NULL,
+    started_at  TEXT,
+    updated_at  TEXT
+);
+CREATE INDEX IF NOT EXISTS crawl_status ON crawl (status);
+"""
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+class CrawlStore:
+    """
+    One row per URL with status, attempt count, last error, timestamps and
+    the scraped record (JSON). Every write commits immediately, so a crash
+    loses at most the pages that were in flight.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add_urls(self, urls):
+        """Register URLs as pending; URLs already in the store keep their state."""
+        now = _now()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO crawl (url, added_at) VALUES (?, ?)",
+                [(url, now) for url in urls]
+            )
+            return self._conn.total_changes - before
+
+    def todo_urls(self, urls, max_attempts=None):
+        """
+        Filter `urls` (keeping their order) down to the ones still to scrape:
+        pending, failed, or left in_progress by a crash. URLs that have already
+        used `max_attempts` attempts are skipped.
+        """
+        rows = self._read("SELECT url, status, attempts FROM crawl WHERE status != ?", (DONE,))
+        todo = {
+            url for url, status, attempts in rows
+            if max_attempts is None or attempts < max_attempts
+        }
+        return [url for url in urls if url in todo]
+
+    def mark_started(self, url):
+        now = _now()
+        self._write(
+            "UPDATE crawl SET status = ?, started_at = ?, updated_at = ? WHERE url = ?",
+            (IN_PROGRESS, now, now, url)
+        )
+
+    def mark_saved(self, records):
+        """
+        Finish the URLs of detail records that were just written to the output:
+        done when scrape_status is 'success', failed (with the status as the
+        error) otherwise. Call it only after the write, so URLs scraped but lost
+        in a crash stay in_progress and are scraped again on resume.
+        """
+        now = _now()
+        rows = []
+        for record in records:
+            success = record.get('scrape_status') == 'success'
+            rows.append((
+                DONE if success else FAILED,
+                None if success else str(record.get('scrape_status'))[:500],
+                json.dumps(record, ensure_ascii=False, default=str),
+                now,
+                record['url'],
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE crawl SET status = ?, attempts = attempts + 1, last_error = ?, record = ?, updated_at = ? WHERE url = ?",
+                rows
+            )
+
+    def mark_carried(self, urls):
+        """Mark URLs done whose rows were carried forward from the previous crawl (written, never scraped)."""
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE crawl SET status = ?, last_error = NULL, updated_at = ? WHERE url = ?",
+                [(DONE, now, url) for url in urls]
+            )
+
+    def counts(self):
+        """Number of URLs per status."""
+        return dict(self._read("SELECT status, COUNT(*) FROM crawl GROUP BY status"))
+
+    def records(self, urls=None):
+        """DataFrame of stored records (done and failed), optionally limited to `urls`."""
+        rows = self._read("SELECT url, record FROM crawl WHERE record IS NOT NULL")
+        if urls is not None:
+            wanted = set(urls)
+            rows = [row for row in rows if row[0] in wanted]
+        return pd.DataFrame([json.loads(record) for _, record in rows])
+
+    def failures(self):
+        """DataFrame of failed URLs with attempts, last error and timestamps."""
+        rows = self._read(
+            "SELECT url, attempts, last_error, started_at, updated_at FROM crawl WHERE status = ? ORDER BY updated_at",
+            (FAILED,)
+        )
+        return pd.DataFrame(rows, columns=['url', 'attempts', 'last_error', 'started_at', 'updated_at'])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
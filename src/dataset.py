@@ -0,0 +1,153 @@
+"""
+Partitioned Parquet dataset of property details
+Batches are appended as typed Parquet files under
+crawl_date=YYYY-MM-DD/city=<city>/, so readers load only the columns and
+partitions they need and filter on price inside the scan
+"""
+import uuid
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from schema import COLUMN_RENAMES
+from delta import DELISTED
+
+# ========== SCHEMA ==========
+PARTITION_COLUMNS = ['crawl_date', 'city']
+DICTIONARY_COLUMNS = ['property_type', 'furnishing', 'listing_status']
+
+SCHEMA = pa.schema([
+    ('url', pa.string()),
+    ('property_id', pa.string()),
+    ('title', pa.string()),
+    ('price_php', pa.int64()),
+    ('bedrooms', pa.int32()),
+    ('bathrooms', pa.int32()),
+    ('floor_area_sqm', pa.float64()),
+    ('location', pa.string()),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+    ('description', pa.string()),
+    ('furnishing', pa.dictionary(pa.int32(), pa.string())),
+    ('amenities', pa.string()),
+    ('scrape_status', pa.string()),
+    ('title_preview', pa.string()),
+    ('location_preview', pa.string()),
+    ('price_preview', pa.int64()),
+    ('bedrooms_preview', pa.int32()),
+    ('bathrooms_preview', pa.int32()),
+    ('property_type', pa.dictionary(pa.int32(), pa.string())),
+    ('listing_status', pa.dictionary(pa.int32(), pa.string())),
+    ('delisted_runs', pa.int32()),
+    ('cluster_id', pa.int64()),
+    ('canonical_url', pa.string()),
+    ('is_canonical', pa.bool_()),
+    ('crawl_date', pa.string()),
+    ('city', pa.string()),
+])
+
+
+PARTITIONING = ds.partitioning(pa.schema([(name, SCHEMA.field(name).type) for name in PARTITION_COLUMNS]), flavor='hive')
+
+def to_table(df, crawl_date):
+    """Conform a details DataFrame to SCHEMA (renaming merge suffixes, coercing types)."""
+    df = df.rename(columns=COLUMN_RENAMES)
+    df = df.assign(crawl_date=crawl_date)
+    columns = []
+    for field in SCHEMA:
+        values = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index, dtype='object')
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            array = pa.array(pd.to_numeric(values, errors='coerce'), type=field.type, from_pandas=True)
+        elif pa.types.is_dictionary(field.type):
+            array = pa.array(values.astype('string'), type=pa.string(), from_pandas=True).dictionary_encode()
+        elif pa.types.is_boolean(field.type):
+            array = pa.array(values.astype('boolean'), type=field.type, from_pandas=True)
+        else:
+            array = pa.array(values.astype('string'), type=field.type, from_pandas=True)
+        columns.append(array)
+    return pa.Table.from_arrays(columns, schema=SCHEMA)
+
+# ========== WRITER ==========
+def append_to_dataset(df, path, crawl_date=None, tag='batch'):
+    """
+    Append a batch of detail rows to the dataset at `path`.
+
+    Rows go to crawl_date=<crawl_date>/city=<city>/<tag>-<uuid>-<n>.parquet;
+    existing files are never touched. Returns the list of files written.
+    """
+    crawl_date = crawl_date or datetime.now().strftime('%Y-%m-%d')
+    table = to_table(df, crawl_date)
+    written = []
+    ds.write_dataset(
+        table,
+        str(path),
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=f'{tag}-{uuid.uuid4().hex[:8]}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+        file_visitor=lambda f: written.append(f.path),
+    )
+    return written
+
+# ========== READER ==========
+def _split_filters(filters):
+    """
+    (partition filters, value filters) of a DNF filter list. Only crawl_date/city
+    terms of a plain AND list can go into the scan; OR groups are kept whole.
+    """
+    if not filters:
+        return [], []
+    if any(isinstance(term, list) for term in filters):
+        return [], filters
+    partition = [term for term in filters if term[0] in PARTITION_COLUMNS]
+    return partition, [term for term in filters if term[0] not in PARTITION_COLUMNS]
+
+def _filter_columns(filters):
+    terms = [term for group in filters for term in (group if isinstance(group, list) else [group])]
+    return [term[0] for term in terms]
+
+def read_details(path, columns=None, filters=None, latest=True, active_only=True):
+    """
+    Load the details dataset as a DataFrame.
+
+    `columns` limits the columns read and `filters` (pyarrow/DNF style, e.g.
+    [('price_php', '<', 35000), ('city', '=', 'pasig')]) selects rows. With
+    `latest`, each url keeps only its row from the most recent crawl date
+    (a successful scrape wins within a date): crawl_date/city filters are
+    pushed into the scan, so partitions that cannot match are skipped, and
+    value filters apply to those latest rows, never to an older one. Value
+    filters still narrow the scan: a first pass reads only the urls with any
+    matching row, and the second reads just those urls' rows. With
+    `active_only`, urls whose latest row is delisted are dropped.
+    """
+    dataset = ds.dataset(str(path), format='parquet', partitioning=PARTITIONING)
+    scan_filters, value_filters = _split_filters(filters) if latest else (filters, [])
+    read_columns = None
+    if columns is not None:
+        extra = (['url', 'crawl_date', 'scrape_status'] if latest else []) + _filter_columns(value_filters)
+        extra += ['listing_status'] if active_only else []
+        read_columns = list(dict.fromkeys(columns + extra))
+    expression = pq.filters_to_expression(scan_filters) if scan_filters else None
+    if value_filters:
+        # A url whose latest row matches has at least one matching row, so these are the only candidates
+        candidates = dataset.to_table(columns=['url'], filter=pq.filters_to_expression(filters)).column('url').unique()
+        in_candidates = ds.field('url').isin(candidates)
+        expression = in_candidates if expression is None else expression & in_candidates
+    table = dataset.to_table(columns=read_columns, filter=expression)
+
+    if latest and table.num_rows:
+        keys = table.select(['url', 'crawl_date', 'scrape_status']).to_pandas()
+        succeeded = keys['scrape_status'] == 'success'
+        order = keys.assign(_succeeded=succeeded).sort_values(['crawl_date', '_succeeded'], kind='stable').index
+        table = table.take(keys.loc[order].drop_duplicates(subset=['url'], keep='last').index.to_numpy())
+    if value_filters:
+        table = ds.dataset(table).to_table(filter=pq.filters_to_expression(value_filters))
+    df = table.to_pandas()
+
+    if active_only and 'listing_status' in df.columns:
+        df = df[df['listing_status'].astype(object) != DELISTED].reset_index(drop=True)
+    for column in DICTIONARY_COLUMNS + ['city']:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df[columns] if columns is not None else df
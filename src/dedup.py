@@ -0,0 +1,315 @@
+"""
+Near-duplicate listing detection
+Clusters listings that the same unit was posted as by different agents, using
+MinHash/LSH over normalized text shingles blocked by location and price band,
+plus an exact-match pass over search snippets usable before the detail crawl
+"""
+import re
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from geo import haversine_m
+
+# ========== CONFIGURATION ==========
+SHINGLE_CHARS = 5           # Character k-grams of the normalized text
+MAX_TEXT_CHARS = 1500       # Text beyond this is ignored (descriptions end in boilerplate)
+DETAIL_SAMPLE = 4           # Detail text keeps 1 in N shingles, chosen by hash (same choice in every listing)
+NUM_PERM = 64               # MinHash signature length
+BANDS = 16                  # LSH bands of NUM_PERM // BANDS rows (~50% similarity to become a candidate)
+MAX_BUCKET_SPAN = 64        # Pairs are only formed within this many rows of a bucket (bounds huge buckets)
+DOC_CHUNK = 4096            # Documents hashed per block
+
+# Blocking: candidates must share a cell and price band (the nearer neighbouring cell/band counts)
+CELL_DEG = 0.006            # ~660 m: listings within MAX_DISTANCE_M always share a block
+PRICE_BAND = 0.20           # Log-width of a price band: prices within PRICE_TOLERANCE always share one
+
+# Verification of candidate pairs (and of each cluster member against its canonical listing)
+DETAIL_THRESHOLD = 0.6      # Estimated Jaccard similarity of title + description
+MAX_DISTANCE_M = 300
+PRICE_TOLERANCE = 0.10
+AREA_TOLERANCE = 0.10
+
+# Fuzzy matching uses detail fields only: search snippets (templated titles,
+# no description or coordinates) cannot tell units in the same building apart
+DETAIL_TEXT = ['title', 'description']
+
+# Snippet pass: links repeat each other only if every one of these fields is
+# present and equal (text normalized), so no similarity threshold is involved
+SNIPPET_KEY = ['city', 'property_type', 'title', 'location', 'price_preview', 'bedrooms_preview', 'bathrooms_preview']
+SNIPPET_NUMERIC = ['price_preview']
+SNIPPET_MAX_CLUSTER = 2     # More links sharing one snippet are a development's separate units, not reposts
+
+_NON_WORD_RE = re.compile(r'[^0-9a-z]+')
+
+# ========== MINHASH ==========
+def normalize_text(text):
+    """Lowercase alphanumerics separated by single spaces."""
+    return _NON_WORD_RE.sub(' ', str(text).lower()).strip()
+
+def _permutations(seed=0):
+    rng = np.random.default_rng(seed)
+    # Multiply-shift hashing: 64-bit odd multipliers, the product wraps and the top 32 bits are kept
+    a = rng.integers(0, np.iinfo(np.uint64).max, NUM_PERM, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, NUM_PERM, dtype=np.uint64, endpoint=True)
+    return a, b
+
+_PERM_A, _PERM_B = _permutations()
+
+def _shingle_hashes(docs):
+    """
+    (hashes, starts, counts) for a list of strings: every SHINGLE_CHARS-byte
+    window of each document packed into an integer, grouped by document.
+    Documents shorter than a shingle are one zero-padded window; empty ones
+    have none.
+    """
+    encoded = [doc.encode('utf-8')[:MAX_TEXT_CHARS] for doc in docs]
+    lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+    gap = SHINGLE_CHARS - 1  # Zero bytes between documents, so short ones pad with zeros
+    buffer = np.frombuffer((b'\0' * gap).join(encoded) + b'\0' * gap, dtype=np.uint8).astype(np.uint64)
+    windows = len(buffer) - gap
+    packed = np.zeros(windows, dtype=np.uint64)
+    for j in range(SHINGLE_CHARS):
+        packed = (packed << np.uint64(8)) | buffer[j:j + windows]
+
+    doc_starts = np.concatenate([[0], np.cumsum(lengths + gap)[:-1]])
+    counts = np.where(lengths >= SHINGLE_CHARS, lengths - gap, np.minimum(lengths, 1))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    positions = np.arange(counts.sum()) + np.repeat(doc_starts - starts, counts)
+    return packed[positions], starts, counts
+
+def signatures(docs, sample=1):
+    """
+    MinHash signatures (len(docs), NUM_PERM) uint32; all-max rows for empty
+    documents. With `sample` > 1 only about 1 in `sample` shingles is used,
+    chosen by hash so every document keeps the same ones; the Jaccard
+    estimate stays unbiased for long texts.
+    """
+    result = np.full((len(docs), NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    for first in range(0, len(docs), DOC_CHUNK):
+        hashes, starts, counts = _shingle_hashes(docs[first:first + DOC_CHUNK])
+        if sample > 1:
+            kept = (hashes * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32) < np.uint64((1 << 32) // sample)
+            doc_of = np.repeat(np.arange(len(counts)), counts)[kept]
+            hashes = hashes[kept]
+            counts = np.bincount(doc_of, minlength=len(counts))
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        if not filled.any():
+            continue
+        rows = first + np.flatnonzero(filled)
+        for p in range(NUM_PERM):
+            values = (_PERM_A[p] * hashes + _PERM_B[p]) >> np.uint64(32)
+            result[rows, p] = np.minimum.reduceat(values, starts[filled])
+    return result
+
+def _band_hashes(sigs):
+    """(n, BANDS) uint64 hash of each band's rows."""
+    bands = sigs.reshape(len(sigs), BANDS, NUM_PERM // BANDS).astype(np.uint64)
+    h = np.zeros(bands.shape[:2], dtype=np.uint64)
+    for r in range(bands.shape[2]):
+        h = (h ^ bands[:, :, r]) * np.uint64(0x100000001B3)
+    return h
+
+# ========== BLOCKING ==========
+def _grid_pair(scaled):
+    """
+    Own cell and the neighbouring cell on the nearer side for each value
+    (NaN: cell -1, twice). Two values less than half a cell apart always
+    share a cell this way.
+    """
+    valid = np.isfinite(scaled)
+    safe = np.where(valid, scaled, 0.0)
+    own = np.floor(safe).astype(np.int64)
+    other = own + np.where(safe - own >= 0.5, 1, -1)
+    return np.where(valid, own, -1), np.where(valid, other, -1)
+
+def _block_ids(exact, fuzzy):
+    """
+    (n, 2 ** len(fuzzy)) uint64 block ids: exact components must match, fuzzy
+    (grid-scaled) ones may differ by a neighbouring cell.
+    """
+    n = len(exact[0]) if exact else len(fuzzy[0])
+    base = np.zeros(n, dtype=np.uint64)
+    for codes in exact:
+        base = (base ^ codes.astype(np.uint64)) * np.uint64(0x9E3779B97F4A7C15)
+    blocks = [base]
+    for scaled in fuzzy:
+        own, other = _grid_pair(scaled)
+        blocks = [(block ^ cell.astype(np.uint64)) * np.uint64(0xBF58476D1CE4E5B9) for block in blocks for cell in (own, other)]
+    return np.column_stack(blocks)
+
+def _numeric(df, name):
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=float)
+
+def _text_column(df, name):
+    """`name`, or its `_x` (details) side when a merge suffixed it."""
+    for column in (name, f'{name}_x'):
+        if column in df.columns:
+            return df[column].fillna('').astype(str)
+    return pd.Series('', index=df.index)
+
+# ========== CLUSTERING ==========
+def _candidate_pairs(keys, rows, n):
+    """Row pairs (i < j) that share any LSH key (`rows[k]` is the row of `keys[k]`, rows < n)."""
+    order = np.lexsort((rows, keys))
+    keys, rows = keys[order], rows[order]
+    left, right = [], []
+    for span in range(1, MAX_BUCKET_SPAN + 1):
+        same = np.flatnonzero(keys[:-span] == keys[span:])
+        if not len(same):
+            break
+        left.append(rows[same])
+        right.append(rows[same + span])
+    if not left:
+        return np.empty((0, 2), dtype=np.int64)
+    left, right = np.concatenate(left), np.concatenate(right)
+    codes = np.sort(np.minimum(left, right) * n + np.maximum(left, right))
+    codes = codes[np.concatenate([[True], codes[1:] != codes[:-1]])]
+    pairs = np.column_stack([codes // n, codes % n])
+    return pairs[pairs[:, 0] != pairs[:, 1]]
+
+def _components(n, pairs):
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    return np.array([find(i) for i in range(n)])
+
+def _close(a, b, tolerance):
+    """Relative difference within `tolerance`, or either value unknown."""
+    unknown = np.isnan(a) | np.isnan(b)
+    return unknown | (np.abs(a - b) <= tolerance * np.maximum(np.abs(a), np.abs(b)))
+
+def cluster_listings(df):
+    """
+    Return scraped detail rows `df` with cluster_id, canonical_url and
+    is_canonical columns.
+
+    Listings compare title + description and are blocked by coordinates and
+    price. The canonical listing of a cluster is the most complete row (a
+    successful scrape first), then the earliest one; a member that does not
+    itself match the canonical listing (reached only through a chain of
+    similar posts) is split off on its own.
+    """
+    df = df.reset_index(drop=True)
+    n = len(df)
+    if n == 0:
+        return df.assign(cluster_id=pd.Series(dtype='int64'), canonical_url=pd.Series(dtype='object'), is_canonical=pd.Series(dtype='bool'))
+
+    docs = [normalize_text(' '.join(parts)[:MAX_TEXT_CHARS]) for parts in zip(*(_text_column(df, name) for name in DETAIL_TEXT))]
+    sigs = signatures(docs, sample=DETAIL_SAMPLE)
+    has_text = (sigs != np.iinfo(np.uint32).max).any(axis=1)
+
+    price = _numeric(df, 'price_php')
+    bedrooms = _numeric(df, 'bedrooms')
+    area = _numeric(df, 'floor_area_sqm')
+    lat, lon = _numeric(df, 'latitude'), _numeric(df, 'longitude')
+    price_scaled = np.log(np.where(price > 0, price, np.nan)) / np.log1p(PRICE_BAND)
+    blocks = _block_ids([], [lat / CELL_DEG, lon / CELL_DEG, price_scaled])
+
+    def matches(a, b):
+        """Similar text, same bedrooms, close price, area and location."""
+        keep = (sigs[a] == sigs[b]).mean(axis=1) >= DETAIL_THRESHOLD
+        keep &= np.isnan(bedrooms[a]) | np.isnan(bedrooms[b]) | (bedrooms[a] == bedrooms[b])
+        keep &= _close(price[a], price[b], PRICE_TOLERANCE)
+        keep &= _close(area[a], area[b], AREA_TOLERANCE)
+        distance = haversine_m(lat[a], lon[a], lat[b], lon[b])
+        return keep & (np.isnan(distance) | (distance <= MAX_DISTANCE_M))
+
+    # LSH key per (row, block, band): rows sharing any key are candidates
+    bands = _band_hashes(sigs)
+    band_ids = np.arange(BANDS, dtype=np.uint64) * np.uint64(0xD6E8FEB86659FD93)
+    keys = (blocks[:, :, None] ^ (bands ^ band_ids)[:, None, :]) * np.uint64(0x94D049BB133111EB)
+    rows = np.repeat(np.arange(n), keys.shape[1] * keys.shape[2])
+    with_text = np.repeat(has_text, keys.shape[1] * keys.shape[2])
+    pairs = _candidate_pairs(keys.ravel()[with_text], rows[with_text], n)
+
+    roots = _components(n, pairs[matches(pairs[:, 0], pairs[:, 1])])
+
+    # Canonical row per cluster: successful scrape, most filled fields, earliest
+    completeness = df.notna().sum(axis=1).to_numpy()
+    if 'scrape_status' in df.columns:
+        completeness = completeness + (df['scrape_status'] == 'success').to_numpy() * len(df.columns)
+    ranking = pd.DataFrame({'root': roots, 'score': -completeness, 'row': np.arange(n)}).sort_values(['root', 'score', 'row'])
+    canonical = ranking.drop_duplicates('root').set_index('root')['row']
+    canonical_rows = canonical.reindex(roots).to_numpy().copy()
+    # Chains (a~b, b~c) must not pull in rows unlike the canonical listing
+    members = np.flatnonzero(canonical_rows != np.arange(n))
+    unmatched = members[~matches(members, canonical_rows[members])]
+    canonical_rows[unmatched] = unmatched
+    cluster_ids = pd.Series(canonical_rows).rank(method='dense').astype(np.int64).to_numpy() - 1
+    return df.assign(
+        cluster_id=cluster_ids,
+        canonical_url=df['url'].to_numpy()[canonical_rows],
+        is_canonical=canonical_rows == np.arange(n),
+    )
+
+def snippet_keys(df):
+    """
+    Exact-match key of each search-snippet row (SNIPPET_KEY fields, text
+    normalized); NA when any field is missing, and such rows never match.
+    """
+    fields = {}
+    for name in SNIPPET_KEY:
+        if name not in df.columns:
+            return pd.Series(pd.NA, index=df.index, dtype='string')
+        if name in SNIPPET_NUMERIC:
+            fields[name] = pd.to_numeric(df[name], errors='coerce').round().astype('Int64').astype('string')
+        else:
+            text = df[name].astype('string').str.lower().str.replace(_NON_WORD_RE, ' ', regex=True).str.strip()
+            fields[name] = text.replace('', pd.NA)
+    fields = pd.DataFrame(fields, index=df.index)
+    keys = fields[SNIPPET_KEY[0]]
+    for name in SNIPPET_KEY[1:]:
+        keys = keys + '|' + fields[name]
+    return keys  # NA wherever a field is
+
+def cluster_snippets(df):
+    """
+    Return search-snippet rows `df` (a links file) with cluster_id,
+    canonical_url and is_canonical columns. Only rows with equal
+    snippet_keys() cluster together, at most SNIPPET_MAX_CLUSTER of them,
+    and the first is canonical. Cheap enough to run before the detail crawl,
+    but it can only catch reposts that copy the snippet exactly.
+    """
+    df = df.reset_index(drop=True)
+    keys = snippet_keys(df)
+    keys = keys.where(keys.map(keys.value_counts()) <= SNIPPET_MAX_CLUSTER)
+    rows = pd.Series(np.arange(len(df)), index=df.index)
+    canonical_rows = rows.groupby(keys, dropna=True).transform('first').reindex(df.index)
+    canonical_rows = canonical_rows.fillna(rows).astype(np.int64).to_numpy()
+    cluster_ids = pd.Series(canonical_rows).rank(method='dense').astype(np.int64).to_numpy() - 1
+    return df.assign(
+        cluster_id=cluster_ids,
+        canonical_url=df['url'].to_numpy()[canonical_rows],
+        is_canonical=canonical_rows == np.arange(len(df)),
+    )
+
+def summarize(clustered):
+    """(listings, clusters, rows that are duplicates of another listing)."""
+    duplicates = int((~clustered['is_canonical']).sum())
+    return len(clustered), int(clustered['cluster_id'].nunique()), duplicates
+
+# ========== MAIN EXECUTION ==========
+if __name__ == '__main__':
+    # Usage: python dedup.py <details.csv | dataset_dir>
+    path = Path(sys.argv[1])
+    from schema import load_details
+    df = load_details(path)
+    clustered = cluster_listings(df)
+    listings, clusters, duplicates = summarize(clustered)
+    output_file = path.with_name(f"{path.stem}_clusters.csv")
+    clustered[['url', 'cluster_id', 'canonical_url', 'is_canonical']].to_csv(output_file, index=False, encoding='utf-8-sig')
+    print(f"🧬 {listings} listings in {clusters} clusters ({duplicates} near-duplicates)")
+    print(f"💾 Saved: {output_file}")
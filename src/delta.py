@@ -0,0 +1,95 @@
+"""
+Incremental re-crawl planning
+Diffs a new links file against the previous combined dataset so only new or
+changed listings are scraped again
+"""
+import pandas as pd
+
+# Search-snippet fields that signal a listing changed since the last crawl
+SNIPPET_FIELDS = ['price_preview', 'bedrooms_preview', 'title']
+
+# Runs a vanished listing is carried forward as delisted before it is dropped from the output
+DELISTED_KEEP_RUNS = 1
+
+ACTIVE = 'active'
+DELISTED = 'delisted'
+
+def _snippet_column(df, field):
+    """
+    Snippet value of `field`. In detail rows a snippet column that clashes
+    with a detail field is `<field>_preview` (`<field>_y` in older files).
+    """
+    for column in (f'{field}_preview', f'{field}_y', field):
+        if column in df.columns:
+            return df[column]
+    return pd.Series(pd.NA, index=df.index)
+
+def _normalize(values):
+    """Comparable string form: 95000, 95000.0 and '95000' are equal, NaN equals NaN."""
+    numbers = pd.to_numeric(values, errors='coerce')
+    text = values.astype('string').str.strip().fillna('')
+    as_number = numbers.map(lambda v: '' if pd.isna(v) else str(int(v)) if float(v).is_integer() else repr(float(v)))
+    return text.where(numbers.isna(), as_number)
+
+def _match_previous(links_df, previous_df):
+    """Index of the previous row for each new link, matched by url then property_id."""
+    by_url = pd.Series(previous_df.index, index=previous_df['url']).groupby(level=0).first()
+    matched = links_df['url'].map(by_url)
+    if 'property_id' in links_df.columns and 'property_id' in previous_df.columns:
+        known_ids = previous_df.dropna(subset=['property_id'])
+        by_id = pd.Series(known_ids.index, index=known_ids['property_id']).groupby(level=0).first()
+        matched = matched.fillna(links_df['property_id'].map(by_id))
+    return matched
+
+def _delisted_runs(df):
+    """Runs each row has already been carried as delisted (rows from before the counter count once)."""
+    runs = pd.Series(0, index=df.index, dtype='Int64')
+    if 'listing_status' in df.columns:
+        runs = runs.mask(df['listing_status'] == DELISTED, 1)
+    if 'delisted_runs' in df.columns:
+        runs = pd.to_numeric(df['delisted_runs'], errors='coerce').astype('Int64').fillna(runs)
+    return runs
+
+def plan_delta(links_df, previous_df, keep_runs=DELISTED_KEEP_RUNS):
+    """
+    Split a new links file into what needs scraping and what can be carried forward.
+
+    Returns a dict of DataFrames:
+      new        links not seen in the previous dataset (full scrape)
+      changed    links whose snippet fields changed, or whose previous scrape
+                 failed or was delisted (re-fetch)
+      unchanged  previous detail rows for links that did not change (carried forward)
+      delisted   previous rows whose listing no longer appears (listing_status='delisted'),
+                 carried for `keep_runs` runs after it vanished and then dropped
+    """
+    previous_df = previous_df.drop_duplicates(subset=['url']).reset_index(drop=True)
+    matched = _match_previous(links_df, previous_df)
+
+    seen = matched.notna()
+    new_links = links_df[~seen]
+    old_links = links_df[seen]
+    old_rows = previous_df.loc[matched[seen].astype(int)].set_index(old_links.index)
+
+    differs = pd.Series(False, index=old_links.index)
+    for field in SNIPPET_FIELDS:
+        differs |= _normalize(_snippet_column(old_links, field)) != _normalize(_snippet_column(old_rows, field))
+    if 'scrape_status' in old_rows.columns:
+        differs |= old_rows['scrape_status'] != 'success'
+    if 'listing_status' in old_rows.columns:
+        differs |= old_rows['listing_status'] == DELISTED
+
+    unchanged = old_rows[~differs].copy()
+    unchanged['listing_status'] = ACTIVE
+
+    gone = ~previous_df.index.isin(matched.dropna().astype(int))
+    delisted = previous_df[gone].copy()
+    delisted['delisted_runs'] = _delisted_runs(delisted) + 1
+    delisted['listing_status'] = DELISTED
+    delisted = delisted[delisted['delisted_runs'] <= keep_runs]
+
+    return {
+        'new': new_links,
+        'changed': old_links[differs],
+        'unchanged': unchanged.reset_index(drop=True),
+        'delisted': delisted.reset_index(drop=True),
+    }
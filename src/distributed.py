@@ -0,0 +1,270 @@
+"""
+Distributed details crawl
+A coordinator publishes the links file to a lease-based work queue and writes
+results as they come back; workers on any number of processes or hosts lease
+URLs, scrape them with scrape_details and push the records back
+"""
+import json
+import threading
+import time
+import argparse
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import scrape_details
+from extraction import failed_record
+from crawl_store import CrawlStore
+from retry import ScrapeFailure, NO_RETRY
+from schema import read_csv
+from aggregates import update_aggregates
+from work_queue import (LeaseQueue, open_queue, serve_queue, worker_name, is_loopback, check_bind,
+                        LEASE_SECONDS, QUEUE_PORT, QUEUE_HOST, QUEUE_TOKEN, QUEUED, LEASED, DONE, FAILED)
+from metrics import METRICS, save_metrics, start_metrics_server
+
+# ========== CONFIGURATION ==========
+QUEUE_FILE = f"{scrape_details.OUTPUT_PATH}/work_queue.sqlite"
+BATCH_SIZE = scrape_details.BATCH_SIZE  # Results per written batch
+WORKER_THREADS = scrape_details.MAX_WORKERS  # Fetch threads per worker process
+PREFETCH = 2              # Extra leased URLs held per worker so threads never wait on the coordinator
+HEARTBEATS_PER_LEASE = 4  # Lease renewals per visibility timeout (a few can be missed before expiry)
+POLL_SECONDS = 2.0        # Idle wait when the queue has nothing to lease
+PROGRESS_SECONDS = 30     # Coordinator status line interval
+
+# ========== COORDINATOR ==========
+def publish_links(queue, links_file):
+    """Load, shuffle, delta-filter and dedup the links file the way scrape_details.main() does, then publish it."""
+    links_df = read_csv(links_file).sample(frac=1, random_state=42).reset_index(drop=True)
+    if scrape_details.PREVIOUS_COMBINED_FILE:
+        # The crawl store only remembers carried rows, so a restarted coordinator does not write them twice
+        store = CrawlStore(scrape_details.STATE_FILE)
+        links_df = scrape_details.apply_delta(links_df, store)
+        store.close()
+    if scrape_details.SKIP_SNIPPET_DUPLICATES:
+        links_df = scrape_details.skip_snippet_duplicates(links_df)
+    # Round-trip through JSON so NA and numpy values travel as plain JSON
+    items = json.loads(links_df.to_json(orient='records', force_ascii=False))
+    return len(links_df), queue.publish(items)
+
+def export_results(queue, batch_num, final=False):
+    """Write finished records in batches of BATCH_SIZE (the remainder too when `final`); returns the next batch number."""
+    while True:
+        rows = queue.unexported(BATCH_SIZE)
+        if not rows or (len(rows) < BATCH_SIZE and not final):
+            return batch_num
+        records = [record for _, _, record in rows]
+        batch_df = pd.DataFrame([payload for _, payload, _ in rows])
+        _, batch_file = scrape_details.save_batch(records, batch_df, batch_num)
+        queue.mark_exported([url for url, _, _ in rows])
+        print(f"   💾 Batch {batch_num + 1}: {len(rows)} results -> {batch_file}")
+        batch_num += 1
+
+def coordinate(links_file, queue_file=QUEUE_FILE, port=QUEUE_PORT, shared=False, host=QUEUE_HOST, token=QUEUE_TOKEN):
+    """
+    Publish the links, serve the queue on `host`:`port` (a non-loopback host
+    needs `token`) and write results until every URL is done or failed.
+    """
+    print("=" * 70)
+    print("PHILIPPINE RENTAL PROPERTY DETAILS SCRAPER - COORDINATOR")
+    print("=" * 70)
+
+    if port:
+        check_bind(host, token)
+    queue = LeaseQueue(queue_file, shared=shared)
+    total, new = publish_links(queue, links_file)
+    print(f"\n📂 Links: {links_file}")
+    print(f"📬 Queue: {queue_file} | Published {new} new of {total} URLs")
+    server = serve_queue(queue, port, host, token) if port else None
+    if server:
+        print(f"🌐 Workers: python distributed.py worker http://{host if is_loopback(host) else '<this-host>'}:{port}"
+              f"{' (with the same QUEUE_TOKEN)' if token else ''}")
+    else:
+        print(f"🗂️  Workers: python distributed.py worker {queue_file}{' --shared' if shared else ''}")
+
+    start_time = time.time()
+    batch_num = 0
+    last_progress = 0
+    while True:
+        batch_num = export_results(queue, batch_num)
+        if queue.finished():
+            break
+        if time.time() - last_progress >= PROGRESS_SECONDS:
+            counts = queue.counts()
+            print(f"   ⏱️  Queued {counts.get(QUEUED, 0)} | Leased {counts.get(LEASED, 0)} (expired {counts['expired']}) | "
+                  f"Done {counts.get(DONE, 0)} | Failed {counts.get(FAILED, 0)} | {(time.time() - start_time) / 60:.1f}m")
+            last_progress = time.time()
+        time.sleep(POLL_SECONDS)
+    export_results(queue, batch_num, final=True)
+
+    counts = queue.counts()
+    if server:
+        time.sleep(POLL_SECONDS * 2)  # Let idle workers see the drained queue before it goes away
+        server.shutdown()
+    queue.close()
+    print(f"\n✅ Queue drained in {(time.time() - start_time) / 60:.1f} minutes: Done {counts.get(DONE, 0)} | Failed {counts.get(FAILED, 0)}")
+    if scrape_details.OUTPUT_FORMAT == 'parquet' and scrape_details.AGGREGATES_FILE:
+        update_aggregates(scrape_details.AGGREGATES_FILE, scrape_details.DATASET_DIR)
+
+# ========== WORKER ==========
+class LeaseKeeper:
+    """Heartbeats the URLs a worker holds from a background thread and notices leases it lost."""
+
+    def __init__(self, queue, worker, lease_seconds=LEASE_SECONDS):
+        self.queue = queue
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.interval = lease_seconds / HEARTBEATS_PER_LEASE
+        self._lock = threading.Lock()
+        self._held = set()
+        self._stop = threading.Event()
+        self.lost = 0
+        self._thread = threading.Thread(target=self._run, name='lease-heartbeat', daemon=True)
+        self._thread.start()
+
+    def add(self, url):
+        with self._lock:
+            self._held.add(url)
+
+    def discard(self, url):
+        with self._lock:
+            self._held.discard(url)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                held = list(self._held)
+            try:
+                kept = set(self.queue.heartbeat(self.worker, held, self.lease_seconds))
+            except Exception as e:
+                print(f"   ⚠️  Heartbeat failed: {str(e)[:80]}")
+                continue
+            # A lost lease was re-issued; the scrape still finishes and complete() decides who wins
+            self.lost += len(set(held) - kept)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def scrape_item(url):
+    """One attempt at `url` -> (record, failure kind or None). Retries are the queue's job."""
+    scrape_details.BREAKER.wait()
+    try:
+        record = scrape_details.scrape_property_details(url)
+    except ScrapeFailure as e:
+        scrape_details.BREAKER.record(False)
+        METRICS.inc('detail_attempts_total', outcome='failure')
+        METRICS.inc('detail_failures_total', reason=e.kind)
+        return failed_record(url, f'failed ({e.kind}): {str(e)[:100]}'), e.kind
+    scrape_details.BREAKER.record(True)
+    METRICS.inc('detail_attempts_total', outcome='success')
+    METRICS.inc('detail_pages_total', outcome='success')
+    return record, None
+
+def run_worker(queue, worker=None, threads=WORKER_THREADS, scrape=scrape_item, lease_seconds=LEASE_SECONDS):
+    """
+    Lease URLs and scrape them on `threads` threads until the queue has
+    nothing queued or leased. `scrape(url)` returns (record, failure kind or
+    None); failures go back to the queue, which re-issues them to any worker
+    until they run out of attempts. Gives up once the queue has been
+    unreachable for `lease_seconds` (any lease held has expired by then).
+    Returns (done, failed attempts, leases lost).
+    """
+    worker = worker or worker_name()
+    keeper = LeaseKeeper(queue, worker, lease_seconds)
+    done = failed = 0
+    in_flight = {}
+    unreachable_since = None
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            while True:
+                wanted = threads + PREFETCH - len(in_flight)
+                leased = []
+                if wanted > 0:
+                    try:
+                        leased = queue.lease(worker, wanted, lease_seconds)
+                    except Exception as e:
+                        print(f"   ⚠️  Lease failed: {str(e)[:80]}")
+                for item in leased:
+                    keeper.add(item['url'])
+                    in_flight[executor.submit(scrape, item['url'])] = item
+
+                if not in_flight:
+                    # Nothing to lease: finished, or other workers still hold leases that may expire
+                    try:
+                        if queue.finished():
+                            break
+                        unreachable_since = None
+                    except Exception as e:
+                        print(f"   ⚠️  Queue unreachable: {str(e)[:80]}")
+                        unreachable_since = unreachable_since or time.time()
+                        if time.time() - unreachable_since > lease_seconds:
+                            print("   ❌ Giving up on the queue")
+                            break
+                    time.sleep(POLL_SECONDS)
+                    continue
+
+                finished, _ = wait(in_flight, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item = in_flight.pop(future)
+                    url = item['url']
+                    try:
+                        record, kind = future.result()
+                    except Exception as e:
+                        record, kind = failed_record(url, f'exception: {str(e)[:100]}'), 'exception'
+                    try:
+                        if kind is None:
+                            queue.complete(worker, url, record)
+                            done += 1
+                        else:
+                            status = queue.fail(worker, url, kind, record, retry=kind not in NO_RETRY)
+                            print(f"   🔁 {url} failed ({kind}, attempt {item['attempt']}) -> {status or 'lease lost'}")
+                            failed += 1
+                    except Exception as e:
+                        # The lease expires and the URL is re-issued
+                        print(f"   ⚠️  Could not report {url}: {str(e)[:80]}")
+                    keeper.discard(url)
+    finally:
+        keeper.stop()
+    return done, failed, keeper.lost
+
+def work(target, threads=WORKER_THREADS, shared=False, token=QUEUE_TOKEN):
+    """Worker process entry point: `target` is the coordinator URL or the queue file."""
+    worker = worker_name()
+    scrape_details.setup()
+    print("=" * 70)
+    print(f"PHILIPPINE RENTAL PROPERTY DETAILS SCRAPER - WORKER {worker}")
+    print("=" * 70)
+    print(f"\n📬 Queue: {target} | Threads: {threads} | Fetch engine: {scrape_details.FETCHER.name}\n")
+    queue = open_queue(target, shared=shared, token=token)
+    start_time = time.time()
+    done, failed, lost = run_worker(queue, worker, threads)
+    queue.close()
+    elapsed = time.time() - start_time
+    print(f"\n✅ Worker {worker} finished: {done} scraped, {failed} failed attempts, {lost} leases lost in {elapsed / 60:.1f} minutes")
+    print(f"🔁 Circuit breaker trips: {scrape_details.BREAKER.trips}")
+
+# ========== MAIN EXECUTION ==========
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    coordinator_args = commands.add_parser('coordinator', help='publish a links file and collect results')
+    coordinator_args.add_argument('links_file', nargs='?', default=scrape_details.LINKS_FILE)
+    coordinator_args.add_argument('--queue', default=QUEUE_FILE, help='queue SQLite file')
+    coordinator_args.add_argument('--port', type=int, default=QUEUE_PORT, help='HTTP port for remote workers (0: file queue only)')
+    coordinator_args.add_argument('--host', default=QUEUE_HOST, help='address to serve on (other than loopback needs a token)')
+    coordinator_args.add_argument('--token', default=QUEUE_TOKEN, help='shared secret workers must send (default: $QUEUE_TOKEN)')
+    coordinator_args.add_argument('--shared', action='store_true', help='queue file is opened by other hosts over a network share')
+    worker_args = commands.add_parser('worker', help='lease and scrape URLs')
+    worker_args.add_argument('target', nargs='?', default=f'http://localhost:{QUEUE_PORT}', help='coordinator URL or queue file')
+    worker_args.add_argument('--threads', type=int, default=WORKER_THREADS)
+    worker_args.add_argument('--shared', action='store_true', help='queue file is on a network share')
+    worker_args.add_argument('--token', default=QUEUE_TOKEN, help="the coordinator's shared secret (default: $QUEUE_TOKEN)")
+    args = parser.parse_args()
+
+    start_metrics_server()
+    try:
+        if args.command == 'coordinator':
+            coordinate(args.links_file, args.queue, args.port, args.shared, args.host, args.token)
+        else:
+            work(args.target, args.threads, args.shared, args.token)
+    finally:
+        scrape_details.shutdown()
+        save_metrics(scrape_details.OUTPUT_PATH)
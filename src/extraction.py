@@ -0,0 +1,476 @@
+"""
+Lamudi HTML extraction
+Builds one tree per page and pulls every field in a single walk, with a
+pluggable parser backend (lxml when installed, BeautifulSoup otherwise)
+"""
+import json
+import re
+import time
+from bs4 import BeautifulSoup, Tag
+from metrics import METRICS
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional; BeautifulSoup is always available
+    lxml = None
+
+# ========== PATTERNS ==========
+PRICE_RE = re.compile(r'₱\s*([\d,]+)')
+INT_RE = re.compile(r'(\d+)')
+AREA_RE = re.compile(r'([\d,\.]+)\s*(?:sqm|m²)', re.I)
+PROPERTY_HREF_RE = re.compile(r'/property/')
+PAGE_OF_RE = re.compile(r'Page\s+(\d+)\s+of\s+(\d+)', re.I)
+LISTING_COUNT_RE = re.compile(r'([\d,]+)\s+(?:results?|properties|listings|condos?|apartments?|houses?)\b', re.I)
+LAT_RES = [
+    re.compile(r'["\']?lat(?:itude)?["\']?\s*[:=]\s*([\d\.\-]+)', re.I),
+    re.compile(r'lat:\s*([\d\.\-]+)', re.I),
+    re.compile(r'"lat":\s*([\d\.\-]+)', re.I),
+]
+LNG_RES = [
+    re.compile(r'["\']?lon(?:g|gitude)?["\']?\s*[:=]\s*([\d\.\-]+)', re.I),
+    re.compile(r'lng:\s*([\d\.\-]+)', re.I),
+    re.compile(r'"lng":\s*([\d\.\-]+)', re.I),
+]
+
+BASE_URL = 'https://www.lamudi.com.ph'
+DESCRIPTION_MAX_CHARS = 500
+AMENITIES_MAX = 10
+AMENITIES_EXCLUDED = ['Garage', 'Alarm']
+
+# Elements whose text BeautifulSoup's get_text() leaves out
+NON_TEXT_TAGS = {'script', 'style', 'template'}
+
+class MissingTitleError(Exception):
+    """The detail page has no listing title, so it did not load properly."""
+
+# ========== PARSER BACKENDS ==========
+class LxmlBackend:
+    """lxml.html tree; C parser, the fast default."""
+    name = 'lxml'
+
+    def parse(self, html):
+        if not html or not html.strip():
+            # An empty response parses as an empty page; callers report the missing content as usual
+            return lxml.html.document_fromstring('<html></html>')
+        try:
+            return lxml.html.document_fromstring(html)
+        except ValueError:
+            # lxml refuses str input that carries an XML encoding declaration; parse the bytes instead
+            return lxml.html.document_fromstring(html.encode('utf-8'))
+
+    def walk(self, node):
+        """Yield (tag, element) for every element below `node` in document order."""
+        for el in node.iterdescendants():
+            tag = el.tag
+            if isinstance(tag, str):
+                yield tag, el
+
+    def get(self, el, name):
+        return el.get(name)
+
+    def classes(self, el):
+        value = el.get('class')
+        return value.split() if value else ()
+
+    def string(self, el):
+        return el.text
+
+    def text(self, el):
+        """Stripped text of all descendant strings, joined like get_text(strip=True)."""
+        parts = []
+        self._collect_text(el, parts)
+        return ''.join(parts)
+
+    def _collect_text(self, el, parts):
+        if el.text and el.tag not in NON_TEXT_TAGS:
+            stripped = el.text.strip()
+            if stripped:
+                parts.append(stripped)
+        for child in el:
+            if isinstance(child.tag, str):
+                self._collect_text(child, parts)
+            if child.tail:
+                stripped = child.tail.strip()
+                if stripped:
+                    parts.append(stripped)
+
+    def strings(self, node):
+        """Yield every text string in the document (outside scripts/styles)."""
+        for el in node.iter():
+            if isinstance(el.tag, str) and el.tag not in NON_TEXT_TAGS and el.text:
+                yield el.text
+            if el is not node and el.tail:
+                yield el.tail
+
+class SoupBackend:
+    """BeautifulSoup with the pure-Python html.parser; used when lxml is missing."""
+    name = 'bs4'
+
+    def parse(self, html):
+        return BeautifulSoup(html, 'html.parser')
+
+    def walk(self, node):
+        for el in node.descendants:
+            if isinstance(el, Tag):
+                yield el.name, el
+
+    def get(self, el, name):
+        return el.get(name)
+
+    def classes(self, el):
+        return el.get('class') or ()
+
+    def string(self, el):
+        return el.string
+
+    def text(self, el):
+        return el.get_text(strip=True)
+
+    def strings(self, node):
+        return node.find_all(string=True)
+
+BACKENDS = {
+    'lxml': LxmlBackend,
+    'bs4': SoupBackend,
+}
+DEFAULT_BACKEND = 'lxml' if lxml is not None else 'bs4'
+
+_backend_cache = {}
+
+def get_backend(name=None):
+    """Return the parser backend registered under `name` (default: fastest available)."""
+    name = name or DEFAULT_BACKEND
+    if name not in _backend_cache:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown parser backend: {name}")
+        _backend_cache[name] = BACKENDS[name]()
+    return _backend_cache[name]
+
+# ========== DETAIL PAGES ==========
+def _first_h1_text(backend, main_title):
+    for tag, el in backend.walk(main_title):
+        if tag == 'h1':
+            return backend.text(el)
+    return None
+
+def _collect_detail_nodes(backend, root):
+    """Single pass over the document collecting every node the detail fields need."""
+    nodes = {
+        'main_title': None, 'price': None, 'bedrooms': None, 'bathrooms': None,
+        'location': None, 'description': None, 'map': None,
+        'details_values': [], 'facilities': [], 'scripts': [], 'ld_json': []
+    }
+    for tag, el in backend.walk(root):
+        if tag == 'div':
+            classes = backend.classes(el)
+            if classes:
+                if 'main-title' in classes and nodes['main_title'] is None:
+                    nodes['main_title'] = el
+                if 'details-item-value' in classes:
+                    nodes['details_values'].append(el)
+                    data_test = backend.get(el, 'data-test')
+                    if data_test == 'bedrooms-value' and nodes['bedrooms'] is None:
+                        nodes['bedrooms'] = el
+                    elif data_test == 'full-bathrooms-value' and nodes['bathrooms'] is None:
+                        nodes['bathrooms'] = el
+                if 'facilities__item' in classes:
+                    nodes['facilities'].append(el)
+                if ('prices-and-fees__price' in classes and nodes['price'] is None
+                        and backend.get(el, 'data-test') == 'listing-price'):
+                    nodes['price'] = el
+                if 'view-map__text' in classes and nodes['location'] is None:
+                    nodes['location'] = el
+            el_id = backend.get(el, 'id')
+            if el_id == 'description-text' and 'content' in classes and nodes['description'] is None:
+                nodes['description'] = el
+            elif el_id == 'map' and nodes['map'] is None:
+                nodes['map'] = el
+        elif tag == 'script':
+            nodes['scripts'].append(el)
+            if backend.get(el, 'type') == 'application/ld+json':
+                nodes['ld_json'].append(el)
+    return nodes
+
+def _first_int(backend, el, pattern):
+    text = backend.text(el) if el is not None else None
+    if text:
+        match = pattern.search(text)
+        if match:
+            return int(match.group(1).replace(',', ''))
+    return None
+
+def _to_float(value):
+    try:
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+def _coords_from_ld_json(backend, scripts):
+    for script in scripts:
+        try:
+            data_json = json.loads(backend.string(script))
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(data_json, dict):
+            continue
+        items = data_json['@graph'] if '@graph' in data_json else [data_json]
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get('geo'), dict):
+                latitude = _to_float(item['geo'].get('latitude'))
+                longitude = _to_float(item['geo'].get('longitude'))
+                if latitude and longitude:
+                    return latitude, longitude
+    return None, None
+
+def _coords_from_map(backend, map_elem):
+    if map_elem is None:
+        return None, None
+    latitude = _to_float(backend.get(map_elem, 'data-lat') or backend.get(map_elem, 'data-latitude'))
+    longitude = _to_float(backend.get(map_elem, 'data-lng') or backend.get(map_elem, 'data-longitude'))
+    return latitude, longitude
+
+def _coords_from_scripts(backend, scripts):
+    latitude = None
+    longitude = None
+    for script in scripts:
+        source = backend.string(script)
+        if not source:
+            continue
+        for pattern in LAT_RES:
+            match = pattern.search(source)
+            if match:
+                latitude = float(match.group(1))
+                break
+        for pattern in LNG_RES:
+            match = pattern.search(source)
+            if match:
+                longitude = float(match.group(1))
+                break
+        if latitude and longitude:
+            break
+    return latitude, longitude
+
+def extract_coordinates(backend, nodes):
+    """Structured sources first (ld+json geo, map data attributes), then script regexes."""
+    for latitude, longitude in (
+        _coords_from_ld_json(backend, nodes['ld_json']),
+        _coords_from_map(backend, nodes['map']),
+    ):
+        if latitude and longitude:
+            return latitude, longitude
+    return _coords_from_scripts(backend, nodes['scripts'])
+
+def has_listing_title(html, backend=None):
+    """Check that a detail page contains the listing title (i.e. it loaded properly)."""
+    backend = get_backend(backend)
+    root = backend.parse(html)
+    for tag, el in backend.walk(root):
+        if tag == 'div' and 'main-title' in backend.classes(el):
+            return bool(_first_h1_text(backend, el))
+    return False
+
+def require_listing_title(html, backend=None):
+    """Raise MissingTitleError unless the detail page has its listing title."""
+    if not has_listing_title(html, backend):
+        raise MissingTitleError("No title found - page may not have loaded")
+
+def extract_property_details(html, url, backend=None):
+    """Extract the detail record from a listing page; raises MissingTitleError if not loaded."""
+    backend = get_backend(backend)
+    start = time.perf_counter()
+    root = backend.parse(html)
+    parsed = time.perf_counter()
+    METRICS.observe('html_parse_seconds', parsed - start, page_type='detail')
+    nodes = _collect_detail_nodes(backend, root)
+
+    title = _first_h1_text(backend, nodes['main_title']) if nodes['main_title'] is not None else None
+    if not title:
+        METRICS.inc('extract_failures_total', page_type='detail', reason='missing_title')
+        raise MissingTitleError("No title found - page may not have loaded")
+
+    location = backend.text(nodes['location']) if nodes['location'] is not None else None
+    description = backend.text(nodes['description'])[:DESCRIPTION_MAX_CHARS] if nodes['description'] is not None else None
+
+    facilities = [backend.text(el) for el in nodes['facilities']]
+    furnishing = next((text for text in facilities if 'furnished' in text.lower()), None)
+    amenities = [text for text in facilities if text and text not in AMENITIES_EXCLUDED]
+
+    floor_area = None
+    for el in nodes['details_values']:
+        text = backend.text(el)
+        if 'sqm' in text.lower() or 'm²' in text:
+            area_match = AREA_RE.search(text)
+            if area_match:
+                floor_area = float(area_match.group(1).replace(',', ''))
+                break
+
+    latitude, longitude = extract_coordinates(backend, nodes)
+
+    record = {
+        'url': url,
+        'title': title,
+        'price_php': _first_int(backend, nodes['price'], PRICE_RE),
+        'bedrooms': _first_int(backend, nodes['bedrooms'], INT_RE),
+        'bathrooms': _first_int(backend, nodes['bathrooms'], INT_RE),
+        'floor_area_sqm': floor_area,
+        'location': location,
+        'latitude': latitude,
+        'longitude': longitude,
+        'description': description,
+        'furnishing': furnishing,
+        'amenities': ', '.join(amenities[:AMENITIES_MAX]) if amenities else None,
+        'scrape_status': 'success'
+    }
+    METRICS.observe('extract_seconds', time.perf_counter() - parsed, page_type='detail')
+    return record
+
+def failed_record(url, status):
+    """Empty detail record for a URL that could not be scraped or parsed."""
+    return {
+        'url': url,
+        'title': None,
+        'price_php': None,
+        'bedrooms': None,
+        'bathrooms': None,
+        'floor_area_sqm': None,
+        'location': None,
+        'latitude': None,
+        'longitude': None,
+        'description': None,
+        'furnishing': None,
+        'amenities': None,
+        'scrape_status': status
+    }
+
+# ========== SEARCH PAGES ==========
+def _snippet_record(backend, snippet, city, prop_type):
+    link = title = location = price_text = bedrooms = bathrooms = None
+    for tag, el in backend.walk(snippet):
+        if tag == 'a':
+            href = backend.get(el, 'href')
+            if link is None and href and PROPERTY_HREF_RE.search(href):
+                link = href
+        elif tag == 'span':
+            classes = backend.classes(el)
+            data_test = backend.get(el, 'data-test')
+            if title is None and 'snippet__content__title' in classes:
+                title = el
+            if location is None and data_test == 'snippet-content-location':
+                location = el
+            if bedrooms is None and data_test == 'bedrooms-value' and 'bedrooms' in classes:
+                bedrooms = el
+            if bathrooms is None and data_test == 'full-bathrooms-value' and 'bathrooms' in classes:
+                bathrooms = el
+        elif tag == 'div':
+            if price_text is None and 'snippet__content__price' in backend.classes(el):
+                price_text = el
+    if link is None:
+        return None
+
+    if link.startswith('/'):
+        link = f'{BASE_URL}{link}'
+
+    return {
+        'property_id': backend.get(snippet, 'data-idanuncio') or backend.get(snippet, 'data-alternateid'),
+        'url': link,
+        'title': backend.text(title) if title is not None else None,
+        'location': backend.text(location) if location is not None else None,
+        'price_preview': _first_int(backend, price_text, PRICE_RE),
+        'bedrooms_preview': backend.text(bedrooms) if bedrooms is not None else None,
+        'bathrooms_preview': backend.text(bathrooms) if bathrooms is not None else None,
+        'city': city,
+        'property_type': prop_type
+    }
+
+def _page_position(backend, root, sort_text):
+    """(page, last page) from "Page X of N", or (None, None)."""
+    if sort_text is not None:
+        match = PAGE_OF_RE.search(backend.text(sort_text))
+        if match:
+            return int(match.group(1)), int(match.group(2))
+    for text in backend.strings(root):
+        match = PAGE_OF_RE.search(text)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+    return None, None
+
+def _listing_count(backend, heading):
+    """Total listings from a heading like "1,234 Condos for rent in Pasig", or None."""
+    if heading is None:
+        return None
+    match = LISTING_COUNT_RE.search(backend.text(heading))
+    return int(match.group(1).replace(',', '')) if match else None
+
+def has_property_snippets(html, backend=None):
+    """
+    Check that a search page loaded properly: it has listing snippets, or
+    the site's no-results notice (an empty or past-the-end page).
+    """
+    backend = get_backend(backend)
+    for tag, el in backend.walk(backend.parse(html)):
+        if tag == 'div':
+            classes = backend.classes(el)
+            if 'snippet' in classes or 'search__empty' in classes:
+                return True
+    return False
+
+def parse_search_page(html, city, prop_type, backend=None):
+    """
+    Everything the link crawler reads from a search page, as a dict:
+    records, snippet_count, page and max_page ("Page X of N", None without
+    pagination), listing_count (from the results heading, None when not
+    shown) and empty (the site's no-results notice is on the page).
+    """
+    backend = get_backend(backend)
+    start = time.perf_counter()
+    root = backend.parse(html)
+    parsed = time.perf_counter()
+    METRICS.observe('html_parse_seconds', parsed - start, page_type='search')
+    snippets = []
+    pagination = None
+    sort_text = None
+    heading = None
+    empty = False
+    for tag, el in backend.walk(root):
+        if tag == 'h1' and heading is None and 'search__title' in backend.classes(el):
+            heading = el
+            continue
+        if tag != 'div':
+            continue
+        classes = backend.classes(el)
+        if 'snippet' in classes:
+            snippets.append(el)
+        elif 'search__empty' in classes:
+            empty = True
+        elif 'pagination__pages' in classes and pagination is None:
+            pagination = el
+            for inner_tag, inner in backend.walk(el):
+                if inner_tag == 'div' and 'sort-text' in backend.classes(inner):
+                    sort_text = inner
+                    break
+
+    records = []
+    for snippet in snippets:
+        record = _snippet_record(backend, snippet, city, prop_type)
+        if record:
+            records.append(record)
+    page, max_page = _page_position(backend, root, sort_text)
+    METRICS.observe('extract_seconds', time.perf_counter() - parsed, page_type='search')
+    return {
+        'records': records,
+        'snippet_count': len(snippets),
+        'page': page,
+        'max_page': max_page,
+        'listing_count': _listing_count(backend, heading),
+        'empty': empty,
+    }
+
+def extract_search_page(html, city, prop_type, backend=None):
+    """
+    Extract listing snippets and the "Page X of N" count from a search page.
+
+    Returns (records, snippet_count, max_page); max_page is None when the
+    page shows no pagination.
+    """
+    page = parse_search_page(html, city, prop_type, backend)
+    return page['records'], page['snippet_count'], page['max_page']
@@ -0,0 +1,211 @@
+"""
+Page fetch engines
+Pooled async HTTP client by default, with the Selenium browser as a fallback
+"""
+import asyncio
+import threading
+import time
+import aiohttp
+from browser import USER_AGENT
+from readiness import load_page
+from throttle import get_throttle, classify_failure, BACKOFF_REASONS
+from metrics import METRICS
+
+# ========== CONFIGURATION ==========
+HTTP_MAX_CONNECTIONS = 20   # Keep-alive connections shared by all workers
+HTTP_TIMEOUT = 30           # Seconds per request
+HTTP_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+class FetchError(Exception):
+    """Raised when a page could not be fetched; `status` is the HTTP code if any."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+def _metered(engine, fetch, url):
+    """Run one engine fetch, recording its latency, bytes and failure reason."""
+    start = time.perf_counter()
+    try:
+        html = fetch(url)
+    except Exception as e:
+        METRICS.inc('fetch_errors_total', engine=engine, reason=classify_failure(e))
+        raise
+    METRICS.observe('fetch_seconds', time.perf_counter() - start, engine=engine)
+    METRICS.inc('fetch_bytes_total', len(html.encode('utf-8')), engine=engine)
+    return html
+
+# ========== ENGINES ==========
+class HttpFetcher:
+    """
+    Plain HTTP engine backed by one aiohttp session on a background event loop.
+
+    `fetch()` is synchronous so it can be called from ThreadPoolExecutor
+    workers; all calls share the session's keep-alive connection pool.
+    """
+    name = 'http'
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, timeout=HTTP_TIMEOUT, headers=None):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.headers = headers or HTTP_HEADERS
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='http-fetcher', daemon=True)
+        self._thread.start()
+        self._session = asyncio.run_coroutine_threadsafe(self._open_session(), self._loop).result()
+
+    async def _open_session(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def _get(self, url):
+        try:
+            async with self._session.get(url) as response:
+                if response.status >= 400:
+                    raise FetchError(f"HTTP {response.status}", status=response.status)
+                return await response.text()
+        except asyncio.TimeoutError:
+            raise FetchError("HTTP timeout")
+        except aiohttp.ClientError as e:
+            raise FetchError(f"HTTP error: {e}")
+
+    def _fetch(self, url):
+        future = asyncio.run_coroutine_threadsafe(self._get(url), self._loop)
+        return future.result()
+
+    def fetch(self, url):
+        """Return the page HTML for `url`."""
+        return _metered(self.name, self._fetch, url)
+
+    def close(self):
+        """Close the session and stop the event loop (a no-op once closed: fetchers may share it)."""
+        if not self._thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+class SeleniumFetcher:
+    """Headless Chrome engine using drivers leased from a DriverPool."""
+    name = 'selenium'
+
+    def __init__(self, pool, page_type, ready_timeout=None):
+        self.pool = pool
+        self.page_type = page_type
+        self.ready_timeout = ready_timeout
+
+    def _fetch(self, url):
+        with self.pool.lease() as driver:
+            return load_page(driver, url, self.page_type, self.ready_timeout)
+
+    def fetch(self, url):
+        """Return the page source for `url` once its ready selector appears."""
+        return _metered(self.name, self._fetch, url)
+
+    def close(self):
+        self.pool.close()
+
+class ThrottledFetcher:
+    """
+    Runs every fetch of an engine inside the target host's adaptive throttle.
+
+    `check(html)`, when given, runs inside the slot too, so a page it rejects
+    (e.g. a block page without a listing title) is fed back to the throttle
+    as that request's outcome.
+    """
+
+    def __init__(self, inner, check=None):
+        self.inner = inner
+        self.check = check
+        self.name = inner.name
+
+    def fetch(self, url):
+        with get_throttle(url).slot():
+            html = self.inner.fetch(url)
+            if self.check is not None:
+                self.check(html)
+            return html
+
+    def close(self):
+        self.inner.close()
+
+class FallbackFetcher:
+    """
+    Try the primary engine first and fall back when its HTML is unusable.
+
+    `is_complete(html)` decides whether the primary response has the content
+    the extractors need; other HTTP errors also trigger the fallback. Throttling
+    signals (429, 403, timeouts) are raised instead, so the throttle and retry
+    queue back off rather than the browser hitting the site a second time.
+    """
+
+    def __init__(self, primary, fallback, is_complete):
+        self.primary = primary
+        self.fallback = fallback
+        self.is_complete = is_complete
+        self.name = f'{primary.name}+{fallback.name}'
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+
+    def fetch(self, url):
+        """Return page HTML, using the fallback engine only when needed."""
+        try:
+            html = self.primary.fetch(url)
+            if self.is_complete(html):
+                return html
+            reason = 'incomplete page'
+        except FetchError as e:
+            if classify_failure(e) in BACKOFF_REASONS:
+                raise
+            reason = str(e)
+        with self._lock:
+            self.fallbacks += 1
+        METRICS.inc('fetch_fallbacks_total', engine=self.primary.name)
+        print(f"   ↪️  {self.primary.name} fetch unusable ({reason}), using {self.fallback.name}")
+        return self.fallback.fetch(url)
+
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+class ArchivingFetcher:
+    """Stores every page source the inner fetcher returns in an HtmlArchive."""
+
+    def __init__(self, inner, archive, page_type):
+        self.inner = inner
+        self.archive = archive
+        self.page_type = page_type
+        self.name = inner.name
+
+    def fetch(self, url):
+        html = self.inner.fetch(url)
+        self.archive.put(url, self.page_type, html)
+        return html
+
+    def close(self):
+        self.inner.close()
+        self.archive.close()
+
+def build_fetcher(engine, pool, page_type, is_complete, ready_timeout=None, archive=None, http=None, check=None):
+    """
+    Build the throttled fetcher for `engine` ('http' with Selenium fallback, or
+    'selenium'); pages are also written to `archive` when one is given. Pass
+    `http` to reuse one HttpFetcher session across several fetchers, and
+    `check` to validate the final (Selenium) page inside its throttle slot.
+    """
+    selenium_fetcher = ThrottledFetcher(SeleniumFetcher(pool, page_type, ready_timeout), check)
+    if engine == 'selenium':
+        fetcher = selenium_fetcher
+    elif engine == 'http':
+        fetcher = FallbackFetcher(ThrottledFetcher(http or HttpFetcher()), selenium_fetcher, is_complete)
+    else:
+        raise ValueError(f"Unknown fetch engine: {engine}")
+    return ArchivingFetcher(fetcher, archive, page_type) if archive is not None else fetcher
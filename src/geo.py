@@ -0,0 +1,106 @@
+"""
+Distance enrichment for listings
+Attaches the nearest train station and the distances to it and to the
+commute destination, using vectorized haversine and a nearest-neighbour index
+"""
+import numpy as np
+import pandas as pd
+from config import DESTINATION
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy is optional; the index falls back to chunked NumPy
+    cKDTree = None
+
+# ========== CONFIGURATION ==========
+EARTH_RADIUS_M = 6371008.8
+BRUTE_FORCE_CHUNK = 4096  # Listings per block when scipy is not installed
+
+# Station columns as returned by stations.fetch_stations
+STATION_LAT = 'Lat'
+STATION_LON = 'Lon'
+STATION_NAME = 'Station Name'
+
+# ========== DISTANCES ==========
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; arguments broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _unit_vectors(lats, lons):
+    """Points on the unit sphere; straight-line (chord) order equals great-circle order."""
+    lat, lon = np.radians(lats), np.radians(lons)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+# ========== SPATIAL INDEX ==========
+class StationIndex:
+    """
+    Nearest-station lookup over a fixed set of stations.
+
+    Stations are indexed as 3D unit vectors, so the nearest by chord length
+    is exactly the nearest by haversine distance. Uses a scipy KD-tree when
+    available (O(log M) per listing), otherwise a chunked NumPy scan.
+    """
+
+    def __init__(self, lats, lons, names):
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        valid = np.isfinite(lats) & np.isfinite(lons)
+        if not valid.any():
+            raise ValueError("No stations with coordinates")
+        self.lats = lats[valid]
+        self.lons = lons[valid]
+        self.names = np.asarray(names, dtype=object)[valid]
+        self._points = _unit_vectors(self.lats, self.lons)
+        self._tree = cKDTree(self._points) if cKDTree is not None else None
+
+    @classmethod
+    def from_frame(cls, stations, lat=STATION_LAT, lon=STATION_LON, name=STATION_NAME):
+        return cls(stations[lat], stations[lon], stations[name])
+
+    def _nearest_positions(self, points):
+        if self._tree is not None:
+            return self._tree.query(points)[1]
+        positions = np.empty(len(points), dtype=np.intp)
+        for start in range(0, len(points), BRUTE_FORCE_CHUNK):
+            block = points[start:start + BRUTE_FORCE_CHUNK]
+            # Largest dot product = smallest angle
+            positions[start:start + len(block)] = np.argmax(block @ self._points.T, axis=1)
+        return positions
+
+    def nearest(self, lats, lons):
+        """
+        (names, distances in metres) of the nearest station per point.
+        Points without coordinates get None and NaN.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        names = np.full(len(lats), None, dtype=object)
+        distances = np.full(len(lats), np.nan)
+        valid = np.isfinite(lats) & np.isfinite(lons)
+        if valid.any():
+            positions = self._nearest_positions(_unit_vectors(lats[valid], lons[valid]))
+            names[valid] = self.names[positions]
+            distances[valid] = haversine_m(lats[valid], lons[valid], self.lats[positions], self.lons[positions])
+        return names, distances
+
+# ========== ENRICHMENT ==========
+def enrich(df, stations, destination=DESTINATION, lat='latitude', lon='longitude'):
+    """
+    Return `df` with nearest_station, station_distance_m and
+    destination_distance_m columns.
+
+    `stations` is a StationIndex or a station DataFrame with Lat/Lon/Station
+    Name columns; `destination` is a (latitude, longitude) pair.
+    """
+    index = stations if isinstance(stations, StationIndex) else StationIndex.from_frame(stations)
+    lats = pd.to_numeric(df[lat], errors='coerce').to_numpy(dtype=float)
+    lons = pd.to_numeric(df[lon], errors='coerce').to_numpy(dtype=float)
+    names, distances = index.nearest(lats, lons)
+    return df.assign(
+        nearest_station=names,
+        station_distance_m=distances.round(1),
+        destination_distance_m=haversine_m(lats, lons, destination[0], destination[1]).round(1),
+    )
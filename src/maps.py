@@ -0,0 +1,275 @@
+"""
+Listing map builder
+Serializes listings as one compact GeoJSON layer whose popups are rendered in
+the browser on click, clustered or aggregated into grid cells when large
+"""
+import json
+import folium
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+from aggregates import GRID_CELL_DEG
+from config import DESTINATION, DESTINATION_NAME
+
+# ========== CONFIGURATION ==========
+CLUSTER_THRESHOLD = 2000   # Listings above this are clustered in the browser
+GRID_THRESHOLD = 20000     # Listings above this are drawn as pre-aggregated grid cells
+COORD_DECIMALS = 5         # ~1 m; keeps the embedded GeoJSON small
+PRICE_COLORS = ['green', 'yellow', 'red']
+
+# ========== LAYER ==========
+class ListingLayer(JSCSSMixin, MacroElement):
+    """
+    One Leaflet GeoJSON layer for all listings.
+
+    Properties use short keys (t title, p price, u url, c colour, s station,
+    sd station distance, dd destination distance; for grid cells n count
+    and lo/hi the 10th/90th percentile). Tooltip and popup HTML are built
+    from them in the browser only when opened, so the page carries no
+    per-listing HTML.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var esc = function(s) {
+                return String(s == null ? '' : s).replace(/[&<>"']/g, function(c) {
+                    return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                });
+            };
+            var php = function(v) { return Number(v).toLocaleString('en-US') + ' PHP'; };
+            {% if this.kind == 'grid' %}
+            var layer = L.geoJSON({{ this.data }}, {
+                style: function(f) {
+                    return {color: f.properties.c, weight: 0.5, fillColor: f.properties.c, fillOpacity: 0.55};
+                },
+                onEachFeature: function(f, layer) {
+                    var p = f.properties;
+                    layer.bindTooltip(function() { return p.n + ' listings | median ' + php(p.p); });
+                    layer.bindPopup(function() {
+                        return "<div style='font-size: 14px; font-family: Arial, sans-serif;'>"
+                            + '<strong>' + p.n + ' listings</strong><br>'
+                            + '<strong>Median:</strong> ' + php(p.p) + '<br>'
+                            + '<strong>Middle 80%:</strong> ' + php(p.lo) + ' - ' + php(p.hi) + '</div>';
+                    });
+                }
+            });
+            {% else %}
+            var layer = L.geoJSON({{ this.data }}, {
+                pointToLayer: function(f, latlng) {
+                    var c = f.properties.c;
+                    return L.circleMarker(latlng, {radius: 5, weight: 1, color: c, fillColor: c, fillOpacity: 0.7});
+                },
+                onEachFeature: function(f, layer) {
+                    var p = f.properties;
+                    layer.bindTooltip(function() { return '<strong>' + esc(p.t) + '</strong><br>' + php(p.p); });
+                    layer.bindPopup(function() {
+                        var html = "<div style='font-size: 14px; font-family: Arial, sans-serif; min-width: 250px;'>"
+                            + "<p style='font-weight: bold; margin: 10px 0;'>" + esc(p.t) + '</p>'
+                            + "<hr style='margin: 10px 0; border: none; border-top: 1px solid #ccc;'>"
+                            + '<strong>Price:</strong> ' + php(p.p) + '<br>';
+                        if (p.s != null) {
+                            html += '<strong>Nearest station:</strong> ' + esc(p.s) + ' (' + Math.round(p.sd).toLocaleString('en-US') + ' m)<br>';
+                        }
+                        if (p.dd != null) {
+                            html += '<strong>To destination:</strong> ' + (p.dd / 1000).toFixed(1) + ' km<br>';
+                        }
+                        return html + '<br><a href="' + esc(p.u) + '" target="_blank" rel="noopener noreferrer"'
+                            + " style='color: #0066cc; text-decoration: none;'>📋 View Listing →</a></div>";
+                    }, {maxWidth: 300});
+                }
+            });
+            {% if this.kind == 'cluster' %}
+            layer = L.markerClusterGroup({chunkedLoading: true, disableClusteringAtZoom: 17}).addLayer(layer);
+            {% endif %}
+            {% endif %}
+            return layer.addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, geojson, kind='points'):
+        super().__init__()
+        self._name = 'ListingLayer'
+        self.kind = kind
+        # Compact JSON; "</" is escaped so a title cannot close the script tag
+        self.data = json.dumps(geojson, separators=(',', ':'), ensure_ascii=False).replace('</', '<\\/')
+        self.default_js = MarkerCluster.default_js if kind == 'cluster' else []
+        self.default_css = MarkerCluster.default_css if kind == 'cluster' else []
+
+# ========== FEATURES ==========
+def price_colormap(prices, caption='Rent Price (PHP)'):
+    price_min, price_max = float(np.min(prices)), float(np.max(prices))
+    if price_min == price_max:
+        # If all prices are the same, use a small range
+        price_min, price_max = price_min * 0.9, price_max * 1.1
+    return folium.LinearColormap(colors=PRICE_COLORS, vmin=price_min, vmax=price_max, caption=caption)
+
+def _colors(colormap, prices):
+    """Colour per price, evaluating the colormap once per distinct value."""
+    unique, inverse = np.unique(prices, return_inverse=True)
+    return np.array([colormap(value) for value in unique], dtype=object)[inverse]
+
+def _optional(values, decimals=None):
+    if values is None:
+        return None
+    values = pd.Series(values)
+    if decimals is not None:
+        values = values.round(decimals)
+    return values.astype(object).where(values.notna(), None).tolist()
+
+def point_features(df, colormap):
+    """GeoJSON FeatureCollection of listings, one Point per row."""
+    lons = df['longitude'].round(COORD_DECIMALS).tolist()
+    lats = df['latitude'].round(COORD_DECIMALS).tolist()
+    prices = df['price_php'].to_numpy(dtype=float)
+    columns = {
+        't': df['title'].astype(object).where(df['title'].notna(), '').tolist(),
+        'p': prices.round().astype(np.int64).tolist(),
+        'u': df['url'].tolist(),
+        'c': _colors(colormap, prices).tolist(),
+        's': _optional(df.get('nearest_station')),
+        'sd': _optional(df.get('station_distance_m'), 0),
+        'dd': _optional(df.get('destination_distance_m'), 0),
+    }
+    columns = {key: values for key, values in columns.items() if values is not None}
+    features = []
+    for i in range(len(df)):
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lons[i], lats[i]]},
+            'properties': {key: values[i] for key, values in columns.items()},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+def grid_cells(df, cell_deg=GRID_CELL_DEG):
+    """
+    Listings per grid cell, with the same columns as GridAggregates.read():
+    cell indices, south/west bounds, count and price_p10/p50/p90.
+    """
+    prices = df.assign(
+        cell_lat=np.floor(df['latitude'].to_numpy(dtype=float) / cell_deg).astype(np.int64),
+        cell_lon=np.floor(df['longitude'].to_numpy(dtype=float) / cell_deg).astype(np.int64),
+    ).groupby(['cell_lat', 'cell_lon'])['price_php']
+    cells = pd.DataFrame({
+        'count': prices.count(),
+        'price_p10': prices.quantile(0.10),
+        'price_p50': prices.median(),
+        'price_p90': prices.quantile(0.90),
+    }).reset_index()
+    cells['south'] = cells['cell_lat'] * cell_deg
+    cells['west'] = cells['cell_lon'] * cell_deg
+    return cells
+
+def grid_features(cells, colormap, cell_deg=GRID_CELL_DEG):
+    """GeoJSON FeatureCollection with one rectangle per grid cell."""
+    colors = _colors(colormap, cells['price_p50'].to_numpy(dtype=float))
+    features = []
+    for row, color in zip(cells.itertuples(index=False), colors):
+        south, west = round(row.south, COORD_DECIMALS), round(row.west, COORD_DECIMALS)
+        north, east = round(south + cell_deg, COORD_DECIMALS), round(west + cell_deg, COORD_DECIMALS)
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [[[west, south], [east, south], [east, north], [west, north], [west, south]]]},
+            'properties': {'n': int(row.count), 'p': int(round(row.price_p50)), 'lo': int(round(row.price_p10)), 'hi': int(round(row.price_p90)), 'c': color},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+# ========== MAP ==========
+def map_mode(count, cluster_threshold=CLUSTER_THRESHOLD, grid_threshold=GRID_THRESHOLD):
+    if count > grid_threshold:
+        return 'grid'
+    if count > cluster_threshold:
+        return 'cluster'
+    return 'points'
+
+def build_map(df=None, stations=None, mode=None, cells=None, destination=DESTINATION, destination_name=DESTINATION_NAME, zoom_start=12):
+    """
+    Folium map of listings coloured by price.
+
+    `df` needs latitude, longitude, price_php, title and url (nearest_station,
+    station_distance_m and destination_distance_m appear in popups when
+    present). `mode` is 'points', 'cluster' or 'grid'; by default it is
+    picked from the number of listings (CLUSTER_THRESHOLD, GRID_THRESHOLD).
+    Instead of `df`, `cells` can be precomputed grid statistics from
+    GridAggregates.read(by=['cell_lat', 'cell_lon']), drawn without touching
+    the listings. `stations` is a station DataFrame from stations.fetch_stations.
+    """
+    if cells is not None:
+        mode = 'grid'
+        center = [cells['south'].mean() + GRID_CELL_DEG / 2, cells['west'].mean() + GRID_CELL_DEG / 2]
+        price_scale = price_colormap(cells['price_p50'])
+        geojson = grid_features(cells, price_scale)
+    else:
+        data = df.dropna(subset=['latitude', 'longitude', 'price_php'])
+        data = data[np.isfinite(data['price_php'].to_numpy(dtype=float))]
+        mode = mode or map_mode(len(data))
+        center = [data['latitude'].mean(), data['longitude'].mean()]
+        price_scale = price_colormap(data['price_php'])
+        geojson = grid_features(grid_cells(data), price_scale) if mode == 'grid' else point_features(data, price_scale)
+
+    # Canvas rendering keeps thousands of circle markers responsive
+    m = folium.Map(location=center, zoom_start=zoom_start, prefer_canvas=True)
+    ListingLayer(geojson, mode).add_to(m)
+
+    if stations is not None and not stations.empty:
+        station_rows = stations.dropna(subset=['Lat', 'Lon'])[['Lat', 'Lon', 'Station Name', 'line_name']]
+        for lat, lon, name, line_name in station_rows.itertuples(index=False, name=None):
+            folium.Marker(
+                location=[lat, lon],
+                icon=folium.Icon(color='red', icon='train', prefix='fa'),
+                tooltip=f"Train Station: {name}",
+                popup=f"<strong>{name}</strong><br>{line_name}"
+            ).add_to(m)
+
+    folium.Marker(
+        location=list(destination),
+        popup=f'{destination_name} (Destination)',
+        icon=folium.Icon(color='purple', icon='info-sign')
+    ).add_to(m)
+
+    m.add_child(price_scale)
+    return m
+
+# ========== LEGACY REFERENCE (one CircleMarker with an HTML popup per listing) ==========
+def legacy_map(data_clean, destination=DESTINATION, destination_name=DESTINATION_NAME):
+    """The notebook's original per-row map, kept as the baseline for benchmarks."""
+    m = folium.Map(location=[data_clean['latitude'].mean(), data_clean['longitude'].mean()], zoom_start=12)
+    price_scale = price_colormap(data_clean['price_php'])
+
+    for index, row in data_clean.iterrows():
+        if pd.isna(row['price_php']) or not np.isfinite(row['price_php']):
+            continue
+        popup_html = f"""
+        <div style='font-size: 14px; font-family: Arial, sans-serif; min-width: 250px;'>
+            <strong>Lot ID:</strong> {row.get('index', 'N/A')}<br>
+            <p style='font-weight: bold; margin: 10px 0;'>{row['title']}</p>
+            <hr style='margin: 10px 0; border: none; border-top: 1px solid #ccc;'>
+            <strong>Price:</strong> {row['price_php']:,.2f} PHP<br><br>
+            <a href="{row['url']}" target="_blank" rel="noopener noreferrer"
+               style='color: #0066cc; text-decoration: none;'>
+                📋 View Listing →
+            </a>
+        </div>
+        """
+        tooltip_text = f"<strong>{row['title']}</strong><br>{row['price_php']:,.2f} PHP"
+        folium.CircleMarker(
+            location=[row['latitude'], row['longitude']],
+            radius=5,
+            color=price_scale(row['price_php']),
+            fill=True,
+            fill_color=price_scale(row['price_php']),
+            fill_opacity=0.7,
+            popup=folium.Popup(popup_html, max_width=300),
+            tooltip=tooltip_text
+        ).add_to(m)
+
+    folium.Marker(
+        location=list(destination),
+        popup=f'{destination_name} (Destination)',
+        icon=folium.Icon(color='purple', icon='info-sign')
+    ).add_to(m)
+    m.add_child(price_scale)
+    return m
@@ -0,0 +1,260 @@
+"""
+Crawl metrics
+Process-wide counters and latency histograms for each scrape stage, exported
+per run as JSON lines and in the Prometheus text format
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ========== CONFIGURATION ==========
+METRICS_ENABLED = True
+METRICS_PREFIX = 'scraper_'
+METRICS_PORT = None  # Serve /metrics on this port while a crawl runs (None: files only)
+METRICS_HOST = '127.0.0.1'  # Local only; set to '0.0.0.0' to let a remote Prometheus scrape it
+
+# Histogram upper bounds in seconds (+Inf is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# ========== METRIC TYPES ==========
+class Histogram:
+    """Per-bucket observation counts (not cumulative) plus count and sum."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, counts, total, count):
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.count += count
+        self.sum += total
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile `q` (None when empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+# ========== REGISTRY ==========
+class MetricsRegistry:
+    """
+    Thread-safe store of counters and histograms keyed by name and labels.
+
+    Recording is a dict lookup and a bisect under one lock, cheap enough to
+    leave on for every page. Worker processes record into their own registry
+    and hand it back with `drain()`; the parent adds it with `merge()`.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.started = datetime.now()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name, **labels):
+        """Context manager observing the wall time of its block."""
+        return _Timer(self, name, labels)
+
+    def timed(self, name, **labels):
+        """Decorator observing the wall time of every call."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    # ----- cross-process -----
+    def drain(self):
+        """Return everything recorded so far as plain data and reset."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (h.counts, h.sum, h.count) for key, h in self._histograms.items()}
+            self._counters.clear()
+            self._histograms.clear()
+        return counters, histograms
+
+    def merge(self, drained):
+        """Add the output of another registry's `drain()`."""
+        counters, histograms = drained
+        if not (counters or histograms):
+            return
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (counts, total, count) in histograms.items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.merge(counts, total, count)
+
+    # ----- export -----
+    def snapshot(self):
+        """One dict per series, histograms summarized with count/sum/p50/p95."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items())
+        rows = []
+        for (name, labels), value in counters:
+            rows.append({'metric': name, 'type': 'counter', 'labels': dict(labels), 'value': value})
+        for (name, labels), (counts, total, count) in histograms:
+            histogram = Histogram()
+            histogram.merge(counts, total, count)
+            rows.append({
+                'metric': name,
+                'type': 'histogram',
+                'labels': dict(labels),
+                'count': count,
+                'sum': round(total, 6),
+                'p50': histogram.quantile(0.50),
+                'p95': histogram.quantile(0.95),
+                'buckets': dict(zip([str(b) for b in histogram.buckets] + ['+Inf'], counts)),
+            })
+        return rows
+
+    def write_jsonl(self, path, run=None):
+        """Append this run's series to `path`, one JSON object per line."""
+        run = run or self.started.strftime('%Y%m%d_%H%M%S')
+        stamp = datetime.now().isoformat(timespec='seconds')
+        with open(path, 'a', encoding='utf-8') as f:
+            for row in self.snapshot():
+                f.write(json.dumps({'time': stamp, 'run': run, **row}, ensure_ascii=False) + '\n')
+
+    def prometheus_text(self):
+        """All series in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets)) for key, h in self._histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            name = f'{METRICS_PREFIX}{name}'
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            name = f'{METRICS_PREFIX}{name}'
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write the text format atomically (node_exporter textfile collector compatible)."""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve the text format at http://host:port/metrics from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return server
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+METRICS = MetricsRegistry()
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Start the /metrics endpoint when a port is configured."""
+    if port:
+        METRICS.serve(port, host)
+        print(f"📈 Metrics: http://{host}:{port}/metrics")
+
+def save_metrics(output_path):
+    """Append the run to metrics_<run>.jsonl, refresh metrics.prom and print where they went."""
+    jsonl_file = f"{output_path}/metrics_{METRICS.started.strftime('%Y%m%d_%H%M%S')}.jsonl"
+    prom_file = f"{output_path}/metrics.prom"
+    METRICS.write_jsonl(jsonl_file)
+    METRICS.write_prometheus(prom_file)
+    print(f"📈 Metrics saved: {jsonl_file} | {prom_file}")
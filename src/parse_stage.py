@@ -0,0 +1,122 @@
+"""
+Process-pool parse stage
+Fetch threads hand raw HTML strings to worker processes, which build the tree
+and send back only the small record, so parsing is not bound by the GIL
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from extraction import extract_property_details, extract_search_page, failed_record
+from retry import failure_kind
+from metrics import METRICS
+
+# ========== CONFIGURATION ==========
+PARSE_WORKERS = os.cpu_count() or 2  # 0 parses inline in the calling thread
+PARSE_CHUNKSIZE = 16                 # Pages per task in bulk mode
+MAX_PENDING_CHUNKS = 4               # Chunks in flight per worker in bulk mode
+
+# ========== WORKER FUNCTIONS ==========
+# Module-level so worker processes can unpickle them by reference
+def parse_detail(html, url, backend=None):
+    return extract_property_details(html, url, backend)
+
+def parse_detail_or_failure(html, url, backend=None):
+    """Detail record, or a failed record when the page does not parse."""
+    try:
+        return extract_property_details(html, url, backend)
+    except Exception as e:
+        return failed_record(url, f"failed ({failure_kind(e, 'extract')}): {str(e)[:100]}")
+
+def parse_search(html, city, prop_type, backend=None):
+    return extract_search_page(html, city, prop_type, backend)
+
+# Workers send their own metrics back with each result; the parent merges them
+def _metered_call(func, args, backend):
+    try:
+        return True, func(*args, backend=backend), METRICS.drain()
+    except Exception as e:
+        return False, e, METRICS.drain()
+
+def _run_chunk(func, chunk, backend):
+    return [func(*args, backend=backend) for args in chunk], METRICS.drain()
+
+# ========== STAGE ==========
+class ParseStage:
+    """
+    Parser processes shared by all fetch threads.
+
+    `detail()` / `search()` parse one page and block the calling fetch thread
+    until the record is back (the GIL is released while it waits). `map()`
+    streams a bulk re-parse across every core in chunks, keeping only a
+    bounded number of pages in flight. Only the HTML string goes to the
+    worker and only the record comes back; parse trees never cross the
+    process boundary.
+    """
+
+    def __init__(self, workers=PARSE_WORKERS, backend=None):
+        self.workers = workers
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: the fetch threads and aiohttp loop must not be forked
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _call(self, func, *args):
+        start = time.perf_counter()
+        try:
+            if not self.workers:
+                return func(*args, backend=self.backend)
+            ok, result, worker_metrics = self._pool().submit(_metered_call, func, args, self.backend).result()
+            METRICS.merge(worker_metrics)
+            if not ok:
+                raise result
+            return result
+        finally:
+            METRICS.observe('parse_stage_seconds', time.perf_counter() - start, task=func.__name__)
+
+    def detail(self, html, url):
+        """Detail record for one page; raises the extractor's exception on failure."""
+        return self._call(parse_detail, html, url)
+
+    def search(self, html, city, prop_type):
+        """(records, snippet_count, max_page) for one search page."""
+        return self._call(parse_search, html, city, prop_type)
+
+    def map(self, func, arg_tuples, chunksize=PARSE_CHUNKSIZE):
+        """Yield func(*args) for every tuple in `arg_tuples`, in order."""
+        arg_tuples = iter(arg_tuples)
+        if not self.workers:
+            for args in arg_tuples:
+                yield func(*args, backend=self.backend)
+            return
+        pool = self._pool()
+        pending = deque()
+        while True:
+            while len(pending) < self.workers * MAX_PENDING_CHUNKS:
+                chunk = list(islice(arg_tuples, chunksize))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_run_chunk, func, chunk, self.backend))
+            if not pending:
+                return
+            results, worker_metrics = pending.popleft().result()
+            METRICS.merge(worker_metrics)
+            yield from results
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
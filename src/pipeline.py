@@ -0,0 +1,276 @@
+"""
+Streaming crawl pipeline
+Search-page workers feed property URLs through a bounded queue straight into
+detail-page workers, so detail scraping starts with the first search page
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from functools import partial
+import pandas as pd
+import scrape_link
+import scrape_details
+from browser import DriverPool, create_driver
+from fetchers import HttpFetcher, build_fetcher
+from archive import open_archive
+from crawl_store import CrawlStore
+from dedup import snippet_keys, SNIPPET_MAX_CLUSTER
+from extraction import failed_record, has_property_snippets, has_listing_title, require_listing_title
+from readiness import READY_LOG
+from throttle import save_throttle_logs
+from aggregates import update_aggregates
+from metrics import save_metrics, start_metrics_server
+
+# ========== CONFIGURATION ==========
+QUEUE_SIZE = 200          # Max discovered URLs waiting for a detail worker
+SEARCH_WORKERS = scrape_link.MAX_WORKERS
+DETAIL_WORKERS = scrape_details.MAX_WORKERS
+BATCH_SIZE = scrape_details.BATCH_SIZE
+OUTPUT_PATH = scrape_details.OUTPUT_PATH
+SKIP_SNIPPET_DUPLICATES = scrape_details.SKIP_SNIPPET_DUPLICATES
+# One state file per output dir: an interrupted run resumes whenever it is restarted,
+# and a finished run's state is renamed aside so the next crawl starts fresh
+STATE_FILE = f"{OUTPUT_PATH}/crawl_state_pipeline.sqlite"
+
+_DONE = object()  # Queue sentinel: no more URLs
+
+# ========== SETUP ==========
+def setup():
+    """
+    Build one driver pool and HTTP session for both stages and inject a
+    fetcher over them into scrape_link and scrape_details (each keeps its own
+    page readiness check); their setup() then only adds what is missing.
+    """
+    pool = DriverPool(
+        size=max(SEARCH_WORKERS, DETAIL_WORKERS),
+        factory=partial(create_driver, headless=scrape_details.HEADLESS),
+        max_pages=scrape_details.MAX_PAGES_PER_DRIVER
+    )
+    http = HttpFetcher() if 'http' in (scrape_link.FETCH_ENGINE, scrape_details.FETCH_ENGINE) else None
+    for module, page_type, is_complete, check in [
+        (scrape_link, 'search', has_property_snippets, None),
+        (scrape_details, 'detail', has_listing_title, require_listing_title),
+    ]:
+        if module.FETCHER is None:
+            module.DRIVER_POOL = pool
+            module.FETCHER = build_fetcher(
+                module.FETCH_ENGINE, pool, page_type, is_complete, module.PAGE_READY_TIMEOUT,
+                archive=open_archive(module.ARCHIVE_DIR) if module.ARCHIVE_DIR else None, http=http, check=check
+            )
+    scrape_link.setup()
+    scrape_details.setup()
+
+def shutdown():
+    """Close the shared engines once and report the pool a single time."""
+    if scrape_link.FETCHER is not None and scrape_link.FETCHER is not scrape_details.FETCHER:
+        scrape_link.FETCHER.close()
+    scrape_details.shutdown()
+
+# ========== STAGES ==========
+class LinkCollector:
+    """
+    Deduplicates discovered links and pushes new URLs onto the queue.
+
+    With `skip_duplicates`, a link whose snippet repeats an earlier one
+    (dedup.snippet_keys) is held back; if more than SNIPPET_MAX_CLUSTER links
+    turn up with that snippet they are separate units and go out after all,
+    as dedup.cluster_snippets would decide for the whole links file.
+    """
+
+    def __init__(self, url_queue, skip_duplicates=False):
+        self.url_queue = url_queue
+        self.skip_duplicates = skip_duplicates
+        self._lock = threading.Lock()
+        self.rows = {}
+        self._snippets = {}  # Snippet key -> urls seen with it
+
+    def add(self, df):
+        if df is None or df.empty:
+            return
+        keys = snippet_keys(df) if self.skip_duplicates else pd.Series(pd.NA, index=df.index, dtype='string')
+        for row, key in zip(df.to_dict('records'), keys):
+            with self._lock:
+                if row['url'] in self.rows:
+                    continue
+                self.rows[row['url']] = row
+                urls = self._release(key, row['url'])
+            # Blocks while detail workers are behind (backpressure)
+            for url in urls:
+                self.url_queue.put(url)
+
+    def _release(self, key, url):
+        """URLs to queue now that `url` was seen with snippet `key`."""
+        if pd.isna(key):
+            return [url]
+        urls = self._snippets.setdefault(key, [])
+        urls.append(url)
+        if len(urls) == 1:
+            return [url]
+        if len(urls) <= SNIPPET_MAX_CLUSTER:
+            return []
+        return urls[1:] if len(urls) == SNIPPET_MAX_CLUSTER + 1 else [url]
+
+    @property
+    def skipped(self):
+        """Links held back as repeats of another listing's snippet."""
+        with self._lock:
+            return sum(len(urls) - 1 for urls in self._snippets.values() if len(urls) <= SNIPPET_MAX_CLUSTER)
+
+    def links_df(self, urls=None):
+        """Collected links as a DataFrame, or just the rows for `urls`."""
+        with self._lock:
+            rows = self.rows.values() if urls is None else [self.rows[url] for url in urls if url in self.rows]
+            return pd.DataFrame(list(rows))
+
+def produce_links(collector):
+    """Crawl every city/type's search pages concurrently, each following its own pagination plan."""
+    city_types = [(city, prop_type) for city in scrape_link.CITIES for prop_type in scrape_link.PROPERTY_TYPES]
+    for df in scrape_link.crawl_search(city_types, max_workers=SEARCH_WORKERS):
+        collector.add(df)
+
+class DetailSink:
+    """
+    Collects detail records and writes a batch file every BATCH_SIZE results;
+    URLs are marked finished in the crawl store only once their batch is written.
+    """
+
+    def __init__(self, collector, store):
+        self.collector = collector
+        self.store = store
+        self._lock = threading.Lock()
+        self._buffer = []
+        self.batch_num = 0
+        self.completed = 0
+        self.failed = 0
+
+    def add(self, record):
+        with self._lock:
+            self._buffer.append(record)
+            self.completed += 1
+            if record['scrape_status'] != 'success':
+                self.failed += 1
+            if len(self._buffer) >= BATCH_SIZE:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        batch_df = self.collector.links_df([r['url'] for r in self._buffer])
+        _, batch_file = scrape_details.save_batch(self._buffer, batch_df, self.batch_num, self.store)
+        print(f"   💾 Saved: {batch_file}")
+        self._buffer = []
+        self.batch_num += 1
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+def _scrape(store, sink, url, attempt=1):
+    try:
+        record = scrape_details.scrape_and_record(store, url, attempt)
+    except Exception as e:
+        print(f"   ❌ Exception for {url}: {str(e)[:50]}")
+        record = failed_record(url, f'exception: {str(e)[:100]}')
+    if record is not None:  # None: deferred to the retry queue
+        sink.add(record)
+
+def consume_details(url_queue, store, sink):
+    """
+    Detail worker: scrape URLs from the queue, picking up due retries in
+    between. After the sentinel it keeps draining the retry queue so no
+    deferred URL is dropped.
+    """
+    retries = scrape_details.RETRIES
+    finished = False
+    while True:
+        due = retries.pop_due()
+        if due is not None:
+            _scrape(store, sink, *due)
+            continue
+        if finished:
+            if not len(retries):
+                return
+            time.sleep(min(retries.next_delay() or 0, 1.0))
+            continue
+        try:
+            url = url_queue.get(timeout=min(retries.next_delay() or 1.0, 1.0))
+        except queue.Empty:
+            continue
+        if url is _DONE:
+            finished = True
+            continue
+        store.add_urls([url])
+        if not store.todo_urls([url], scrape_details.MAX_URL_ATTEMPTS):
+            continue
+        _scrape(store, sink, url)
+
+# ========== MAIN EXECUTION ==========
+def main():
+    """Run link discovery and detail scraping as one pipelined crawl."""
+    print("=" * 70)
+    print("PHILIPPINE RENTAL PROPERTY CRAWLER - STREAMING PIPELINE")
+    print("=" * 70)
+    print(f"   Search workers: {SEARCH_WORKERS} | Detail workers: {DETAIL_WORKERS} | Queue size: {QUEUE_SIZE}\n")
+
+    setup()
+    start_time = time.time()
+    url_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    store = CrawlStore(STATE_FILE)
+    collector = LinkCollector(url_queue, SKIP_SNIPPET_DUPLICATES)
+    sink = DetailSink(collector, store)
+
+    consumers = [
+        threading.Thread(target=consume_details, args=(url_queue, store, sink), name=f'detail-{i}')
+        for i in range(DETAIL_WORKERS)
+    ]
+    for consumer in consumers:
+        consumer.start()
+
+    try:
+        produce_links(collector)
+        search_elapsed = time.time() - start_time
+        print(f"\n🔗 Link discovery finished in {search_elapsed:.1f}s - {len(collector.rows)} unique properties")
+        if SKIP_SNIPPET_DUPLICATES:
+            print(f"🧬 Skipped {collector.skipped} links that repeat another listing's snippet")
+    finally:
+        for _ in consumers:
+            url_queue.put(_DONE)
+        for consumer in consumers:
+            consumer.join()
+        sink.flush()
+
+    links_df = collector.links_df()
+    if not links_df.empty:
+        links_file = f"{OUTPUT_PATH}/property_links_raw_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        links_df.to_csv(links_file, index=False, encoding='utf-8-sig')
+        print(f"💾 Links saved: {links_file}")
+
+    counts = store.counts()
+    store.close()
+    finished_state = f"{OUTPUT_PATH}/crawl_state_pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sqlite"
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(STATE_FILE + suffix):
+            os.replace(STATE_FILE + suffix, finished_state + suffix)
+    elapsed = time.time() - start_time
+    print(f"\n✅ Scraped {sink.completed} properties ({sink.failed} failed) in {elapsed / 60:.1f} minutes")
+    print(f"🗄️  Crawl state: Done {counts.get('done', 0)} | Failed {counts.get('failed', 0)} ({finished_state})")
+    print(f"🔁 Retries scheduled: {scrape_details.RETRIES.scheduled} | Circuit breaker trips: {scrape_details.BREAKER.trips}")
+    if scrape_details.OUTPUT_FORMAT == 'parquet':
+        if scrape_details.AGGREGATES_FILE:
+            update_aggregates(scrape_details.AGGREGATES_FILE, scrape_details.DATASET_DIR)
+        print(f"\nNext step: dataset.read_details('{scrape_details.DATASET_DIR}')")
+    else:
+        print("\nNext step: python combine_batches.py")
+
+if __name__ == '__main__':
+    start_metrics_server()
+    try:
+        main()
+    finally:
+        shutdown()
+        if READY_LOG.records:
+            READY_LOG.print_summary()
+        save_throttle_logs(OUTPUT_PATH)
+        save_metrics(OUTPUT_PATH)
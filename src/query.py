@@ -0,0 +1,351 @@
+"""
+Indexed listing queries
+Loads the details once into NumPy columns with sorted, bitmap and spatial
+grid indexes, answers filter/sort/top-K queries in microseconds, and can
+serve them over a small local HTTP endpoint
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from config import DATASET_DIR, INPUT_FILE
+from geo import haversine_m
+from schema import load_details
+
+# ========== CONFIGURATION ==========
+RANGE_COLUMNS = ['price_php', 'floor_area_sqm']                          # Sorted indexes
+BITMAP_COLUMNS = ['city', 'property_type', 'bedrooms', 'furnishing']     # One bitmap per value
+OUTPUT_COLUMNS = ['url', 'title', 'price_php', 'bedrooms', 'bathrooms', 'floor_area_sqm',
+                  'furnishing', 'city', 'property_type', 'location', 'latitude', 'longitude']
+GRID_DEG = 0.01             # Spatial grid cell size (~1.1 km)
+DEFAULT_LIMIT = 50
+QUERY_PORT = 8766
+
+_GRID_ROW = 1 << 32         # Cell key = lat cell * _GRID_ROW + lon cell
+
+# ========== INDEX ==========
+class ListingIndex:
+    """
+    Read-only columnar copy of the listings with three kinds of index:
+
+    - sorted: row ids ordered by value for each RANGE_COLUMNS column, so a
+      range is two binary searches
+    - bitmap: a packed bit per row for each value of the BITMAP_COLUMNS
+    - grid: row ids grouped by GRID_DEG cell, so a radius search only
+      measures rows in the cells the circle touches
+
+    `query()` starts from whichever range, radius or bitmap predicate
+    selects the fewest rows and checks the rest against those candidates.
+    """
+
+    def __init__(self, df):
+        df = df.reset_index(drop=True)
+        self.size = len(df)
+        self.columns = {}
+        for name in OUTPUT_COLUMNS:
+            if name not in df.columns:
+                continue
+            values = df[name]
+            if name in RANGE_COLUMNS or name in ('latitude', 'longitude', 'bathrooms'):
+                self.columns[name] = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+            elif name in BITMAP_COLUMNS:
+                continue
+            else:
+                self.columns[name] = values.astype(object).where(values.notna(), None).to_numpy()
+
+        # Sorted indexes (NaN rows are left out)
+        self.sorted = {}
+        for name in RANGE_COLUMNS:
+            if name in self.columns:
+                values = self.columns[name]
+                ids = np.flatnonzero(~np.isnan(values))
+                ids = ids[np.argsort(values[ids], kind='stable')]
+                self.sorted[name] = (values[ids], ids)
+
+        # Bitmap indexes over categorical codes
+        self.categories = {}
+        self.codes = {}
+        self.bitmaps = {}
+        for name in BITMAP_COLUMNS:
+            if name not in df.columns:
+                continue
+            values = df[name]
+            if name == 'bedrooms':
+                values = pd.to_numeric(values, errors='coerce').astype('Int64')
+            categorical = pd.Categorical(values)
+            self.categories[name] = list(categorical.categories)
+            self.codes[name] = categorical.codes.astype(np.int16)
+            self.bitmaps[name] = {
+                value: np.packbits(self.codes[name] == code)
+                for code, value in enumerate(categorical.categories)
+            }
+
+        # Spatial grid: row ids sorted by cell key
+        lat = self.columns.get('latitude', np.full(self.size, np.nan))
+        lon = self.columns.get('longitude', np.full(self.size, np.nan))
+        located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        keys = self._cell_keys(lat[located], lon[located])
+        order = np.argsort(keys, kind='stable')
+        self._grid_keys = keys[order]
+        self._grid_ids = located[order]
+
+    @staticmethod
+    def _cell_keys(lat, lon):
+        lat_cells = np.floor(np.asarray(lat) / GRID_DEG).astype(np.int64)
+        lon_cells = np.floor(np.asarray(lon) / GRID_DEG).astype(np.int64)
+        return lat_cells * _GRID_ROW + (lon_cells + _GRID_ROW // 2)
+
+    @classmethod
+    def load(cls, path=None):
+        """Index the Parquet dataset (a directory) or a combined CSV; defaults to config's dataset, then INPUT_FILE."""
+        if path is None:
+            path = DATASET_DIR if Path(DATASET_DIR).is_dir() else INPUT_FILE
+        df = load_details(path)
+        if 'scrape_status' in df.columns:
+            df = df[df['scrape_status'] == 'success']
+        return cls(df)
+
+    # ----- candidate sources -----
+    def _range_ids(self, name, low, high):
+        values, ids = self.sorted[name]
+        start = 0 if low is None else np.searchsorted(values, low, side='left')
+        stop = len(values) if high is None else np.searchsorted(values, high, side='right')
+        return ids[start:stop]
+
+    def _bitmap(self, name, wanted):
+        """OR of the bitmaps for the wanted values (values not present match nothing)."""
+        bitmaps = self.bitmaps[name]
+        if name == 'bedrooms':
+            wanted = [int(value) for value in wanted]
+        result = None
+        for value in wanted:
+            bitmap = bitmaps.get(value)
+            if bitmap is None:
+                continue
+            result = bitmap.copy() if result is None else np.bitwise_or(result, bitmap, out=result)
+        return result if result is not None else np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _grid_ids_near(self, lat, lon, radius_m):
+        dlat = radius_m / 111320.0
+        dlon = radius_m / (111320.0 * max(np.cos(np.radians(lat)), 1e-6))
+        lat_lo, lat_hi = np.floor((lat - dlat) / GRID_DEG), np.floor((lat + dlat) / GRID_DEG)
+        lon_lo, lon_hi = np.floor((lon - dlon) / GRID_DEG), np.floor((lon + dlon) / GRID_DEG)
+        chunks = []
+        for lat_cell in range(int(lat_lo), int(lat_hi) + 1):
+            first = lat_cell * _GRID_ROW + int(lon_lo) + _GRID_ROW // 2
+            last = lat_cell * _GRID_ROW + int(lon_hi) + _GRID_ROW // 2
+            start = np.searchsorted(self._grid_keys, first, side='left')
+            stop = np.searchsorted(self._grid_keys, last, side='right')
+            chunks.append(self._grid_ids[start:stop])
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def _bits_set(bitmap, ids):
+        return (bitmap[ids >> 3] >> (7 - (ids & 7))) & 1 == 1
+
+    # ----- query -----
+    def find(self, near=None, sort=None, descending=False, limit=DEFAULT_LIMIT, **filters):
+        """
+        Row ids matching every filter, sorted and cut to `limit` (None: all).
+
+        Range columns take (low, high) with None for an open end; bitmap
+        columns take a value or a list of values; `near` is
+        (latitude, longitude, radius_m). `sort` is a numeric column, or
+        'distance_m' together with `near`. Returns (ids, distances_m or None);
+        raises ValueError for arguments it cannot answer.
+        """
+        self._validate(near, sort, limit)
+        ranges, bitmaps = [], []
+        for name, condition in filters.items():
+            if name in self.sorted:
+                low, high = condition
+                ranges.append((self._range_ids(name, low, high), name, low, high))
+            elif name in self.bitmaps:
+                wanted = condition if isinstance(condition, (list, tuple, set)) else [condition]
+                bitmaps.append(self._bitmap(name, wanted))
+            else:
+                raise ValueError(f"No index on column: {name}")
+
+        # Drive from the shortest sorted/grid candidate list; the other
+        # ranges are checked by value and the radius exactly below
+        sources = list(ranges)
+        if near is not None:
+            sources.append((self._grid_ids_near(*near), None, None, None))
+        if sources:
+            sources.sort(key=lambda source: len(source[0]))
+            ids = np.sort(sources[0][0])
+            for _, name, low, high in sources[1:]:
+                if name is None:
+                    continue
+                values = self.columns[name][ids]
+                if low is not None:
+                    ids, values = ids[values >= low], values[values >= low]
+                if high is not None:
+                    ids = ids[values <= high]
+        elif bitmaps:
+            combined = bitmaps[0]
+            for bitmap in bitmaps[1:]:
+                combined = combined & bitmap
+            ids = np.flatnonzero(np.unpackbits(combined, count=self.size))
+            bitmaps = []
+        else:
+            ids = np.arange(self.size)
+        for bitmap in bitmaps:
+            ids = ids[self._bits_set(bitmap, ids)]
+
+        distances = None
+        if near is not None:
+            lat, lon, radius_m = near
+            distances = haversine_m(self.columns['latitude'][ids], self.columns['longitude'][ids], lat, lon)
+            inside = distances <= radius_m
+            ids, distances = ids[inside], distances[inside]
+
+        if sort is not None:
+            keys = distances if sort == 'distance_m' else self.columns[sort][ids]
+            keys = np.where(np.isnan(keys), np.inf, -keys if descending else keys)
+            if limit is not None and limit < len(ids):
+                top = np.argpartition(keys, limit)[:limit]
+                order = top[np.argsort(keys[top], kind='stable')]
+            else:
+                order = np.argsort(keys, kind='stable')
+            ids = ids[order]
+            distances = distances[order] if distances is not None else None
+        if limit is not None:
+            ids = ids[:limit]
+            distances = distances[:limit] if distances is not None else None
+        return ids, distances
+
+    def _validate(self, near, sort, limit):
+        if near is not None:
+            if len(near) != 3 or not all(np.isfinite(value) for value in near) or near[2] < 0:
+                raise ValueError(f"near must be (latitude, longitude, radius_m >= 0): {near}")
+            if 'latitude' not in self.columns or 'longitude' not in self.columns:
+                raise ValueError("near needs latitude/longitude columns")
+        if sort == 'distance_m':
+            if near is None:
+                raise ValueError("sort=distance_m needs near")
+        elif sort is not None:
+            values = self.columns.get(sort)
+            if values is None or values.dtype.kind != 'f':
+                numeric = [name for name, values in self.columns.items() if values.dtype.kind == 'f']
+                raise ValueError(f"Cannot sort on {sort!r}; sort on one of {numeric + ['distance_m']}")
+        if limit is not None and limit < 0:
+            raise ValueError(f"limit must be >= 0: {limit}")
+
+    def records(self, ids, distances=None):
+        """Rows as plain dicts (JSON-ready)."""
+        columns = {name: values[ids] for name, values in self.columns.items()}
+        for name, codes in self.codes.items():
+            categories = self.categories[name]
+            columns[name] = [categories[code] if code >= 0 else None for code in codes[ids]]
+        if distances is not None:
+            columns['distance_m'] = np.round(distances, 1)
+        names = [name for name in OUTPUT_COLUMNS if name in columns] + (['distance_m'] if distances is not None else [])
+        rows = []
+        for i in range(len(ids)):
+            row = {}
+            for name in names:
+                value = columns[name][i]
+                if isinstance(value, (np.floating, float)):
+                    value = None if np.isnan(value) else float(value)
+                elif isinstance(value, np.integer):
+                    value = int(value)
+                row[name] = value
+            rows.append(row)
+        return rows
+
+    def query(self, **kwargs):
+        """`find()` returned as a DataFrame."""
+        ids, distances = self.find(**kwargs)
+        return pd.DataFrame(self.records(ids, distances))
+
+    def stats(self):
+        return {
+            'rows': self.size,
+            'sorted': list(self.sorted),
+            'bitmaps': {name: len(values) for name, values in self.bitmaps.items()},
+            'grid_cells': int(len(np.unique(self._grid_keys))),
+        }
+
+# ========== HTTP ENDPOINT ==========
+def parse_params(query_string):
+    """
+    find() arguments from a URL query string:
+    price_php_min / price_php_max (any range column), city=a&city=b (any
+    bitmap column), near=lat,lon,radius_m, sort=column, desc=1, limit=N.
+    """
+    params = parse_qs(query_string)
+    kwargs = {}
+    for name in RANGE_COLUMNS:
+        low, high = params.pop(f'{name}_min', [None])[0], params.pop(f'{name}_max', [None])[0]
+        if low is not None or high is not None:
+            kwargs[name] = (float(low) if low is not None else None, float(high) if high is not None else None)
+    for name in BITMAP_COLUMNS:
+        if name in params:
+            kwargs[name] = params.pop(name)
+    if 'near' in params:
+        lat, lon, radius_m = (float(v) for v in params.pop('near')[0].split(','))
+        kwargs['near'] = (lat, lon, radius_m)
+    if 'sort' in params:
+        kwargs['sort'] = params.pop('sort')[0]
+    kwargs['descending'] = params.pop('desc', ['0'])[0] in ('1', 'true')
+    kwargs['limit'] = int(params.pop('limit', [DEFAULT_LIMIT])[0])
+    if params:
+        raise ValueError(f"Unknown parameters: {sorted(params)}")
+    return kwargs
+
+def serve(index, port=QUERY_PORT, host='127.0.0.1'):
+    """Serve GET /query?... and GET /stats as JSON from a background thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            try:
+                if parsed.path == '/stats':
+                    payload = index.stats()
+                elif parsed.path == '/query':
+                    start = time.perf_counter()
+                    ids, distances = index.find(**parse_params(parsed.query))
+                    results = index.records(ids, distances)
+                    payload = {'count': len(results), 'took_ms': round((time.perf_counter() - start) * 1000, 3), 'results': results}
+                else:
+                    self.send_error(404)
+                    return
+                status = 200
+            except (ValueError, KeyError) as e:
+                status, payload = 400, {'error': str(e)}
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='query-server', daemon=True).start()
+    return server
+
+# ========== MAIN EXECUTION ==========
+if __name__ == '__main__':
+    # Usage: python query.py serve [dataset_dir_or_csv] [port]
+    path = sys.argv[2] if len(sys.argv) > 2 else None
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else QUERY_PORT
+    start = time.perf_counter()
+    index = ListingIndex.load(path)
+    print(f"🗂️  Indexed {index.size} listings in {time.perf_counter() - start:.2f}s")
+    serve(index, port)
+    print(f"🔎 Query endpoint: http://localhost:{port}/query?price_php_max=20000&bedrooms=1&sort=price_php (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,109 @@
+"""
+Page readiness for the Selenium path
+Waits for the elements the extractors need instead of sleeping a fixed time,
+and records time-to-ready per page
+"""
+import csv
+import threading
+import time
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from metrics import METRICS
+
+# ========== CONFIGURATION ==========
+# Element each page type needs before it can be parsed
+READY_SELECTORS = {
+    'detail': 'div.main-title h1',
+    'search': 'div.snippet, div.search__empty',  # The no-results notice marks an empty/past-the-end page
+}
+
+# Maximum seconds to wait per page type
+READY_TIMEOUTS = {
+    'detail': 10,
+    'search': 15,
+}
+
+POLL_INTERVAL = 0.1
+
+# ========== TIMING LOG ==========
+class ReadinessLog:
+    """Thread-safe record of time-to-ready for every page loaded."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = []
+
+    def record(self, url, page_type, load_seconds, ready_seconds, ready):
+        with self._lock:
+            self.records.append({
+                'url': url,
+                'page_type': page_type,
+                'load_seconds': round(load_seconds, 3),
+                'ready_seconds': round(ready_seconds, 3),
+                'ready': ready
+            })
+
+    def summary(self):
+        """Per page type: count, timeouts, and p50/p95 seconds from navigation to ready."""
+        with self._lock:
+            records = list(self.records)
+        stats = {}
+        for page_type in sorted({r['page_type'] for r in records}):
+            rows = [r for r in records if r['page_type'] == page_type]
+            totals = sorted(r['load_seconds'] + r['ready_seconds'] for r in rows)
+            stats[page_type] = {
+                'pages': len(rows),
+                'timeouts': sum(1 for r in rows if not r['ready']),
+                'p50': totals[int(0.50 * (len(totals) - 1))],
+                'p95': totals[int(0.95 * (len(totals) - 1))],
+            }
+        return stats
+
+    def print_summary(self):
+        for page_type, s in self.summary().items():
+            print(f"   ⏱️  {page_type}: {s['pages']} pages | p50 {s['p50']:.2f}s | p95 {s['p95']:.2f}s | timeouts {s['timeouts']}")
+
+    def save(self, path):
+        """Write all timing records to a CSV file."""
+        with self._lock:
+            records = list(self.records)
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=['url', 'page_type', 'load_seconds', 'ready_seconds', 'ready'])
+            writer.writeheader()
+            writer.writerows(records)
+
+READY_LOG = ReadinessLog()
+
+# ========== READINESS ==========
+def wait_until_ready(driver, page_type, timeout=None):
+    """
+    Block until the page type's ready selector is present.
+
+    Returns True when the element appeared, False on timeout (the caller
+    still parses whatever loaded, so missing content is reported the usual way).
+    """
+    selector = READY_SELECTORS[page_type]
+    timeout = READY_TIMEOUTS[page_type] if timeout is None else timeout
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=POLL_INTERVAL).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, selector))
+        )
+        return True
+    except TimeoutException:
+        return False
+
+def load_page(driver, url, page_type, timeout=None, log=READY_LOG):
+    """Navigate to `url`, wait for readiness, record timings and return the page source."""
+    start = time.perf_counter()
+    driver.get(url)
+    loaded = time.perf_counter()
+    ready = wait_until_ready(driver, page_type, timeout)
+    done = time.perf_counter()
+    log.record(url, page_type, loaded - start, done - loaded, ready)
+    METRICS.observe('page_load_seconds', loaded - start, page_type=page_type)
+    METRICS.observe('page_ready_seconds', done - loaded, page_type=page_type)
+    if not ready:
+        METRICS.inc('page_ready_timeouts_total', page_type=page_type)
+    return driver.page_source
@@ -0,0 +1,151 @@
+"""
+Deferred retries and crawl-wide circuit breaker
+Failed URLs wait in a backoff queue instead of holding a worker thread, and
+the whole crawl pauses when too many recent attempts fail
+"""
+import heapq
+import random
+import threading
+import time
+from collections import deque
+from throttle import classify_failure
+from metrics import METRICS
+
+# ========== CONFIGURATION ==========
+RETRY_BASE_DELAY = 5.0      # Seconds before the first retry
+RETRY_MAX_DELAY = 120.0     # Cap on the backoff delay
+BREAKER_WINDOW = 50         # Most recent attempts the failure rate is measured over
+BREAKER_MIN_SAMPLES = 20    # Attempts needed before the breaker can trip
+BREAKER_THRESHOLD = 0.5     # Failure rate that trips the breaker
+BREAKER_PAUSE = 60.0        # Seconds the crawl pauses on a trip (doubles on repeats)
+BREAKER_MAX_PAUSE = 600.0
+
+# Failure kinds
+TIMEOUT = 'timeout'
+MISSING_TITLE = 'missing_title'
+PARSE_ERROR = 'parse_error'
+
+# Retrying these will not change the outcome
+NO_RETRY = {PARSE_ERROR, 'http_404', 'http_410'}
+
+class ScrapeFailure(Exception):
+    """A failed scrape attempt with its failure kind."""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+def failure_kind(exc, stage='fetch'):
+    """
+    Classify an exception: HTTP status, timeout, or missing title as the
+    throttle sees them, and any other extraction error as a parse error.
+    """
+    kind = classify_failure(exc)
+    if stage == 'extract' and kind == 'error':
+        return PARSE_ERROR
+    return kind
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff with jitter: half the delay is fixed, half random."""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+# ========== RETRY QUEUE ==========
+class RetryScheduler:
+    """
+    Thread-safe queue of (url, attempt) retries, ordered by due time.
+
+    `schedule()` is called when an attempt fails; `pop_due()` hands back one
+    retry whose backoff has elapsed, so the worker thread that failed is free
+    to take the next URL in the meantime.
+    """
+
+    def __init__(self, max_attempts, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._heap = []
+        self.scheduled = 0
+
+    def schedule(self, url, attempt, kind):
+        """Queue the next attempt; returns False when the URL should not be retried."""
+        if kind in NO_RETRY or attempt >= self.max_attempts:
+            return False
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        with self._lock:
+            heapq.heappush(self._heap, (time.monotonic() + delay, url, attempt + 1))
+            self.scheduled += 1
+        METRICS.inc('retries_total', kind=kind)
+        print(f"   ⚠️  Attempt {attempt} failed ({kind}), retrying in {delay:.0f}s")
+        return True
+
+    def pop_due(self):
+        """The next (url, attempt) whose delay has passed, or None."""
+        with self._lock:
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                _, url, attempt = heapq.heappop(self._heap)
+                return url, attempt
+        return None
+
+    def next_delay(self):
+        """Seconds until the next retry is due (None when the queue is empty)."""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+# ========== CIRCUIT BREAKER ==========
+class CircuitBreaker:
+    """
+    Pauses the crawl when the failure rate over the last BREAKER_WINDOW
+    attempts reaches BREAKER_THRESHOLD. Workers call `wait()` before each
+    attempt and block while the breaker is open; after the pause the window
+    starts empty again. Repeated trips double the pause.
+    """
+
+    def __init__(self, window=BREAKER_WINDOW, threshold=BREAKER_THRESHOLD, min_samples=BREAKER_MIN_SAMPLES, pause=BREAKER_PAUSE):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._base_pause = pause
+        self._pause = pause
+        self._open_until = 0.0
+        self._since_trip = 0
+        self.trips = 0
+
+    def record(self, ok):
+        with self._lock:
+            self._outcomes.append(ok)
+            self._since_trip = self._since_trip + 1 if ok else 0
+            # A full window of consecutive successes since the last trip resets the pause
+            if self._since_trip >= self._outcomes.maxlen:
+                self._pause = self._base_pause
+            if len(self._outcomes) < self.min_samples:
+                return
+            failure_rate = self._outcomes.count(False) / len(self._outcomes)
+            if failure_rate >= self.threshold and time.monotonic() >= self._open_until:
+                self._trip(failure_rate)
+
+    def _trip(self, failure_rate):
+        self._open_until = time.monotonic() + self._pause
+        self.trips += 1
+        METRICS.inc('breaker_trips_total')
+        print(f"\n🛑 Circuit breaker open: {failure_rate:.0%} of the last {len(self._outcomes)} attempts failed - pausing {self._pause:.0f}s\n")
+        self._pause = min(BREAKER_MAX_PAUSE, self._pause * 2)
+        self._outcomes.clear()
+        self._since_trip = 0
+
+    def wait(self):
+        """Block while the breaker is open."""
+        while True:
+            with self._lock:
+                remaining = self._open_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 1.0))
@@ -0,0 +1,175 @@
+"""
+Typed details loader
+Canonical dtypes for listing columns (categoricals, nullable small ints,
+float32 coordinates) and a loader that applies them, with a Feather cache next
+to each CSV so repeat loads skip CSV parsing
+"""
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from delta import DELISTED
+
+# ========== SCHEMA ==========
+SCHEMA_VERSION = 2  # Bump when DTYPES change (rebuilds every cache)
+
+TEXT = pd.StringDtype('pyarrow')
+DTYPES = {
+    'url': TEXT,
+    'property_id': TEXT,
+    'title': TEXT,
+    'price_php': 'Int32',
+    'bedrooms': 'Int8',
+    'bathrooms': 'Int8',
+    'floor_area_sqm': 'float32',
+    'location': TEXT,
+    'latitude': 'float32',
+    'longitude': 'float32',
+    'description': TEXT,
+    'furnishing': 'category',
+    'amenities': TEXT,
+    'scrape_status': 'category',
+    'title_preview': TEXT,
+    'location_preview': TEXT,
+    'price_preview': 'Int32',
+    'bedrooms_preview': 'Int8',
+    'bathrooms_preview': 'Int8',
+    'city': 'category',
+    'property_type': 'category',
+    'listing_status': 'category',
+    'delisted_runs': 'Int8',
+    'crawl_date': 'category',
+    'cluster_id': 'Int32',
+    'canonical_url': TEXT,
+    'is_canonical': 'boolean',
+}
+
+# Detail records merged with their link rows: the snippet side of a clashing column gets this suffix
+MERGE_SUFFIXES = ('', '_preview')
+
+# Files written before MERGE_SUFFIXES have pandas' default _x (details) / _y (snippet) suffixes
+COLUMN_RENAMES = {
+    'title_x': 'title',
+    'title_y': 'title_preview',
+    'location_x': 'location',
+    'location_y': 'location_preview',
+}
+
+CACHE_SUFFIX = '.feather'
+
+# ========== DTYPES ==========
+def resolve_columns(df):
+    """Rename merge-suffixed columns to their canonical names."""
+    return df.rename(columns={old: new for old, new in COLUMN_RENAMES.items() if old in df.columns and new not in df.columns})
+
+def _as_int(values, dtype):
+    """Nullable integers; values that are not whole or do not fit the type become NA."""
+    numbers = pd.to_numeric(values, errors='coerce').astype('float64')
+    info = np.iinfo(pd.api.types.pandas_dtype(dtype).numpy_dtype)
+    fits = numbers.between(info.min, info.max) & (numbers % 1 == 0)
+    return numbers.where(fits).astype(dtype)
+
+def apply_schema(df):
+    """Return `df` with canonical column names and DTYPES; other columns are left as they are."""
+    df = resolve_columns(df)
+    for name, dtype in DTYPES.items():
+        if name not in df.columns or df[name].dtype == dtype:
+            continue
+        values = df[name]
+        if dtype == 'category':
+            df[name] = values.astype('category')
+        elif dtype == 'float32':
+            df[name] = pd.to_numeric(values, errors='coerce').astype('float32')
+        elif dtype == 'boolean':
+            df[name] = values.map({True: True, False: False, 'True': True, 'False': False}).astype('boolean')
+        elif str(dtype).startswith('Int'):
+            df[name] = _as_int(values, dtype)
+        else:
+            df[name] = values.astype(dtype)
+    return df
+
+def read_csv(path):
+    """A details/links CSV with DTYPES applied (text columns are read as text, so ids keep their form)."""
+    header = pd.read_csv(path, nrows=0).columns
+    renamed = {old: new for old, new in COLUMN_RENAMES.items() if old in header}
+    text = {name: 'string' for name in header if DTYPES.get(renamed.get(name, name)) is TEXT}
+    return apply_schema(pd.read_csv(path, dtype=text, low_memory=False))
+
+# ========== CACHE ==========
+def cache_path(path):
+    """Feather cache of a CSV: same folder and name, CACHE_SUFFIX extension."""
+    return Path(path).with_suffix(CACHE_SUFFIX)
+
+def _source_stamp(path):
+    stat = Path(path).stat()
+    return {b'source_mtime_ns': str(stat.st_mtime_ns).encode(), b'source_size': str(stat.st_size).encode(),
+            b'schema_version': str(SCHEMA_VERSION).encode()}
+
+def _cache_is_fresh(path, cache):
+    """The cache was written from the current version of `path` with the current DTYPES."""
+    try:
+        with pa.memory_map(str(cache)) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return False
+    stamp = _source_stamp(path)
+    return all(metadata.get(key) == value for key, value in stamp.items())
+
+def _write_cache(df, path, cache):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **_source_stamp(path)})
+    tmp_path = cache.with_suffix(f'{CACHE_SUFFIX}.tmp')
+    feather.write_feather(table, str(tmp_path))
+    tmp_path.replace(cache)
+    return table
+
+# ========== LOADER ==========
+def _drop_delisted(df):
+    if 'listing_status' not in df.columns:
+        return df
+    return df[df['listing_status'].astype(object) != DELISTED].reset_index(drop=True)
+
+def load_details(path, columns=None, filters=None, use_cache=True, active_only=True):
+    """
+    Load details (or links) as a typed DataFrame.
+
+    `path` is the Parquet dataset directory (read with dataset.read_details)
+    or a CSV. A CSV is parsed once and saved as a Feather file next to it;
+    later loads read that file until the CSV's mtime or size changes.
+    `columns` and `filters` (pyarrow/DNF style, as in read_details) are
+    applied in the Arrow scan for both. With `active_only`, delisted rows
+    (listing_status='delisted') are left out.
+    """
+    path = Path(path)
+    if path.is_dir():
+        from dataset import read_details
+        return apply_schema(read_details(path, columns=columns, filters=filters, active_only=active_only))
+
+    cache = cache_path(path)
+    if use_cache and _cache_is_fresh(path, cache):
+        source = ds.dataset(str(cache), format='ipc')
+    else:
+        df = read_csv(path)
+        if not use_cache and columns is None and filters is None:
+            return _drop_delisted(df) if active_only else df
+        try:
+            table = _write_cache(df, path, cache) if use_cache else pa.Table.from_pandas(df, preserve_index=False)
+        except OSError as e:
+            print(f"   ⚠️  Could not write cache {cache}: {e}")
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        source = ds.dataset(table)
+    expression = pq.filters_to_expression(filters) if filters else None
+    read_columns = columns
+    if columns is not None and active_only and 'listing_status' in source.schema.names:
+        read_columns = list(dict.fromkeys(columns + ['listing_status']))
+    df = apply_schema(source.to_table(columns=read_columns, filter=expression).to_pandas())
+    if active_only:
+        df = _drop_delisted(df)
+    return df[columns] if columns is not None else df
+
+def memory_mb(df):
+    """Deep memory use of a DataFrame in MB."""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
@@ -4,16 +4,27 @@ Scrapes detailed information with resume capability
 """
 import pandas as pd
 import time
-import re
 import random
 import os
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from browser import DriverPool, create_driver
+from fetchers import build_fetcher
+from archive import open_archive
+from extraction import has_listing_title, require_listing_title, failed_record
+from parse_stage import ParseStage
+from throttle import save_throttle_logs, INITIAL_CONCURRENCY, INITIAL_RATE
+from readiness import READY_LOG
+from crawl_store import CrawlStore
+from delta import plan_delta, ACTIVE
+from dedup import cluster_snippets
+from dataset import append_to_dataset
+from schema import load_details, read_csv, MERGE_SUFFIXES
+from aggregates import update_aggregates
+from retry import RetryScheduler, CircuitBreaker, ScrapeFailure, failure_kind
+from metrics import METRICS, save_metrics, start_metrics_server
 
 # ========== CONFIGURATION ==========
 OUTPUT_PATH = 'C:/Users/anhpd/OneDrive/Desktop/projects/phillipine-rental-price/data'
@@ -21,249 +32,180 @@ LINKS_FILE = 'C:/Users/anhpd/OneDrive/Desktop/projects/phillipine-rental-price/d
 
 # Batch settings
 BATCH_SIZE = 100  # Process 100 at a time
-BATCH_START = 1   # Start from batch 0 (change this to resume)
+
+# Output: 'parquet' appends each batch to the partitioned dataset in DATASET_DIR,
+# 'csv' writes property_details_batch_NNN_*.csv files for combine_batches.py
+OUTPUT_FORMAT = 'parquet'
+DATASET_DIR = f"{OUTPUT_PATH}/property_details"
+CRAWL_DATE = datetime.now().strftime('%Y-%m-%d')  # Partition for this run, fixed at start
+AGGREGATES_FILE = f"{OUTPUT_PATH}/grid_aggregates.sqlite"  # Grid price statistics, updated after each run (parquet only)
+
+# Crawl state: finished URLs are skipped when the script is re-run on the same links file
+STATE_FILE = f"{OUTPUT_PATH}/crawl_state_{Path(LINKS_FILE).stem}.sqlite"
+MAX_URL_ATTEMPTS = 3  # Stop re-queueing a URL after this many failed runs
+
+# Delta mode: set to DATASET_DIR or the last property_details_combined_*.csv to only scrape new/changed listings
+PREVIOUS_COMBINED_FILE = None
+
+# Skip links whose search snippet repeats another link's field for field (dedup.cluster_snippets)
+SKIP_SNIPPET_DUPLICATES = False
 
 # Scraping settings
-MAX_WORKERS = 5 
+FETCH_ENGINE = 'http'  # 'http' (Selenium only as fallback) or 'selenium'
+MAX_WORKERS = 16  # Fetch (I/O) threads - upper bound; the adaptive throttle sets how many run at once
+PARSE_WORKERS = os.cpu_count() or 2  # Parser processes (default: one per core; 0 parses in the fetch thread)
 HEADLESS = True  
-PAGE_LOAD_WAIT = 3  
-RETRY_ATTEMPTS = 3  
+PAGE_READY_TIMEOUT = 10  # Max seconds to wait for the page content to appear
+RETRY_ATTEMPTS = 3  # Attempts per URL within a run; retries wait in a backoff queue
+MAX_PAGES_PER_DRIVER = 50  # Restart a browser after this many pages
+
+# Raw HTML archive for offline re-extraction (python archive.py re-extract <dir>); None disables it
+ARCHIVE_DIR = None
+
+# Long-lived drivers, fetcher and parser processes shared by all worker threads.
+# Built by setup() when a crawl starts, not at import: parse workers are spawned
+# and re-import this module
+DRIVER_POOL = None
+FETCHER = None
+PARSER = None
+
+# Failed URLs wait here with exponential backoff; the breaker pauses the crawl on a failure spike
+RETRIES = RetryScheduler(max_attempts=RETRY_ATTEMPTS)
+BREAKER = CircuitBreaker()
+
+# ========== SETUP ==========
+def setup():
+    """Build DRIVER_POOL, FETCHER and PARSER; any already set (e.g. by a benchmark) are kept."""
+    global DRIVER_POOL, FETCHER, PARSER
+    if DRIVER_POOL is None:
+        DRIVER_POOL = DriverPool(
+            size=MAX_WORKERS,
+            factory=partial(create_driver, headless=HEADLESS),
+            max_pages=MAX_PAGES_PER_DRIVER
+        )
+    if FETCHER is None:
+        FETCHER = build_fetcher(
+            FETCH_ENGINE, DRIVER_POOL, 'detail', has_listing_title, PAGE_READY_TIMEOUT,
+            archive=open_archive(ARCHIVE_DIR) if ARCHIVE_DIR else None,
+            # A page without a title usually means we are being served a block page
+            check=require_listing_title
+        )
+    if PARSER is None:
+        # Parsing runs in its own process pool so it does not hold the GIL for the fetch threads
+        PARSER = ParseStage(PARSE_WORKERS)
+
+def shutdown():
+    """Close whatever setup() built."""
+    if FETCHER is not None:
+        FETCHER.close()
+    if PARSER is not None:
+        PARSER.close()
+    if DRIVER_POOL is not None:
+        print(f"\n🌐 Browser launches: {DRIVER_POOL.launches} (recycled {DRIVER_POOL.recycles})")
 
 # ========== HELPER FUNCTIONS ==========
-def create_driver(headless=HEADLESS):
-    """Create a Chrome WebDriver with anti-detection settings."""
-    chrome_options = Options()
-    if headless:
-        chrome_options.add_argument('--headless=new')
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    chrome_options.add_experimental_option('useAutomationExtension', False)
+def scrape_property_details(url):
+    """Scrape detailed information from individual property page (one attempt, raises ScrapeFailure)."""
+    try:
+        page_source = FETCHER.fetch(url)
+    except Exception as e:
+        raise ScrapeFailure(failure_kind(e, 'fetch'), str(e)) from e
     
-    # Suppress logs
-    chrome_options.add_argument('--disable-quic')
-    chrome_options.add_argument('--log-level=3')
-    chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    try:
+        record = PARSER.detail(page_source, url)
+    except Exception as e:
+        raise ScrapeFailure(failure_kind(e, 'extract'), str(e)) from e
     
-    # User agent
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
-    chrome_options.add_argument(f'user-agent={user_agent}')
-    chrome_options.add_argument('--window-size=1920,1080')
+    title = record['title']
+    price = record['price_php']
+    latitude, longitude = record['latitude'], record['longitude']
+    title_preview = title[:40] if title else 'Unknown'
+    price_str = f"₱{price:,}" if price else 'N/A'
+    coord_str = f"({latitude:.4f},{longitude:.4f})" if latitude and longitude else 'No coords'
+    print(f"   ✅ {title_preview}... | {price_str} | {coord_str}")
     
-    driver = webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()),
-        options=chrome_options
-    )
+    return record
+
+def skip_snippet_duplicates(links_df):
+    """Drop links whose snippet exactly repeats an earlier link's (see dedup.cluster_snippets)."""
+    canonical = cluster_snippets(links_df)['is_canonical'].to_numpy()
+    print(f"🧬 Skipping {(~canonical).sum()} links that repeat another listing's snippet")
+    return links_df[canonical].reset_index(drop=True)
+
+def apply_delta(links_df, store):
+    """
+    Carry forward unchanged listings from the previous crawl and return the
+    links still to scrape. Carried URLs are marked done in `store` once
+    written, so a resumed run does not write them again.
+    """
+    print(f"🔁 Delta mode - previous dataset: {PREVIOUS_COMBINED_FILE}")
+    previous_df = load_details(PREVIOUS_COMBINED_FILE, active_only=False)  # Delisted rows count their runs
+    plan = plan_delta(links_df, previous_df)
     
-    driver.execute_cdp_cmd('Network.setUserAgentOverride', {
-        "userAgent": user_agent,
-        "platform": "Windows"
-    })
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    print(f"   New: {len(plan['new'])} | Changed: {len(plan['changed'])} | Unchanged: {len(plan['unchanged'])} | Delisted: {len(plan['delisted'])}")
     
-    return driver
-
-def scrape_property_details(url, attempt=1):
-    """Scrape detailed information from individual property page."""
+    # Saved with the batches so this crawl's output holds every current listing
+    carried_df = pd.concat([plan['unchanged'], plan['delisted']], ignore_index=True)
+    store.add_urls(carried_df['url'].tolist())
+    carried_df = carried_df[carried_df['url'].isin(store.todo_urls(carried_df['url'].tolist()))]
+    if not carried_df.empty:
+        carried_file = write_output(carried_df, 'carried')
+        store.mark_carried(carried_df['url'].tolist())
+        print(f"   💾 Carried forward: {carried_file}")
     
-    driver = None
-    try:
-        driver = create_driver()
-        driver.get(url)
-        time.sleep(PAGE_LOAD_WAIT)
-        
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        
-        # Extract title - if this fails, the page didn't load properly
-        title_elem = soup.find('div', class_='main-title')
-        title = title_elem.find('h1').get_text(strip=True) if title_elem and title_elem.find('h1') else None
-        
-        # If no title found, page didn't load properly
-        if not title:
-            raise Exception("No title found - page may not have loaded")
-        
-        # Extract price
-        price_elem = soup.find('div', class_='prices-and-fees__price', attrs={'data-test': 'listing-price'})
-        price_text = price_elem.get_text(strip=True) if price_elem else None
-        price = None
-        if price_text:
-            price_match = re.search(r'₱\s*([\d,]+)', price_text)
-            if price_match:
-                price = int(price_match.group(1).replace(',', ''))
-        
-        # Extract bedrooms
-        bedrooms_elem = soup.find('div', class_='details-item-value', attrs={'data-test': 'bedrooms-value'})
-        bedrooms_text = bedrooms_elem.get_text(strip=True) if bedrooms_elem else None
-        bedrooms = None
-        if bedrooms_text:
-            bed_match = re.search(r'(\d+)', bedrooms_text)
-            if bed_match:
-                bedrooms = int(bed_match.group(1))
-        
-        # Extract bathrooms
-        bathrooms_elem = soup.find('div', class_='details-item-value', attrs={'data-test': 'full-bathrooms-value'})
-        bathrooms_text = bathrooms_elem.get_text(strip=True) if bathrooms_elem else None
-        bathrooms = None
-        if bathrooms_text:
-            bath_match = re.search(r'(\d+)', bathrooms_text)
-            if bath_match:
-                bathrooms = int(bath_match.group(1))
-        
-        # Extract location
-        location_elem = soup.find('div', class_='view-map__text')
-        location = location_elem.get_text(strip=True) if location_elem else None
-        
-        # Extract description
-        desc_elem = soup.find('div', id='description-text', class_='content')
-        description = desc_elem.get_text(strip=True)[:500] if desc_elem else None
-        
-        # Extract furnishing status
-        furnishing = None
-        facilities_items = soup.find_all('div', class_='facilities__item')
-        for item in facilities_items:
-            text = item.get_text(strip=True).lower()
-            if 'furnished' in text:
-                furnishing = item.get_text(strip=True)
-                break
-        
-        # Extract amenities
-        amenities = []
-        for item in facilities_items:
-            amenity_text = item.get_text(strip=True)
-            if amenity_text and amenity_text not in ['Garage', 'Alarm']:
-                amenities.append(amenity_text)
-        amenities_str = ', '.join(amenities[:10]) if amenities else None
-        
-        # Extract floor area
-        floor_area = None
-        floor_items = soup.find_all('div', class_='details-item-value')
-        for item in floor_items:
-            text = item.get_text(strip=True)
-            if 'sqm' in text.lower() or 'm²' in text:
-                area_match = re.search(r'([\d,\.]+)\s*(?:sqm|m²)', text, re.I)
-                if area_match:
-                    floor_area = float(area_match.group(1).replace(',', ''))
-                    break
-        
-        # Extract coordinates
-        latitude = None
-        longitude = None
-        
-        scripts = soup.find_all('script')
-        for script in scripts:
-            if script.string:
-                lat_patterns = [
-                    r'["\']?lat(?:itude)?["\']?\s*[:=]\s*([\d\.\-]+)',
-                    r'lat:\s*([\d\.\-]+)',
-                    r'"lat":\s*([\d\.\-]+)',
-                ]
-                lng_patterns = [
-                    r'["\']?lon(?:g|gitude)?["\']?\s*[:=]\s*([\d\.\-]+)',
-                    r'lng:\s*([\d\.\-]+)',
-                    r'"lng":\s*([\d\.\-]+)',
-                ]
-                
-                for lat_pattern in lat_patterns:
-                    lat_match = re.search(lat_pattern, script.string, re.I)
-                    if lat_match:
-                        latitude = float(lat_match.group(1))
-                        break
-                
-                for lng_pattern in lng_patterns:
-                    lng_match = re.search(lng_pattern, script.string, re.I)
-                    if lng_match:
-                        longitude = float(lng_match.group(1))
-                        break
-                
-                if latitude and longitude:
-                    break
-        
-        if not latitude or not longitude:
-            map_elem = soup.find('div', id='map')
-            if map_elem:
-                latitude = map_elem.get('data-lat') or map_elem.get('data-latitude')
-                longitude = map_elem.get('data-lng') or map_elem.get('data-longitude')
-                if latitude:
-                    latitude = float(latitude)
-                if longitude:
-                    longitude = float(longitude)
-        
-        if not latitude or not longitude:
-            json_ld = soup.find('script', type='application/ld+json')
-            if json_ld:
-                try:
-                    import json
-                    data_json = json.loads(json_ld.string)
-                    if isinstance(data_json, dict):
-                        if '@graph' in data_json:
-                            for item in data_json['@graph']:
-                                if isinstance(item, dict) and 'geo' in item:
-                                    geo = item.get('geo', {})
-                                    latitude = float(geo.get('latitude')) if geo.get('latitude') else None
-                                    longitude = float(geo.get('longitude')) if geo.get('longitude') else None
-                                    if latitude and longitude:
-                                        break
-                        else:
-                            geo = data_json.get('geo', {})
-                            latitude = float(geo.get('latitude')) if geo.get('latitude') else None
-                            longitude = float(geo.get('longitude')) if geo.get('longitude') else None
-                except:
-                    pass
-        
-        # ADD THIS SUCCESS MESSAGE
-        title_preview = title[:40] if title else 'Unknown'
-        price_str = f"₱{price:,}" if price else 'N/A'
-        coord_str = f"({latitude:.4f},{longitude:.4f})" if latitude and longitude else 'No coords'
-        print(f"   ✅ {title_preview}... | {price_str} | {coord_str}")
+    to_scrape = pd.concat([plan['new'], plan['changed']])
+    return links_df.loc[to_scrape.index].reset_index(drop=True)
+
+def write_output(df, tag):
+    """Write detail rows in OUTPUT_FORMAT; returns where they went."""
+    if OUTPUT_FORMAT == 'parquet':
+        files = append_to_dataset(df, DATASET_DIR, crawl_date=CRAWL_DATE, tag=tag)
+        return f"{DATASET_DIR}/crawl_date={CRAWL_DATE} ({len(files)} files)"
+    output_file = f"{OUTPUT_PATH}/property_details_batch_{tag}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    df.to_csv(output_file, index=False, encoding='utf-8-sig')
+    return output_file
+
+def save_batch(details_list, batch_df, batch_num, store=None):
+    """
+    Merge scraped records with their link rows and write the batch; the
+    records' URLs are then marked done/failed in `store` (if given).
+    """
+    with METRICS.timer('batch_save_seconds', format=OUTPUT_FORMAT):
+        batch_details_df = pd.DataFrame(details_list)
+        batch_final_df = pd.merge(batch_details_df, batch_df, on='url', how='left', suffixes=MERGE_SUFFIXES)
+        batch_final_df['listing_status'] = ACTIVE
         
-        return {
-            'url': url,
-            'title': title,
-            'price_php': price,
-            'bedrooms': bedrooms,
-            'bathrooms': bathrooms,
-            'floor_area_sqm': floor_area,
-            'location': location,
-            'latitude': latitude,
-            'longitude': longitude,
-            'description': description,
-            'furnishing': furnishing,
-            'amenities': amenities_str,
-            'scrape_status': 'success'
-        }
-    
-    except Exception as e:
-        # Retry logic
-        if attempt < RETRY_ATTEMPTS:
-            print(f"   ⚠️  Attempt {attempt} failed, retrying... ({str(e)[:50]})")
-            if driver:
-                driver.quit()
-            time.sleep(3)
-            return scrape_property_details(url, attempt + 1)
-        else:
-            print(f"   ❌ Failed after {RETRY_ATTEMPTS} attempts: {str(e)[:50]}")
-            return {
-                'url': url,
-                'title': None,
-                'price_php': None,
-                'bedrooms': None,
-                'bathrooms': None,
-                'floor_area_sqm': None,
-                'location': None,
-                'latitude': None,
-                'longitude': None,
-                'description': None,
-                'furnishing': None,
-                'amenities': None,
-                'scrape_status': f'failed: {str(e)[:100]}'
-            }
-    finally:
-        if driver:
-            driver.quit()
+        batch_file = write_output(batch_final_df, f'{batch_num:03d}')
+    METRICS.inc('rows_saved_total', len(batch_final_df), format=OUTPUT_FORMAT)
+    if store is not None:
+        store.mark_saved(details_list)
+    return batch_final_df, batch_file
 
+def scrape_and_record(store, url, attempt=1):
+    """
+    Scrape one URL, marking it in_progress in the crawl store.
+    Returns the record, or None when the failure was deferred to RETRIES.
+    The URL is finished in the store by save_batch once its record is written.
+    """
+    BREAKER.wait()
+    store.mark_started(url)
+    try:
+        result = scrape_property_details(url)
+    except ScrapeFailure as e:
+        BREAKER.record(False)
+        METRICS.inc('detail_attempts_total', outcome='failure')
+        METRICS.inc('detail_failures_total', reason=e.kind)
+        if RETRIES.schedule(url, attempt, e.kind):
+            return None
+        print(f"   ❌ Failed after {attempt} attempt(s) ({e.kind}): {str(e)[:50]}")
+        result = failed_record(url, f'failed ({e.kind}): {str(e)[:100]}')
+        METRICS.inc('detail_pages_total', outcome='failure')
+        return result
+    BREAKER.record(True)
+    METRICS.inc('detail_attempts_total', outcome='success')
+    METRICS.inc('detail_pages_total', outcome='success')
+    return result
 
-# ========== MAIN EXECUTION ==========
 # ========== MAIN EXECUTION ==========
 def main():
     """Main batch scraping workflow with parallel execution."""
@@ -274,7 +216,7 @@ def main():
     # Load links file
     print(f"\n📂 Loading links from: {LINKS_FILE}")
     try:
-        links_df = pd.read_csv(LINKS_FILE)
+        links_df = read_csv(LINKS_FILE)
         print(f"✅ Loaded {len(links_df)} property links\n")
     except Exception as e:
         print(f"❌ Error loading file: {e}")
@@ -285,6 +227,25 @@ def main():
     links_df = links_df.sample(frac=1, random_state=42).reset_index(drop=True)
     print("✅ Properties randomized\n")
     
+    # Skip URLs already finished in a previous run of this links file
+    store = CrawlStore(STATE_FILE)
+    
+    # Delta mode: only new and changed listings are scraped
+    if PREVIOUS_COMBINED_FILE:
+        links_df = apply_delta(links_df, store)
+        print()
+    
+    if SKIP_SNIPPET_DUPLICATES:
+        links_df = skip_snippet_duplicates(links_df)
+        print()
+    
+    new_urls = store.add_urls(links_df['url'].tolist())
+    todo_urls = set(store.todo_urls(links_df['url'].tolist(), MAX_URL_ATTEMPTS))
+    counts = store.counts()
+    print(f"🗄️  Crawl state: {STATE_FILE}")
+    print(f"   New: {new_urls} | Done: {counts.get('done', 0)} | Failed: {counts.get('failed', 0)} | To scrape: {len(todo_urls)}\n")
+    links_df = links_df[links_df['url'].isin(todo_urls)].reset_index(drop=True)
+    
     # Calculate batches
     total_properties = len(links_df)
     total_batches = (total_properties // BATCH_SIZE) + (1 if total_properties % BATCH_SIZE else 0)
@@ -293,16 +254,13 @@ def main():
     print(f"   Total properties: {total_properties}")
     print(f"   Batch size: {BATCH_SIZE}")
     print(f"   Total batches: {total_batches}")
-    print(f"   Starting from batch: {BATCH_START}")
-    print(f"   Parallel workers: {MAX_WORKERS}")
-    print(f"   Estimated time per batch: ~{BATCH_SIZE * PAGE_LOAD_WAIT / 60 / MAX_WORKERS:.1f} minutes")
-    print(f"   Estimated total time: ~{(total_batches - BATCH_START) * BATCH_SIZE * PAGE_LOAD_WAIT / 3600 / MAX_WORKERS:.1f} hours\n")
-    
-    # Track all failed URLs across batches
-    all_failed_urls = []
+    setup()
+    print(f"   Fetch threads: {MAX_WORKERS} (adaptive concurrency starts at {INITIAL_CONCURRENCY}, {INITIAL_RATE:.1f} req/s)")
+    print(f"   Parse processes: {PARSE_WORKERS or 'inline'}")
+    print(f"   Fetch engine: {FETCHER.name}\n")
     
     # Process batches
-    for batch_num in range(BATCH_START, total_batches):
+    for batch_num in range(total_batches):
         print("\n" + "=" * 70)
         print(f"BATCH {batch_num + 1}/{total_batches}")
         print("=" * 70)
@@ -322,69 +280,47 @@ def main():
         details_list = []
         
         # ========== PARALLEL EXECUTION WITH ThreadPoolExecutor ==========
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             # Submit all URLs to the thread pool
-            future_to_url = {executor.submit(scrape_property_details, url): url for url in urls_to_scrape}
+            future_to_url = {executor.submit(scrape_and_record, store, url): url for url in urls_to_scrape}
             
             completed = 0
-            # Process results as they complete
-            for future in as_completed(future_to_url):
-                url = future_to_url[future]
-                completed += 1
+            # Process results as they complete; failed attempts come back through RETRIES
+            while future_to_url or len(RETRIES):
+                due = RETRIES.pop_due()
+                while due is not None:
+                    url, attempt = due
+                    future_to_url[executor.submit(scrape_and_record, store, url, attempt)] = url
+                    due = RETRIES.pop_due()
+                
+                if not future_to_url:
+                    time.sleep(RETRIES.next_delay() or 0)
+                    continue
+                done, _ = wait(future_to_url, timeout=RETRIES.next_delay(), return_when=FIRST_COMPLETED)
                 
-                try:
-                    result = future.result()
+                for future in done:
+                    url = future_to_url.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"   ❌ Exception for {url}: {str(e)[:50]}")
+                        result = failed_record(url, f'exception: {str(e)[:100]}')
+                    if result is None:
+                        continue  # Deferred retry
                     details_list.append(result)
+                    completed += 1
                     
-                    # Track failed URLs
-                    if result['scrape_status'] != 'success':
-                        all_failed_urls.append(url)
-                        
-                except Exception as e:
-                    print(f"   ❌ Exception for {url}: {str(e)[:50]}")
-                    all_failed_urls.append(url)
-                    # Add failed entry
-                    details_list.append({
-                        'url': url,
-                        'title': None,
-                        'price_php': None,
-                        'bedrooms': None,
-                        'bathrooms': None,
-                        'floor_area_sqm': None,
-                        'location': None,
-                        'latitude': None,
-                        'longitude': None,
-                        'description': None,
-                        'furnishing': None,
-                        'amenities': None,
-                        'scrape_status': f'exception: {str(e)[:100]}'
-                    })
-                
-                # Progress update every 10 completions
-                if completed % 10 == 0:
-                    elapsed = time.time() - batch_start_time
-                    rate = completed / elapsed * 60  # properties per minute
-                    remaining = len(urls_to_scrape) - completed
-                    eta = remaining / rate if rate > 0 else 0
-                    print(f"   ⏱️  Progress: {completed}/{len(urls_to_scrape)} | Rate: {rate:.1f}/min | ETA: {eta:.1f}m")
+                    # Progress update every 10 completions
+                    if completed % 10 == 0:
+                        elapsed = time.time() - batch_start_time
+                        rate = completed / elapsed * 60  # properties per minute
+                        remaining = len(urls_to_scrape) - completed
+                        eta = remaining / rate if rate > 0 else 0
+                        print(f"   ⏱️  Progress: {completed}/{len(urls_to_scrape)} | Rate: {rate:.1f}/min | ETA: {eta:.1f}m | Retry queue: {len(RETRIES)}")
         # ================================================================
         
-        # Save batch results
-        batch_details_df = pd.DataFrame(details_list)
-        batch_final_df = pd.merge(batch_details_df, batch_df, on='url', how='left')
-        
-        # Save batch file
-        batch_file = f"{OUTPUT_PATH}/property_details_batch_{batch_num:03d}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        batch_final_df.to_csv(batch_file, index=False, encoding='utf-8-sig')
-        
-        # Save failed URLs from this batch
-        batch_failed = batch_final_df[batch_final_df['scrape_status'] != 'success']
-        if not batch_failed.empty:
-            failed_batch_file = f"{OUTPUT_PATH}/failed_urls_batch_{batch_num:03d}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            batch_failed[['url', 'scrape_status']].to_csv(failed_batch_file, index=False, encoding='utf-8-sig')
-            print(f"   💾 Failed URLs saved: {failed_batch_file}")
+        # Save batch results; only now are its URLs marked finished, so a crash mid-batch re-scrapes them
+        batch_final_df, batch_file = save_batch(details_list, batch_df, batch_num, store)
         
         # Batch summary
         successful = len(batch_final_df[batch_final_df['scrape_status'] == 'success'])
@@ -399,28 +335,38 @@ def main():
         print(f"   Time: {batch_elapsed/60:.1f} minutes")
         print(f"   Actual rate: {actual_rate:.1f} properties/min")
         print(f"   Saved: {batch_file}")
-        
-        # Take a break between batches (except for last batch)
-        if batch_num < total_batches - 1:
-            break_time = random.uniform(30, 60)
-            print(f"\n⏸️  Taking a {break_time/60:.1f} minute break before next batch...")
-            time.sleep(break_time)
     
-    # Save consolidated list of ALL failed URLs
-    if all_failed_urls:
-        failed_urls_file = f"{OUTPUT_PATH}/failed_urls_all_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        failed_df = pd.DataFrame({'url': all_failed_urls})
-        failed_df = failed_df.drop_duplicates().reset_index(drop=True)
-        failed_df.to_csv(failed_urls_file, index=False, encoding='utf-8-sig')
-        print(f"\n💾 ALL FAILED URLs saved: {failed_urls_file}")
-        print(f"   Total failed: {len(failed_df)}")
+    # Failed URLs stay in the crawl store and are re-queued on the next run
+    counts = store.counts()
+    failures = store.failures()
+    store.close()
+    print(f"\n🗄️  Crawl state: Done {counts.get('done', 0)} | Failed {counts.get('failed', 0)} | Pending {counts.get('pending', 0)}")
+    print(f"🔁 Retries scheduled: {RETRIES.scheduled} | Circuit breaker trips: {BREAKER.trips}")
+    if OUTPUT_FORMAT == 'parquet' and AGGREGATES_FILE:
+        update_aggregates(AGGREGATES_FILE, DATASET_DIR)
     
     print("\n" + "=" * 70)
     print("✅ ALL BATCHES COMPLETE!")
     print("=" * 70)
     print("\nNext steps:")
-    print("1. Combine batches: python combine_batches.py")
-    print("2. Re-scrape failed: python rescrape_failed.py")
+    if OUTPUT_FORMAT == 'parquet':
+        print(f"1. Load the dataset: dataset.read_details('{DATASET_DIR}')")
+    else:
+        print("1. Combine batches: python combine_batches.py")
+    if not failures.empty:
+        retryable = int((failures['attempts'] < MAX_URL_ATTEMPTS).sum())
+        print(f"2. Retry {retryable} failed URLs: re-run python scrape_details.py")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    start_metrics_server()
+    try:
+        main()
+    finally:
+        shutdown()
+        if READY_LOG.records:
+            timings_file = f"{OUTPUT_PATH}/page_timings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            READY_LOG.save(timings_file)
+            READY_LOG.print_summary()
+            print(f"💾 Page timings saved: {timings_file}")
+        save_throttle_logs(OUTPUT_PATH)
+        save_metrics(OUTPUT_PATH)
\ No newline at end of file
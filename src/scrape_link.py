@@ -4,16 +4,20 @@ Scrapes property listing URLs from search pages
 """
 import pandas as pd
 import time
-import re
-import random
+import math
 import concurrent.futures
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
+from functools import partial
+from urllib.parse import urlencode
+from browser import DriverPool, create_driver
+from fetchers import build_fetcher
+from archive import open_archive
+from extraction import parse_search_page, has_property_snippets
+from schema import load_details
+from retry import backoff_delay
+from readiness import READY_LOG
+from throttle import save_throttle_logs
+from metrics import save_metrics, start_metrics_server
 
 # ========== CONFIGURATION ==========
 CITIES = [
@@ -33,185 +37,255 @@ PROPERTY_TYPES = [
 
 REGION = 'metro-manila'
 OUTPUT_PATH = 'C:/Users/anhpd/OneDrive/Desktop/projects/phillipine-rental-price/data'
-MAX_WORKERS = 3
+FETCH_ENGINE = 'http'  # 'http' (Selenium only as fallback) or 'selenium'
+MAX_WORKERS = 8  # Upper bound; the adaptive throttle sets how many run at once
 HEADLESS = True
-PAGE_LOAD_WAIT = 5
+PAGE_READY_TIMEOUT = 15  # Max seconds to wait for the page content to appear
+MAX_PAGES_PER_DRIVER = 50  # Restart a browser after this many pages
 
-# ========== HELPER FUNCTIONS ==========
-def create_driver(headless=HEADLESS):
-    """Create a Chrome WebDriver with anti-detection settings."""
-    chrome_options = Options()
-    if headless:
-        chrome_options.add_argument('--headless=new')
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    chrome_options.add_experimental_option('useAutomationExtension', False)
-    
-    # Suppress QUIC errors
-    chrome_options.add_argument('--disable-quic')
-    chrome_options.add_argument('--log-level=3')
-    chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
-    
-    # User agent
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
-    chrome_options.add_argument(f'user-agent={user_agent}')
-    chrome_options.add_argument('--window-size=1920,1080')
-    
-    driver = webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()),
-        options=chrome_options
-    )
-    
-    # Execute CDP commands
-    driver.execute_cdp_cmd('Network.setUserAgentOverride', {
-        "userAgent": user_agent,
-        "platform": "Windows"
-    })
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-    
-    return driver
+# Pagination planner (see PagePlan)
+SORT_PARAMS = {}  # Query parameters that list newest first (check against a saved search page first); {} keeps the site's order and never stops at known listings
+PREVIOUS_LINKS_FILE = None  # Last property_links_raw_*.csv: stop a city/type once a full page holds only known property_ids
+KNOWN_PAGES_TO_STOP = 1  # Full all-known pages in a row before stopping (raise if promoted listings break the order)
+PAGE_WINDOW = 2  # Pages per city/type in flight at once (at most this many are wasted after a stop)
+PAGE_ATTEMPTS = 3  # Fetches per search page (with retry backoff) before its city/type stops
+KNOWN_STOP = 'only known listings'
+FAILED_STOP = 'fetch failed'
 
-def extract_links_from_soup(soup, city, prop_type):
-    """Extract property links from search results page."""
-    property_data = []
-    
-    # Find all property listing containers
-    snippets = soup.find_all('div', class_='snippet')
-    print(f"   Found {len(snippets)} property snippets")
-    
-    for snippet in snippets:
-        # Get property link
-        link_elem = snippet.find('a', href=re.compile(r'/property/'))
-        if not link_elem:
-            continue
-        
-        href = link_elem.get('href')
-        if href.startswith('/'):
-            href = f'https://www.lamudi.com.ph{href}'
-        
-        # Get property ID from data attributes
-        prop_id = snippet.get('data-idanuncio') or snippet.get('data-alternateid')
-        
-        # Get title
-        title_elem = snippet.find('span', class_='snippet__content__title')
-        title = title_elem.get_text(strip=True) if title_elem else None
-        
-        # Get location
-        location_elem = snippet.find('span', attrs={'data-test': 'snippet-content-location'})
-        location = location_elem.get_text(strip=True) if location_elem else None
-        
-        # Get price
-        price_elem = snippet.find('div', class_='snippet__content__price')
-        price_text = price_elem.get_text(strip=True) if price_elem else None
-        
-        # Extract numeric price
-        price = None
-        if price_text:
-            price_match = re.search(r'₱\s*([\d,]+)', price_text)
-            if price_match:
-                price = int(price_match.group(1).replace(',', ''))
-        
-        # Get bedrooms
-        bedrooms_elem = snippet.find('span', class_='bedrooms', attrs={'data-test': 'bedrooms-value'})
-        bedrooms = bedrooms_elem.get_text(strip=True) if bedrooms_elem else None
-        
-        # Get bathrooms
-        bathrooms_elem = snippet.find('span', class_='bathrooms', attrs={'data-test': 'full-bathrooms-value'})
-        bathrooms = bathrooms_elem.get_text(strip=True) if bathrooms_elem else None
-        
-        property_data.append({
-            'property_id': prop_id,
-            'url': href,
-            'title': title,
-            'location': location,
-            'price_preview': price,
-            'bedrooms_preview': bedrooms,
-            'bathrooms_preview': bathrooms,
-            'city': city,
-            'property_type': prop_type
-        })
-    
-    return pd.DataFrame(property_data)
+# Raw HTML archive for offline re-extraction (python archive.py re-extract <dir>); None disables it
+ARCHIVE_DIR = None
 
-def get_page_range(city, prop_type):
-    """Detect pagination range for a city/property combination."""
+# Long-lived drivers and fetcher shared by all worker threads; built by setup()
+# when a crawl starts, not at import (parse workers re-import this module)
+DRIVER_POOL = None
+FETCHER = None
+
+# ========== SETUP ==========
+def setup():
+    """Build DRIVER_POOL and FETCHER; any already set (e.g. by a benchmark) are kept."""
+    global DRIVER_POOL, FETCHER
+    if DRIVER_POOL is None:
+        DRIVER_POOL = DriverPool(
+            size=MAX_WORKERS,
+            factory=partial(create_driver, headless=HEADLESS),
+            max_pages=MAX_PAGES_PER_DRIVER
+        )
+    if FETCHER is None:
+        FETCHER = build_fetcher(
+            FETCH_ENGINE, DRIVER_POOL, 'search', has_property_snippets, PAGE_READY_TIMEOUT,
+            archive=open_archive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+        )
+
+def shutdown():
+    """Close whatever setup() built."""
+    if FETCHER is not None:
+        FETCHER.close()
+    if DRIVER_POOL is not None:
+        print(f"\n🌐 Browser launches: {DRIVER_POOL.launches} (recycled {DRIVER_POOL.recycles})")
+
+# ========== HELPER FUNCTIONS ==========
+def search_url(city, prop_type, page_number=1):
+    """Search results URL for a city/property type page, in SORT_PARAMS order."""
     url = f'https://www.lamudi.com.ph/rent/{REGION}/{city}/{prop_type}/'
-    print(f"🔍 Detecting page range: {city}/{prop_type}")
-    
-    driver = None
+    params = dict(SORT_PARAMS)
+    if page_number != 1:
+        params['page'] = page_number
+    return f'{url}?{urlencode(params)}' if params else url
+
+def fetch_search_page(city, prop_type, page_number=1):
+    """Fetch and parse one search page (see extraction.parse_search_page); None when it failed."""
     try:
-        driver = create_driver()
-        driver.get(url)
-        time.sleep(PAGE_LOAD_WAIT)
-        
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        
-        # Look for pagination text: "Page 1 of 41"
-        pagination_div = soup.find('div', class_='pagination__pages')
-        
-        if pagination_div:
-            sort_text = pagination_div.find('div', class_='sort-text')
-            if sort_text:
-                text = sort_text.get_text(strip=True)
-                # Extract max page from "Page 1 of 41"
-                match = re.search(r'Page\s+\d+\s+of\s+(\d+)', text, re.I)
-                if match:
-                    max_page = int(match.group(1))
-                    print(f"   ✅ Pages: 1 to {max_page}")
-                    return (1, max_page)
-        
-        # Fallback: Look for any text matching "Page X of Y"
-        page_text = soup.find(text=re.compile(r'Page\s+\d+\s+of\s+\d+', re.I))
-        if page_text:
-            match = re.search(r'Page\s+\d+\s+of\s+(\d+)', page_text, re.I)
-            if match:
-                max_page = int(match.group(1))
-                print(f"   ✅ Pages: 1 to {max_page}")
-                return (1, max_page)
-        
-        print(f"   ℹ️  No pagination found - single page only")
-        return (1, 1)
-    
+        return parse_search_page(FETCHER.fetch(search_url(city, prop_type, page_number)), city, prop_type)
     except Exception as e:
-        print(f"   ❌ Error: {e}")
-        return (1, 1)
-    finally:
-        if driver:
-            driver.quit()
+        print(f"   ❌ Error: {city}/{prop_type} page {page_number}: {e}")
+        return None
 
-def scrape_links_from_page(city, prop_type, page_number):
-    """Scrape property links from a single search results page."""
-    if page_number == 1:
-        url = f'https://www.lamudi.com.ph/rent/{REGION}/{city}/{prop_type}/'
-    else:
-        url = f'https://www.lamudi.com.ph/rent/{REGION}/{city}/{prop_type}/?page={page_number}'
-    
-    print(f"🚀 Scraping: {city}/{prop_type} - Page {page_number}")
-    
-    driver = None
-    try:
-        driver = create_driver()
-        driver.get(url)
-        time.sleep(PAGE_LOAD_WAIT)
-        
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        df = extract_links_from_soup(soup, city, prop_type)
-        
-        if not df.empty:
-            print(f"   ✅ Found {len(df)} properties")
-            return df
+def fetch_search_page_later(delay, city, prop_type, page_number=1):
+    """fetch_search_page after waiting `delay` seconds (a retry's backoff)."""
+    time.sleep(delay)
+    return fetch_search_page(city, prop_type, page_number)
+
+# ========== PAGINATION PLANNER ==========
+class PagePlan:
+    """
+    Search pages of one city/type still worth fetching, built from the probe
+    (page 1) and updated with every page that comes back.
+
+    The probe's snippet count is the page size. Its "Page 1 of N" is the
+    last page; without pagination, the listing count is used instead.
+    Pages are handed out in order. The plan stops at an empty or
+    out-of-range page, which happens when the listing shrank after the
+    probe. When results are newest first and known ids are given, it also
+    stops after KNOWN_PAGES_TO_STOP full pages in a row that hold only
+    known property_ids. A page that still fails after PAGE_ATTEMPTS (the
+    probe too, given as None) stops the plan with FAILED_STOP.
+    """
+
+    def __init__(self, city, prop_type, probe, known_ids=None):
+        self.city = city
+        self.prop_type = prop_type
+        self.known_ids = known_ids if known_ids and SORT_PARAMS else None
+        self.next_page = 2
+        self.in_flight = 0
+        self.fetched = 0
+        self.failed = 0
+        self.known_streak = 0
+        self.stop_reason = None
+        self.stop_page = None
+        if probe is None:
+            # Nothing is known about the pages: stopping lets carry_forward keep the previous links
+            self.page_size = 0
+            self.listing_count = None
+            self.last_page = self.planned = 1
+            self.record(1, None)
+            return
+        self.page_size = probe['snippet_count']
+        self.listing_count = probe['listing_count']
+        if probe['max_page']:
+            self.last_page = probe['max_page']
+        elif self.listing_count and self.page_size:
+            self.last_page = math.ceil(self.listing_count / self.page_size)
         else:
-            print(f"   ⚠️  No properties found")
-            return pd.DataFrame()
-    
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
-        return pd.DataFrame()
-    finally:
-        if driver:
-            driver.quit()
+            self.last_page = 1
+        self.planned = self.last_page
+        self.record(1, probe)
+
+    @property
+    def done(self):
+        return self.stop_reason is not None or self.next_page > self.last_page
+
+    def next(self):
+        """Next page number to fetch, or None when the plan is finished."""
+        if self.done:
+            return None
+        page_number = self.next_page
+        self.next_page += 1
+        self.in_flight += 1
+        return page_number
+
+    def _stop(self, page_number, reason):
+        if self.stop_reason is None:
+            self.stop_reason = reason
+            self.stop_page = page_number
+
+    def record(self, page_number, page):
+        """Update the plan with a fetched page (None when it failed every attempt: the plan stops)."""
+        if page_number > 1:
+            self.in_flight -= 1
+        if page is None:
+            self.failed += 1
+            self._stop(page_number, FAILED_STOP)
+            return
+        self.fetched += 1
+        if page['empty'] or not page['snippet_count']:
+            self.last_page = min(self.last_page, page_number - 1)
+            self._stop(page_number, 'empty page')
+            return
+        if page['page'] is not None and page['page'] != page_number:
+            # Past the end the site serves another page (usually the last) instead
+            self.last_page = min(self.last_page, page['page'])
+            self._stop(page_number, f"past the last page ({page['page']})")
+            return
+        if page['max_page'] and page['max_page'] < self.last_page:
+            self.last_page = page['max_page']  # Listings were removed since the probe
+        if self.known_ids is not None and page['snippet_count'] >= self.page_size:
+            ids = [record['property_id'] for record in page['records']]
+            if ids and all(property_id in self.known_ids for property_id in ids):
+                self.known_streak += 1
+                if self.known_streak >= KNOWN_PAGES_TO_STOP:
+                    self._stop(page_number, KNOWN_STOP)
+            else:
+                self.known_streak = 0
+
+    @property
+    def skipped(self):
+        """Pages of the probe's range that were never fetched (failed ones included)."""
+        return max(0, self.planned - self.fetched)
+
+    @property
+    def probe_failed(self):
+        return self.stop_reason == FAILED_STOP and self.stop_page == 1
+
+def crawl_search(city_types, known_ids=None, max_workers=MAX_WORKERS, window=PAGE_WINDOW, plans=None):
+    """
+    Crawl the search pages of every city/type and yield each page's links
+    as a DataFrame.
+
+    All probes start at once. As each probe comes back, its PagePlan keeps
+    up to `window` pages of that city/type in flight. A plan that stops
+    therefore wastes at most `window` fetches. A failed page is fetched
+    again after the retry backoff, up to PAGE_ATTEMPTS times. Plans are
+    appended to `plans` when a list is given.
+    """
+    plans = [] if plans is None else plans
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_search_page, city, prop_type): ((city, prop_type), 1, 1)
+            for city, prop_type in city_types
+        }
+        while futures:
+            finished, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                key, page_number, attempt = futures.pop(future)
+                page = future.result()
+                retry = page_number == 1 or key.stop_reason is None  # A stopped plan needs no more pages
+                if page is None and retry and attempt < PAGE_ATTEMPTS:
+                    city, prop_type = key if page_number == 1 else (key.city, key.prop_type)
+                    delay = backoff_delay(attempt)
+                    print(f"   🔁 {city}/{prop_type} page {page_number}: retrying in {delay:.0f}s (attempt {attempt + 1} of {PAGE_ATTEMPTS})")
+                    futures[executor.submit(fetch_search_page_later, delay, city, prop_type, page_number)] = (key, page_number, attempt + 1)
+                    continue
+                if page_number == 1:
+                    stopped = False
+                    plan = PagePlan(*key, page, known_ids)
+                    plans.append(plan)
+                    if page is not None:
+                        count = f" | {plan.listing_count} listings" if plan.listing_count else ''
+                        print(f"🔍 {plan.city}/{plan.prop_type}: {page['snippet_count']} per page | pages 1 to {plan.planned}{count}")
+                else:
+                    plan = key
+                    stopped = plan.stop_reason is not None
+                    plan.record(page_number, page)
+                    if page is not None:
+                        print(f"   ✅ {plan.city}/{plan.prop_type} page {page_number}: {len(page['records'])} properties")
+                if plan.stop_reason is not None and not stopped:
+                    print(f"   ⏹️  {plan.city}/{plan.prop_type}: stopped at page {plan.stop_page} of {plan.planned} ({plan.stop_reason})")
+                if page is not None and page['records']:
+                    yield pd.DataFrame(page['records'])
+                while plan.in_flight < window:
+                    next_page = plan.next()
+                    if next_page is None:
+                        break
+                    futures[executor.submit(fetch_search_page, plan.city, plan.prop_type, next_page)] = (plan, next_page, 1)
+
+    if plans:
+        planned = sum(plan.planned for plan in plans)
+        fetched = sum(plan.fetched for plan in plans)
+        stopped = sum(plan.stop_reason is not None for plan in plans)
+        failed = sum(plan.failed for plan in plans)
+        probes_failed = sum(plan.probe_failed for plan in plans)
+        print(f"\n📑 Search pages: fetched {fetched} of {planned} | {stopped} city/types stopped early | "
+              f"skipped {sum(plan.skipped for plan in plans)} ({failed} failed after {PAGE_ATTEMPTS} attempts, "
+              f"{probes_failed} of them probes)")
+
+def carry_forward(links_df, previous_df, plans):
+    """
+    Add previous links that were not seen again, for city/types that stopped
+    at known listings or at a page that failed to load (the probe included).
+    Their pages were skipped, not emptied. Without these rows, delta mode
+    would count those listings as delisted.
+    """
+    stopped = {(plan.city, plan.prop_type) for plan in plans if plan.stop_reason in (KNOWN_STOP, FAILED_STOP)}
+    if previous_df is None or not stopped:
+        return links_df
+    in_stopped = pd.Series(
+        [key in stopped for key in zip(previous_df['city'].astype(str), previous_df['property_type'].astype(str))],
+        index=previous_df.index
+    )
+    carried = previous_df[in_stopped & ~previous_df['url'].isin(links_df['url'])]
+    print(f"🔁 Carried forward {len(carried)} known links from pages skipped after early termination")
+    columns = [name for name in links_df.columns if name in carried.columns]
+    return pd.concat([links_df, carried[columns].astype(object)], ignore_index=True)
 
 # ========== MAIN EXECUTION ==========
 def main():
@@ -222,29 +296,22 @@ def main():
     print(f"\n📍 Cities: {', '.join(CITIES)}")
     print(f"🏢 Types: {', '.join(PROPERTY_TYPES)}\n")
     
+    setup()
     start_time = time.time()
     
-    # Detect page ranges
-    task_ranges = {}
-    for city in CITIES:
-        for prop_type in PROPERTY_TYPES:
-            min_page, max_page = get_page_range(city, prop_type)
-            task_ranges[(city, prop_type)] = (min_page, max_page)
-            time.sleep(2)
-    
-    # Create task list
-    tasks = []
-    for (city, prop_type), (min_page, max_page) in task_ranges.items():
-        for page_num in range(min_page, max_page + 1):
-            tasks.append((city, prop_type, page_num))
+    # Refresh crawl: listings from the last links file let a city/type stop at the first all-known page
+    previous_df = None
+    known_ids = None
+    if PREVIOUS_LINKS_FILE:
+        previous_df = load_details(PREVIOUS_LINKS_FILE)
+        known_ids = set(previous_df['property_id'].dropna().astype(str))
+        print(f"🔁 Known listings: {len(known_ids)} from {PREVIOUS_LINKS_FILE}"
+              f"{'' if SORT_PARAMS else ' (no early stop: SORT_PARAMS is empty)'}\n")
     
-    random.shuffle(tasks)
-    print(f"\n📋 Total tasks: {len(tasks)}\n")
-    
-    # Execute scraping
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        results = executor.map(lambda p: scrape_links_from_page(*p), tasks)
-        df_list = [df for df in results if df is not None and not df.empty]
+    # Probe every city/type concurrently; each probe plans its own pages (page 1 links come from the probe itself)
+    plans = []
+    city_types = [(city, prop_type) for city in CITIES for prop_type in PROPERTY_TYPES]
+    df_list = list(crawl_search(city_types, known_ids, plans=plans))
     
     # Combine results
     if df_list:
@@ -252,6 +319,7 @@ def main():
         links_df = links_df.drop_duplicates(subset=['url']).reset_index(drop=True)
         
         print(f"\n✅ Total unique properties: {len(links_df)}")
+        links_df = carry_forward(links_df, previous_df, plans)
         
         # Save links
         links_file = f"{OUTPUT_PATH}/property_links_raw_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -275,4 +343,15 @@ def main():
     print("=" * 70)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    start_metrics_server()
+    try:
+        main()
+    finally:
+        shutdown()
+        if READY_LOG.records:
+            timings_file = f"{OUTPUT_PATH}/page_timings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            READY_LOG.save(timings_file)
+            READY_LOG.print_summary()
+            print(f"💾 Page timings saved: {timings_file}")
+        save_throttle_logs(OUTPUT_PATH)
+        save_metrics(OUTPUT_PATH)
\ No newline at end of file
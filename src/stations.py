@@ -0,0 +1,203 @@
+"""
+Train station data from OpenStreetMap
+Fetches each line's relation and all of its member nodes in bulk /nodes
+calls, with an on-disk cache revalidated by ETag once its TTL has passed
+"""
+import hashlib
+import json
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+import requests
+from config import TRAIN_LINES, OSM_CACHE_DIR
+
+# ========== CONFIGURATION ==========
+OSM_API = 'https://api.openstreetmap.org/api/0.6'
+NODES_PER_REQUEST = 200     # Node ids per /nodes call (keeps the URL well under server limits)
+CACHE_TTL = 7 * 24 * 3600   # Seconds a cached response is used without asking the server
+REQUEST_TIMEOUT = 10
+MAX_WORKERS = 4             # Lines fetched concurrently
+
+# Same columns the visualization notebook has always used (geo.py reads Lat/Lon/Station Name)
+STATION_COLUMNS = ['Stop ID', 'Alt Name', 'Lat', 'Lon', 'Station Name', 'Station ID', 'Name', 'Start', 'End', 'train_id', 'line_name']
+
+# ========== HTTP + CACHE ==========
+class OsmClient:
+    """
+    GET client for the OSM API with a file cache.
+
+    Each response is stored as JSON (body, ETag, fetch time) under
+    `cache_dir`. Within `ttl` the cached body is used as is; after that the
+    request is revalidated with If-None-Match, and a 304 only refreshes the
+    timestamp. If the server cannot be reached a stale entry is still used.
+    Each thread gets its own requests.Session (Session is not thread-safe).
+    """
+
+    def __init__(self, base_url=OSM_API, cache_dir=OSM_CACHE_DIR, ttl=CACHE_TTL, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _cache_path(self, url):
+        return self.cache_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+
+    def _load(self, url):
+        try:
+            return json.loads(self._cache_path(url).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, url, entry):
+        path = self._cache_path(url)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding='utf-8')
+        tmp_path.replace(path)
+
+    def get(self, path):
+        """Response body for `path` (relative to the API root); raises requests.HTTPError."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        entry = self._load(url)
+        if entry and time.time() - entry['fetched_at'] < self.ttl:
+            self.hits += 1
+            return entry['body']
+
+        headers = {'If-None-Match': entry['etag']} if entry and entry.get('etag') else {}
+        try:
+            response = self._session().get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            if entry:
+                print(f"   ⚠️  OSM unreachable ({e}), using cached copy from {time.ctime(entry['fetched_at'])}")
+                return entry['body']
+            raise
+
+        if response.status_code == 304 and entry:
+            self.revalidated += 1
+            entry['fetched_at'] = time.time()
+            self._store(url, entry)
+            return entry['body']
+        response.raise_for_status()
+        self.downloads += 1
+        self._store(url, {'url': url, 'etag': response.headers.get('ETag'), 'fetched_at': time.time(), 'body': response.text})
+        return response.text
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+
+# ========== PARSING ==========
+def _tags(element):
+    return {tag.get('k'): tag.get('v') for tag in element.findall('tag')}
+
+def parse_relation(xml):
+    """(member node ids in order, relation tags) from a /relation/<id> response."""
+    relation = ET.fromstring(xml).find('relation')
+    if relation is None:
+        return [], {}
+    node_ids = [member.get('ref') for member in relation.findall('member') if member.get('type') == 'node']
+    return node_ids, _tags(relation)
+
+def parse_nodes(xml):
+    """{node id: (lat, lon, name, ref)} from a /nodes response."""
+    nodes = {}
+    for node in ET.fromstring(xml).findall('node'):
+        lat, lon = node.get('lat'), node.get('lon')
+        tags = _tags(node)
+        nodes[node.get('id')] = (
+            float(lat) if lat else None,
+            float(lon) if lon else None,
+            tags.get('name'),
+            tags.get('ref'),
+        )
+    return nodes
+
+# ========== FETCHING ==========
+def fetch_nodes(client, node_ids, chunk_size=NODES_PER_REQUEST):
+    """Coordinates and tags for `node_ids`, NODES_PER_REQUEST ids per call."""
+    nodes = {}
+    for start in range(0, len(node_ids), chunk_size):
+        nodes.update(_fetch_node_chunk(client, node_ids[start:start + chunk_size]))
+    return nodes
+
+def _fetch_node_chunk(client, node_ids):
+    try:
+        return parse_nodes(client.get(f"nodes?nodes={','.join(node_ids)}"))
+    except requests.HTTPError as e:
+        # /nodes fails as a whole when one id was deleted; split to isolate it
+        status = e.response.status_code if e.response is not None else None
+        if status not in (404, 410):
+            raise
+        if len(node_ids) == 1:
+            print(f"   ⚠️  Node {node_ids[0]} no longer exists (HTTP {status})")
+            return {}
+        middle = len(node_ids) // 2
+        return {**_fetch_node_chunk(client, node_ids[:middle]), **_fetch_node_chunk(client, node_ids[middle:])}
+
+def fetch_line(client, line_name, relation_id):
+    """One row per member node of a line's route relation."""
+    node_ids, tags = parse_relation(client.get(f"relation/{relation_id}"))
+    nodes = fetch_nodes(client, node_ids)
+    rows = []
+    for node_id in node_ids:
+        lat, lon, station_name, station_id = nodes.get(node_id, (None, None, None, None))
+        rows.append({
+            'Stop ID': node_id,
+            'Alt Name': tags.get('alt_name'),
+            'Lat': lat,
+            'Lon': lon,
+            'Station Name': station_name,
+            'Station ID': station_id,
+            'Name': tags.get('name'),
+            'Start': tags.get('from'),
+            'End': tags.get('to'),
+            'train_id': relation_id,
+            'line_name': line_name,
+        })
+    return pd.DataFrame(rows, columns=STATION_COLUMNS)
+
+def fetch_stations(train_lines=TRAIN_LINES, client=None, max_workers=MAX_WORKERS):
+    """
+    Stations for every line in `train_lines` ({line name: OSM relation id}),
+    fetched concurrently. Lines that fail are reported and left out.
+    """
+    own_client = client is None
+    client = client or OsmClient()
+    frames = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {name: executor.submit(fetch_line, client, name, relation_id) for name, relation_id in train_lines.items()}
+            for name, future in futures.items():
+                try:
+                    line_df = future.result()
+                except (requests.RequestException, ET.ParseError) as e:
+                    print(f"❌ {name} (ID: {train_lines[name]}): {e}")
+                    continue
+                print(f"📡 {name} (ID: {train_lines[name]}): ✅ {len(line_df)} stops")
+                frames.append(line_df)
+    finally:
+        if own_client:
+            client.close()
+    print(f"   Cache: {client.hits} hits | {client.revalidated} revalidated | {client.downloads} downloaded")
+    if not frames:
+        return pd.DataFrame(columns=STATION_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,188 @@
+"""
+Adaptive per-host rate control
+Token bucket for request rate plus AIMD concurrency control: widen while the
+site is healthy, back off quickly on throttling signals
+"""
+import csv
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+
+# ========== CONFIGURATION ==========
+INITIAL_CONCURRENCY = 3
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+INITIAL_RATE = 1.0          # Requests per second
+MIN_RATE = 0.2
+MAX_RATE = 10.0
+RATE_STEP = 0.25            # Additive rate increase per healthy window
+BURST = 3                   # Token bucket capacity
+HEALTHY_WINDOW = 10         # Consecutive healthy responses before widening
+LATENCY_TARGET = 8.0        # Seconds; slower responses do not count as healthy
+BACKOFF_FACTOR = 0.5        # Multiplicative decrease on a throttling signal
+COOLDOWN = 5.0              # Seconds of silence after a backoff (doubles on repeats)
+MAX_COOLDOWN = 120.0
+
+# Failure reasons that mean "slow down"
+BACKOFF_REASONS = {'http_429', 'http_403', 'timeout', 'missing_title'}
+
+def classify_failure(exc):
+    """Map an exception from a fetch or extraction to a short reason string."""
+    status = getattr(exc, 'status', None)
+    if status:
+        return f'http_{status}'
+    name = type(exc).__name__
+    if 'Timeout' in name or 'timeout' in str(exc).lower():
+        return 'timeout'
+    if name == 'MissingTitleError':
+        return 'missing_title'
+    return 'error'
+
+class AdaptiveThrottle:
+    """
+    Shared limiter for one host.
+
+    `slot()` wraps a single request: it waits for a concurrency slot and a
+    rate token, times the request, and feeds the outcome back into the AIMD
+    controller. Decisions are printed and kept in `decisions` for tuning.
+    """
+
+    def __init__(self, host, concurrency=INITIAL_CONCURRENCY, rate=INITIAL_RATE):
+        self.host = host
+        self.limit = concurrency
+        self.rate = rate
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._tokens = float(BURST)
+        self._refilled = time.monotonic()
+        self._cooldown_until = 0.0
+        self._cooldown = COOLDOWN
+        self._last_backoff = 0.0
+        self._streak = 0
+        self._latencies = deque(maxlen=HEALTHY_WINDOW)
+        self.decisions = []
+
+    # ----- admission -----
+    def _take_token(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                self._tokens = min(BURST, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                wait = max(0.0, self._cooldown_until - now)
+                if not wait and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = wait or (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self):
+        """Admit one request; exceptions are classified and re-raised."""
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            self._take_token()
+            started = time.monotonic()
+            try:
+                yield
+            except Exception as e:
+                self.record_failure(classify_failure(e), started)
+                raise
+            self.record_success(time.monotonic() - started)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+
+    # ----- feedback -----
+    def record_success(self, latency):
+        with self._cond:
+            self._latencies.append(latency)
+            if latency > LATENCY_TARGET:
+                self._streak = 0
+                return
+            self._streak += 1
+            if self._streak >= HEALTHY_WINDOW:
+                self._streak = 0
+                self._cooldown = COOLDOWN
+                old_limit, old_rate = self.limit, self.rate
+                # Only widen concurrency when it is what's holding requests back
+                if self._in_flight >= self.limit:
+                    self.limit = min(MAX_CONCURRENCY, self.limit + 1)
+                self.rate = min(MAX_RATE, self.rate + RATE_STEP)
+                if (self.limit, self.rate) != (old_limit, old_rate):
+                    self._log('increase', 'healthy', old_limit, old_rate)
+                    self._cond.notify_all()
+
+    def record_failure(self, reason, started=None):
+        """Back off on throttling signals; other errors only reset the healthy streak."""
+        with self._cond:
+            self._streak = 0
+            if reason not in BACKOFF_REASONS:
+                return
+            # Requests already in flight before the last backoff report stale news
+            if started is not None and started < self._last_backoff:
+                return
+            now = time.monotonic()
+            old_limit, old_rate = self.limit, self.rate
+            self.limit = max(MIN_CONCURRENCY, int(self.limit * BACKOFF_FACTOR))
+            self.rate = max(MIN_RATE, self.rate * BACKOFF_FACTOR)
+            self._cooldown_until = now + self._cooldown
+            self._log('backoff', reason, old_limit, old_rate)
+            self._cooldown = min(MAX_COOLDOWN, self._cooldown * 2)
+            self._last_backoff = now
+
+    def _log(self, action, reason, old_limit, old_rate):
+        latencies = sorted(self._latencies)
+        p50 = latencies[len(latencies) // 2] if latencies else None
+        self.decisions.append({
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'host': self.host,
+            'action': action,
+            'reason': reason,
+            'concurrency': self.limit,
+            'rate': round(self.rate, 3),
+            'p50_latency': round(p50, 3) if p50 is not None else None,
+            'cooldown': round(self._cooldown, 1) if action == 'backoff' else None,
+        })
+        icon = '🚀' if action == 'increase' else '🐢'
+        print(f"   {icon} {self.host}: concurrency {old_limit}→{self.limit}, rate {old_rate:.2f}→{self.rate:.2f}/s ({reason})")
+
+    def save(self, path):
+        """Write all throttle decisions to a CSV file."""
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=['time', 'host', 'action', 'reason', 'concurrency', 'rate', 'p50_latency', 'cooldown'])
+            writer.writeheader()
+            writer.writerows(self.decisions)
+
+# ========== REGISTRY ==========
+_throttles = {}
+_registry_lock = threading.Lock()
+
+def get_throttle(url_or_host):
+    """Shared throttle for a host, so every scraper hitting it respects one limit."""
+    host = urlparse(url_or_host).netloc or url_or_host
+    with _registry_lock:
+        if host not in _throttles:
+            _throttles[host] = AdaptiveThrottle(host)
+        return _throttles[host]
+
+def all_throttles():
+    with _registry_lock:
+        return list(_throttles.values())
+
+def save_throttle_logs(output_path):
+    """Save each host's decision log to CSV and print where it ended up."""
+    for throttle in all_throttles():
+        if not throttle.decisions:
+            continue
+        host = throttle.host.replace(':', '_')
+        throttle_file = f"{output_path}/throttle_log_{host}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        throttle.save(throttle_file)
+        print(f"🚦 {throttle.host}: ended at concurrency {throttle.limit}, {throttle.rate:.2f} req/s - log: {throttle_file}")
@@ -0,0 +1,349 @@
+"""
+Lease-based work queue
+URL work items shared by crawl workers on several processes or hosts: workers
+lease items for a visibility timeout, heartbeat while scraping and push results
+back; leases that expire (crashed or stalled worker) are re-issued
+"""
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from extraction import failed_record
+
+# ========== CONFIGURATION ==========
+LEASE_SECONDS = 120       # Visibility timeout: a leased item goes back to the queue if not heartbeated
+MAX_ATTEMPTS = 3          # Leases per URL before it is given up as failed
+BUSY_TIMEOUT = 30         # Seconds a writer waits for the SQLite lock held by another process
+QUEUE_PORT = 8767         # HTTP coordinator port
+QUEUE_HOST = '127.0.0.1'  # Coordinator bind address; binding beyond localhost requires QUEUE_TOKEN
+QUEUE_TOKEN = os.environ.get('QUEUE_TOKEN')  # Shared secret every worker sends in TOKEN_HEADER
+TOKEN_HEADER = 'X-Queue-Token'
+REQUEST_TIMEOUT = 30      # Seconds a worker waits for the coordinator
+
+# Item lifecycle: queued -> leased -> done | failed (or back to queued on failure/expiry)
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+LEASE_EXPIRED = 'lease expired'  # last_error of an item whose final lease ran out
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    seq           INTEGER PRIMARY KEY AUTOINCREMENT,
+    url           TEXT NOT NULL UNIQUE,
+    payload       TEXT,
+    status        TEXT NOT NULL DEFAULT 'queued',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    last_error    TEXT,
+    record        TEXT,
+    exported      INTEGER NOT NULL DEFAULT 0,
+    added_at      TEXT NOT NULL,
+    updated_at    TEXT
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (status, lease_expires);
+CREATE INDEX IF NOT EXISTS items_export ON items (exported, status);
+"""
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+def worker_name():
+    """A worker id unique across hosts and processes: host-pid-random."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def _placeholders(values):
+    return ','.join('?' * len(values))
+
+# ========== SQLITE QUEUE ==========
+class LeaseQueue:
+    """
+    The queue as a SQLite file: the coordinator's own store, or shared
+    directly by workers on one machine or a shared filesystem.
+
+    Every operation is a single write transaction, so concurrent processes
+    never lease the same item twice. WAL needs shared memory between the
+    processes and only works when they run on one host; pass `shared=True`
+    (rollback journal) when workers on other hosts open the file over a
+    network share. Over NFS prefer the HTTP coordinator (serve_queue).
+    """
+
+    def __init__(self, path, shared=False, max_attempts=MAX_ATTEMPTS):
+        self.path = str(path)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={'DELETE' if shared else 'WAL'}")
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ----- coordinator -----
+    def publish(self, items):
+        """
+        Add work items (dicts with a 'url'; the whole dict travels as the
+        payload). URLs already in the queue keep their state. Returns the
+        number of new items.
+        """
+        now = _now()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO items (url, payload, added_at) VALUES (?, ?, ?)",
+                [(item['url'], json.dumps(item, ensure_ascii=False, default=str), now) for item in items]
+            )
+            return self._conn.total_changes - before
+
+    def unexported(self, limit=None):
+        """Finished items (done or failed) not yet written out: [(url, payload, record)]."""
+        rows = self._read(
+            "SELECT url, payload, record FROM items WHERE exported = 0 AND status IN (?, ?) AND record IS NOT NULL ORDER BY seq LIMIT ?",
+            (DONE, FAILED, -1 if limit is None else limit)
+        )
+        return [(url, json.loads(payload) if payload else {'url': url}, json.loads(record)) for url, payload, record in rows]
+
+    def mark_exported(self, urls):
+        urls = list(urls)
+        with self._lock, self._conn:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                self._conn.execute(f"UPDATE items SET exported = 1 WHERE url IN ({_placeholders(chunk)})", chunk)
+
+    # ----- workers -----
+    def lease(self, worker, n=1, lease_seconds=LEASE_SECONDS):
+        """
+        Lease up to `n` items to `worker` for `lease_seconds`: queued items
+        first, then items whose lease has expired. Expired items that are out
+        of attempts are failed with a failed record (so they are exported)
+        instead of re-issued. Returns [{'url', 'payload', 'attempt'}].
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            expired = self._conn.execute(
+                "SELECT url FROM items WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (LEASED, now, self.max_attempts)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE items SET status = ?, record = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ? WHERE url = ?",
+                [(FAILED, json.dumps(failed_record(url, f'failed ({LEASE_EXPIRED})')), LEASE_EXPIRED, _now(), url) for url, in expired]
+            )
+            self._conn.execute(
+                "UPDATE items SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE seq IN (SELECT seq FROM items WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY seq LIMIT ?)",
+                (LEASED, worker, now + lease_seconds, _now(), QUEUED, LEASED, now, n)
+            )
+            rows = self._conn.execute(
+                "SELECT url, payload, attempts FROM items WHERE status = ? AND lease_owner = ? AND lease_expires = ?",
+                (LEASED, worker, now + lease_seconds)
+            ).fetchall()
+        return [{'url': url, 'payload': json.loads(payload) if payload else {'url': url}, 'attempt': attempts}
+                for url, payload, attempts in rows]
+
+    def heartbeat(self, worker, urls, lease_seconds=LEASE_SECONDS):
+        """Extend `worker`'s leases on `urls`; returns the URLs it still holds (the rest were re-issued)."""
+        urls = list(urls)
+        if not urls:
+            return []
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE items SET lease_expires = ? WHERE status = ? AND lease_owner = ? AND url IN ({_placeholders(urls)})",
+                (time.time() + lease_seconds, LEASED, worker, *urls)
+            )
+            rows = self._conn.execute(
+                f"SELECT url FROM items WHERE status = ? AND lease_owner = ? AND url IN ({_placeholders(urls)})",
+                (LEASED, worker, *urls)
+            ).fetchall()
+        return [url for url, in rows]
+
+    def complete(self, worker, url, record):
+        """
+        Store the result for `url`. Accepted even if the lease was lost, as
+        long as no other worker finished the item first (an item failed only
+        because its last lease expired is re-exported with the result);
+        returns whether it was.
+        """
+        cursor = self._write(
+            "UPDATE items SET status = ?, record = ?, last_error = NULL, lease_owner = NULL, lease_expires = NULL, exported = 0, updated_at = ? "
+            "WHERE url = ? AND (status NOT IN (?, ?) OR (status = ? AND last_error = ?))",
+            (DONE, json.dumps(record, ensure_ascii=False, default=str), _now(), url, DONE, FAILED, FAILED, LEASE_EXPIRED)
+        )
+        return cursor.rowcount > 0
+
+    def fail(self, worker, url, error, record=None, retry=True):
+        """
+        Give back a failed item: re-queued while it has attempts left and
+        `retry` is set (any worker may pick it up), otherwise failed with
+        `record`. Ignored unless `worker` still holds the lease; returns the
+        new status or None.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT attempts FROM items WHERE url = ? AND status = ? AND lease_owner = ?", (url, LEASED, worker)
+            ).fetchone()
+            if row is None:
+                return None
+            status = QUEUED if retry and row[0] < self.max_attempts else FAILED
+            self._conn.execute(
+                "UPDATE items SET status = ?, last_error = ?, record = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE url = ?",
+                (status, str(error)[:500], json.dumps(record, ensure_ascii=False, default=str) if record and status == FAILED else None, _now(), url)
+            )
+            return status
+
+    # ----- status -----
+    def counts(self):
+        """Number of items per status, plus 'expired' leases awaiting re-issue."""
+        counts = dict(self._read("SELECT status, COUNT(*) FROM items GROUP BY status"))
+        counts['expired'] = self._read(
+            "SELECT COUNT(*) FROM items WHERE status = ? AND lease_expires < ?", (LEASED, time.time())
+        )[0][0]
+        return counts
+
+    def finished(self):
+        """No item is queued or leased."""
+        counts = self.counts()
+        return not counts.get(QUEUED, 0) and not counts.get(LEASED, 0)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# ========== HTTP COORDINATOR ==========
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def check_bind(host, token):
+    """Raise ValueError unless serving on `host` is allowed: loopback, or any host with a token."""
+    if not token and not is_loopback(host):
+        raise ValueError(f"Serving the queue on {host} needs a shared token (QUEUE_TOKEN)")
+
+def serve_queue(queue, port=QUEUE_PORT, host=QUEUE_HOST, token=QUEUE_TOKEN):
+    """
+    Expose `queue` to workers on other hosts from a daemon thread:
+    POST /lease, /heartbeat, /complete, /fail, /publish (JSON bodies with the
+    method's arguments) and GET /counts. With `token`, every request must
+    carry it in TOKEN_HEADER (401 otherwise); a `host` other than loopback
+    is refused without one.
+    """
+    check_bind(host, token)
+    methods = {
+        '/lease': queue.lease,
+        '/heartbeat': queue.heartbeat,
+        '/complete': queue.complete,
+        '/fail': queue.fail,
+        '/publish': queue.publish,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _authorized(self):
+            if not token or hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), token):
+                return True
+            self._reply(401, {'error': f'missing or wrong {TOKEN_HEADER}'})
+            return False
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            if self.path.split('?')[0] != '/counts':
+                self.send_error(404)
+                return
+            self._reply(200, queue.counts())
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            method = methods.get(self.path.split('?')[0])
+            if method is None:
+                self.send_error(404)
+                return
+            try:
+                kwargs = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                self._reply(200, {'result': method(**kwargs)})
+            except (ValueError, TypeError, KeyError) as e:
+                self._reply(400, {'error': str(e)})
+            except sqlite3.OperationalError as e:
+                self._reply(503, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='queue-server', daemon=True).start()
+    return server
+
+class RemoteQueue:
+    """LeaseQueue's worker interface over HTTP, for workers of a coordinator started with serve_queue."""
+
+    def __init__(self, url, timeout=REQUEST_TIMEOUT, token=QUEUE_TOKEN):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._session = requests.Session()
+        if token:
+            self._session.headers[TOKEN_HEADER] = token
+
+    def _call(self, method, **kwargs):
+        response = self._session.post(f"{self.url}/{method}", json=kwargs, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['result']
+
+    def publish(self, items):
+        return self._call('publish', items=list(items))
+
+    def lease(self, worker, n=1, lease_seconds=LEASE_SECONDS):
+        return self._call('lease', worker=worker, n=n, lease_seconds=lease_seconds)
+
+    def heartbeat(self, worker, urls, lease_seconds=LEASE_SECONDS):
+        return self._call('heartbeat', worker=worker, urls=list(urls), lease_seconds=lease_seconds)
+
+    def complete(self, worker, url, record):
+        return self._call('complete', worker=worker, url=url, record=record)
+
+    def fail(self, worker, url, error, record=None, retry=True):
+        return self._call('fail', worker=worker, url=url, error=error, record=record, retry=retry)
+
+    def counts(self):
+        response = self._session.get(f"{self.url}/counts", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def finished(self):
+        counts = self.counts()
+        return not counts.get(QUEUED, 0) and not counts.get(LEASED, 0)
+
+    def close(self):
+        self._session.close()
+
+def open_queue(target, shared=False, token=QUEUE_TOKEN):
+    """RemoteQueue for an http(s):// coordinator URL, LeaseQueue for a SQLite path."""
+    if str(target).startswith(('http://', 'https://')):
+        return RemoteQueue(target, token=token)
+    return LeaseQueue(target, shared=shared)
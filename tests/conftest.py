@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / 'src'), str(ROOT / 'benchmarks')]
+
+from replay_server import ReplayServer
+
+
+@pytest.fixture
+def replay():
+    with ReplayServer(latency=0.0, jitter=0.0, no_title_rate=0.0) as server:
+        yield server
+
+
+@pytest.fixture
+def details_run(tmp_path, replay, monkeypatch):
+    """Point scrape_details at the replay server and a temporary output dir; returns the link URLs."""
+    import scrape_details as sd
+    from fetchers import HttpFetcher
+    from parse_stage import ParseStage
+    from retry import RetryScheduler, CircuitBreaker
+
+    pages = 25
+    urls = [replay.detail_url(n) for n in range(pages)]
+    links_file = tmp_path / 'links.csv'
+    pd.DataFrame({
+        'url': urls,
+        'property_id': [f'bench-{n:06d}' for n in range(pages)],
+        'title': 'Condo For Rent in Ortigas',
+        'city': 'pasig',
+        'property_type': 'condo',
+    }).to_csv(links_file, index=False)
+
+    monkeypatch.setattr(sd, 'LINKS_FILE', str(links_file))
+    monkeypatch.setattr(sd, 'OUTPUT_PATH', str(tmp_path))
+    monkeypatch.setattr(sd, 'STATE_FILE', str(tmp_path / 'crawl_state.sqlite'))
+    monkeypatch.setattr(sd, 'DATASET_DIR', str(tmp_path / 'property_details'))
+    monkeypatch.setattr(sd, 'AGGREGATES_FILE', None)
+    monkeypatch.setattr(sd, 'PREVIOUS_COMBINED_FILE', None)
+    monkeypatch.setattr(sd, 'BATCH_SIZE', 10)
+    monkeypatch.setattr(sd, 'RETRIES', RetryScheduler(sd.RETRY_ATTEMPTS, base_delay=0.1, max_delay=0.5))
+    monkeypatch.setattr(sd, 'BREAKER', CircuitBreaker())
+    fetcher = HttpFetcher()
+    parser = ParseStage(0)
+    monkeypatch.setattr(sd, 'DRIVER_POOL', None)
+    monkeypatch.setattr(sd, 'FETCHER', fetcher)
+    monkeypatch.setattr(sd, 'PARSER', parser)
+    yield urls
+    fetcher.close()
+    parser.close()
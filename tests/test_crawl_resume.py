@@ -0,0 +1,42 @@
+import pytest
+
+import scrape_details as sd
+from crawl_store import CrawlStore, DONE
+from dataset import read_details
+
+
+def test_crash_mid_batch_loses_no_records(details_run, monkeypatch):
+    save_batch = sd.save_batch
+
+    def crash_on_second_batch(details_list, batch_df, batch_num, store=None):
+        if batch_num == 1:
+            raise KeyboardInterrupt('killed mid-batch')
+        return save_batch(details_list, batch_df, batch_num, store)
+
+    monkeypatch.setattr(sd, 'save_batch', crash_on_second_batch)
+    with pytest.raises(KeyboardInterrupt):
+        sd.main()
+    assert len(read_details(sd.DATASET_DIR)) == sd.BATCH_SIZE
+
+    monkeypatch.setattr(sd, 'save_batch', save_batch)
+    sd.main()
+
+    assert set(read_details(sd.DATASET_DIR)['url']) == set(details_run)
+    store = CrawlStore(sd.STATE_FILE)
+    assert store.counts() == {DONE: len(details_run)}
+    store.close()
+
+
+def test_resumed_delta_run_does_not_rewrite_carried_rows(details_run, monkeypatch):
+    sd.main()
+    previous_dir = sd.DATASET_DIR
+    monkeypatch.setattr(sd, 'PREVIOUS_COMBINED_FILE', previous_dir)
+    monkeypatch.setattr(sd, 'DATASET_DIR', f'{sd.OUTPUT_PATH}/refresh')
+    monkeypatch.setattr(sd, 'STATE_FILE', f'{sd.OUTPUT_PATH}/refresh_state.sqlite')
+
+    sd.main()
+    sd.main()  # Resume: everything is already carried
+
+    refreshed = read_details(sd.DATASET_DIR, latest=False)
+    assert len(refreshed) == len(details_run)
+    assert set(refreshed['url']) == set(details_run)
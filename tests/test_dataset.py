@@ -0,0 +1,85 @@
+import pandas as pd
+import pyarrow.dataset as ds
+
+from dataset import append_to_dataset, read_details
+from delta import plan_delta, ACTIVE, DELISTED
+from schema import load_details
+
+
+def _rows(**columns):
+    base = {'title': 'Condo For Rent', 'title_preview': 'Condo For Rent', 'scrape_status': 'success',
+            'listing_status': ACTIVE, 'city': 'pasig', 'property_type': 'condo'}
+    return pd.DataFrame({**base, **columns})
+
+
+def test_value_filters_apply_to_latest_rows(tmp_path):
+    append_to_dataset(_rows(url=['a', 'b'], price_php=[20000, 50000]), tmp_path, crawl_date='2025-01-01')
+    append_to_dataset(_rows(url=['a', 'b'], price_php=[40000, 25000]), tmp_path, crawl_date='2025-02-01')
+
+    cheap = read_details(tmp_path, columns=['url', 'price_php'], filters=[('price_php', '<', 30000), ('city', '=', 'pasig')])
+    assert cheap.to_dict('records') == [{'url': 'b', 'price_php': 25000}]
+    assert read_details(tmp_path, filters=[('crawl_date', '=', '2025-01-01')])['price_php'].tolist() == [20000, 50000]
+
+
+def test_delisted_rows_are_dropped_by_readers(tmp_path):
+    append_to_dataset(_rows(url=['a', 'b'], price_php=[20000, 30000]), tmp_path, crawl_date='2025-01-01')
+    append_to_dataset(_rows(url=['b'], price_php=[30000], listing_status=[DELISTED]), tmp_path, crawl_date='2025-02-01')
+
+    assert read_details(tmp_path)['url'].tolist() == ['a']
+    assert load_details(tmp_path, columns=['url'])['url'].tolist() == ['a']
+    assert set(read_details(tmp_path, active_only=False)['url']) == {'a', 'b'}
+
+
+def test_delta_against_dataset_compares_snippet_titles(tmp_path):
+    # Detail title differs from the search-snippet title; only the snippet side is compared
+    append_to_dataset(_rows(url=['a'], title=['1BR Condo at Ortigas'], price_php=[20000], price_preview=[20000]),
+                      tmp_path, crawl_date='2025-01-01')
+    links = pd.DataFrame({'url': ['a'], 'title': ['Condo For Rent'], 'price_preview': [20000]})
+
+    plan = plan_delta(links, load_details(tmp_path, active_only=False))
+    assert len(plan['unchanged']) == 1 and plan['changed'].empty
+
+
+def test_delisted_rows_are_carried_then_dropped(tmp_path):
+    previous = _rows(url=['a', 'b'], price_php=[20000, 30000], price_preview=[20000, 30000])
+    append_to_dataset(previous, tmp_path, crawl_date='2025-01-01')
+    links = pd.DataFrame({'url': ['a'], 'title': ['Condo For Rent'], 'price_preview': [20000]})
+
+    for crawl_date, delisted in [('2025-02-01', ['b']), ('2025-03-01', ['b']), ('2025-04-01', [])]:
+        plan = plan_delta(links, load_details(tmp_path, active_only=False), keep_runs=2)
+        assert plan['delisted']['url'].tolist() == delisted
+        append_to_dataset(pd.concat([plan['unchanged'], plan['delisted']]), tmp_path, crawl_date=crawl_date)
+
+
+def test_value_filters_only_read_candidate_urls(tmp_path, monkeypatch):
+    append_to_dataset(_rows(url=['a', 'b', 'c'], price_php=[20000, 50000, 60000]), tmp_path, crawl_date='2025-01-01')
+    append_to_dataset(_rows(url=['a', 'b', 'c'], price_php=[40000, 25000, 70000]), tmp_path, crawl_date='2025-02-01')
+
+    scanned = []
+    open_dataset = ds.dataset
+
+    class RecordingDataset:
+        def __init__(self, source, **kwargs):
+            self.inner = open_dataset(source, **kwargs)
+
+        def to_table(self, **kwargs):
+            table = self.inner.to_table(**kwargs)
+            scanned.append(set(table.column('url').to_pylist()))
+            return table
+
+    monkeypatch.setattr(ds, 'dataset', lambda source, **kwargs: RecordingDataset(source, **kwargs)
+                        if isinstance(source, str) else open_dataset(source, **kwargs))
+    cheap = read_details(tmp_path, columns=['url', 'price_php'], filters=[('price_php', '<', 30000)])
+    assert cheap['url'].tolist() == ['b']
+    assert scanned == [{'a', 'b'}, {'a', 'b'}]  # c never matches, so its rows are never read
+
+
+def test_cluster_columns_are_kept(tmp_path):
+    rows = _rows(url=['a', 'b'], price_php=[20000, 20000], cluster_id=[0, 0], canonical_url=['a', 'a'], is_canonical=[True, False])
+    append_to_dataset(rows, tmp_path, crawl_date='2025-01-01')
+
+    df = read_details(tmp_path, columns=['url', 'cluster_id', 'canonical_url', 'is_canonical'])
+    assert df.sort_values('url').to_dict('records') == [
+        {'url': 'a', 'cluster_id': 0, 'canonical_url': 'a', 'is_canonical': True},
+        {'url': 'b', 'cluster_id': 0, 'canonical_url': 'a', 'is_canonical': False},
+    ]
@@ -0,0 +1,81 @@
+import pandas as pd
+
+from dedup import cluster_listings, cluster_snippets, SNIPPET_MAX_CLUSTER
+
+TITLE = 'Condo For Rent in Avida Towers Asten, Makati'
+TEMPLATE = (
+    'Fully furnished {bedrooms} unit on the {floor}th floor of Avida Towers Asten, Makati. '
+    'Walking distance to Ayala Avenue, Greenbelt and Glorietta. Amenities include a swimming pool, '
+    'gym, function room and 24/7 security. Association dues included. Minimum 1 year lease, '
+    '2 months deposit and 1 month advance. Pet friendly. Contact us to schedule a viewing.'
+)
+
+
+def _listing(n, bedrooms, floor, price, area, lat=14.5614, lon=121.0183):
+    return {
+        'url': f'https://example.com/property/{n}',
+        'title': TITLE,
+        'description': TEMPLATE.format(bedrooms=f'{bedrooms}BR' if bedrooms else 'studio', floor=floor),
+        'bedrooms': bedrooms,
+        'price_php': price,
+        'floor_area_sqm': area,
+        'latitude': lat,
+        'longitude': lon,
+        'scrape_status': 'success',
+    }
+
+
+def test_units_in_the_same_building_stay_separate():
+    df = pd.DataFrame([
+        _listing(0, 0, 12, 18000, 24),
+        _listing(1, 1, 15, 26000, 36),
+        _listing(2, 2, 20, 45000, 62),
+        _listing(3, 1, 22, 32000, 44),
+        _listing(4, 0, 30, 22000, 30),
+    ])
+    clustered = cluster_listings(df)
+    assert clustered['cluster_id'].nunique() == len(df)
+    assert clustered['is_canonical'].all()
+
+
+def test_chains_of_similar_units_do_not_merge_into_one_cluster():
+    # Each unit is within the price/area tolerance of the next, not of the first
+    prices_areas = [(18000, 24.0), (19500, 26.0), (21000, 28.0), (23000, 30.5), (25000, 33.0)]
+    df = pd.DataFrame([_listing(n, 0, 12, price, area) for n, (price, area) in enumerate(prices_areas)])
+    clustered = cluster_listings(df)
+    first = clustered.loc[0, 'cluster_id']
+    assert clustered.loc[clustered['cluster_id'] == first, 'price_php'].max() <= 18000 * 1.1
+
+
+def test_same_unit_posted_twice_is_one_cluster():
+    original = _listing(0, 1, 15, 26000, 36)
+    repost = {**original, 'url': 'https://example.com/property/1', 'price_php': 25500,
+              'description': original['description'].replace('Contact us', 'Message me')}
+    other = _listing(2, 2, 20, 45000, 62)
+    clustered = cluster_listings(pd.DataFrame([original, repost, other]))
+    assert clustered['cluster_id'].tolist()[:2] == [clustered.loc[0, 'cluster_id']] * 2
+    assert clustered.loc[0, 'is_canonical'] and not clustered.loc[1, 'is_canonical']
+    assert clustered.loc[2, 'cluster_id'] != clustered.loc[0, 'cluster_id']
+
+
+def _snippet(n, price, bedrooms='1', bathrooms='1'):
+    return {'url': f'https://example.com/property/{n}', 'title': 'Condo For Rent in Kapitolyo',
+            'location': 'Kapitolyo, Pasig', 'price_preview': price, 'bedrooms_preview': bedrooms,
+            'bathrooms_preview': bathrooms, 'city': 'pasig', 'property_type': 'condo'}
+
+
+def test_only_identical_snippets_cluster():
+    df = pd.DataFrame([
+        _snippet(0, 20000), _snippet(1, 20000.0),       # repost
+        _snippet(2, 20500), _snippet(3, 20000, '2'),    # another price / bedrooms
+        _snippet(4, 20000, bathrooms=None),             # missing field: never matched
+    ])
+    clustered = cluster_snippets(df)
+    assert clustered['canonical_url'].tolist()[:2] == [df.loc[0, 'url']] * 2
+    assert clustered['is_canonical'].tolist() == [True, False, True, True, True]
+    assert clustered['cluster_id'].nunique() == 4
+
+
+def test_many_identical_snippets_are_separate_units():
+    df = pd.DataFrame([_snippet(n, 160000, '2', '2') for n in range(SNIPPET_MAX_CLUSTER + 1)])
+    assert cluster_snippets(df)['is_canonical'].all()
@@ -0,0 +1,89 @@
+import multiprocessing
+import socket
+import threading
+import time
+from functools import partial
+
+import pytest
+
+import distributed
+import scrape_details as sd
+from dataset import read_details
+from work_queue import LeaseQueue, RemoteQueue, LEASED
+
+LEASE_SECONDS = 1
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _counts(target):
+    try:
+        return RemoteQueue(target).counts()
+    except OSError:
+        return {}
+
+
+def _stall(url):
+    time.sleep(60)
+
+
+def _worker(target, stall):
+    from fetchers import HttpFetcher
+    sd.FETCHER = HttpFetcher()  # The parent's session does not survive the fork
+    try:
+        distributed.run_worker(RemoteQueue(target), threads=2, scrape=_stall if stall else distributed.scrape_item,
+                               lease_seconds=LEASE_SECONDS)
+    finally:
+        sd.FETCHER.close()
+
+
+@pytest.mark.parametrize('max_attempts', [1, 2])
+def test_expired_leases_of_a_killed_worker_are_reissued_or_exported_as_failed(details_run, monkeypatch, max_attempts):
+    monkeypatch.setattr(distributed, 'POLL_SECONDS', 0.1)
+    monkeypatch.setattr(distributed, 'LeaseQueue', partial(LeaseQueue, max_attempts=max_attempts))
+    port = _free_port()
+    target = f'http://127.0.0.1:{port}'
+    coordinator = threading.Thread(target=distributed.coordinate,
+                                   args=(sd.LINKS_FILE, f'{sd.OUTPUT_PATH}/queue.sqlite', port))
+    coordinator.start()
+    fork = multiprocessing.get_context('fork')
+
+    stalled = fork.Process(target=_worker, args=(target, True))
+    while not _counts(target):  # Coordinator not serving yet
+        time.sleep(0.05)
+    stalled.start()
+    while not _counts(target).get(LEASED):
+        time.sleep(0.05)
+    stalled.kill()  # Crashes holding its leases: they expire instead of being heartbeated
+    stalled.join()
+
+    worker = fork.Process(target=_worker, args=(target, False))
+    worker.start()
+    worker.join(timeout=60)
+    coordinator.join(timeout=60)
+    assert not coordinator.is_alive()
+
+    df = read_details(sd.DATASET_DIR)
+    assert sorted(df['url']) == sorted(details_run)
+    failed = df.loc[df['scrape_status'] != 'success', 'scrape_status']
+    if max_attempts == 1:
+        assert len(failed) == distributed.PREFETCH + 2 and set(failed) == {'failed (lease expired)'}
+    else:
+        assert failed.empty
+
+
+def test_late_result_replaces_a_lease_expired_failure(tmp_path):
+    queue = LeaseQueue(tmp_path / 'queue.sqlite', max_attempts=1)
+    queue.publish([{'url': 'a'}])
+    queue.lease('slow', lease_seconds=-1)
+    assert queue.lease('other') == []
+    assert [record['scrape_status'] for _, _, record in queue.unexported()] == ['failed (lease expired)']
+    queue.mark_exported(['a'])
+
+    assert queue.complete('slow', 'a', {'url': 'a', 'scrape_status': 'success'})
+    assert [record['scrape_status'] for _, _, record in queue.unexported()] == ['success']
+    queue.close()
@@ -0,0 +1,97 @@
+import pandas as pd
+
+import scrape_link
+from scrape_link import crawl_search, carry_forward, KNOWN_STOP, FAILED_STOP, PAGE_ATTEMPTS
+
+PAGE_SIZE = 20
+PAGES = 4
+
+
+def _page(page_number):
+    ids = [f'{page_number}-{n}' for n in range(PAGE_SIZE)]
+    return {
+        'records': [{'url': f'https://example.com/property/{property_id}', 'property_id': property_id,
+                     'city': 'pasig', 'property_type': 'condo'} for property_id in ids],
+        'snippet_count': PAGE_SIZE,
+        'page': page_number,
+        'max_page': PAGES,
+        'listing_count': PAGE_SIZE * PAGES,
+        'empty': False,
+    }
+
+
+def _crawl(monkeypatch, known_ids):
+    fetched = []
+
+    def fetch_search_page(city, prop_type, page_number=1):
+        fetched.append(page_number)
+        return _page(page_number)
+
+    monkeypatch.setattr(scrape_link, 'fetch_search_page', fetch_search_page)
+    plans = []
+    links = pd.concat(crawl_search([('pasig', 'condo')], known_ids, max_workers=1, window=1, plans=plans))
+    return links, sorted(fetched), plans[0]
+
+
+# Not newest first: page 2 holds only known listings, new ones follow on pages 3-4
+KNOWN_ON_PAGE_2 = {f'2-{n}' for n in range(PAGE_SIZE)}
+
+
+def test_default_order_never_stops_at_known_pages(monkeypatch):
+    assert scrape_link.SORT_PARAMS == {}
+    links, fetched, plan = _crawl(monkeypatch, KNOWN_ON_PAGE_2)
+    assert fetched == [1, 2, 3, 4]
+    assert plan.stop_reason is None
+    assert len(links) == PAGE_SIZE * PAGES
+
+
+def test_sort_params_stop_at_a_known_page(monkeypatch):
+    # The early stop trusts SORT_PARAMS: in the wrong order, pages 3-4 are never read
+    monkeypatch.setattr(scrape_link, 'SORT_PARAMS', {'sort': 'newest'})
+    links, fetched, plan = _crawl(monkeypatch, KNOWN_ON_PAGE_2)
+    assert fetched == [1, 2]
+    assert (plan.stop_reason, plan.stop_page) == (KNOWN_STOP, 2)
+    assert not links['property_id'].str.startswith(('3-', '4-')).any()
+
+
+def _flaky_crawl(monkeypatch, failures):
+    """Crawl where page n fails its first failures[n] fetches; returns (links, fetches per page, plan)."""
+    fetched = []
+
+    def fetch_search_page(city, prop_type, page_number=1):
+        fetched.append(page_number)
+        if fetched.count(page_number) <= failures.get(page_number, 0):
+            return None
+        return _page(page_number)
+
+    monkeypatch.setattr(scrape_link, 'fetch_search_page', fetch_search_page)
+    monkeypatch.setattr(scrape_link, 'backoff_delay', lambda attempt: 0)
+    plans = []
+    frames = list(crawl_search([('pasig', 'condo')], max_workers=1, window=1, plans=plans))
+    links = pd.concat(frames) if frames else pd.DataFrame(columns=['url'])
+    return links, {n: fetched.count(n) for n in set(fetched)}, plans[0]
+
+
+def test_failed_pages_are_retried_with_backoff(monkeypatch):
+    links, fetches, plan = _flaky_crawl(monkeypatch, {1: PAGE_ATTEMPTS - 1, 3: PAGE_ATTEMPTS - 1})
+    assert fetches == {1: PAGE_ATTEMPTS, 2: 1, 3: PAGE_ATTEMPTS, 4: 1}
+    assert plan.stop_reason is None and plan.skipped == 0
+    assert len(links) == PAGE_SIZE * PAGES
+
+
+def test_pages_past_a_failed_one_are_carried_forward(monkeypatch):
+    previous = pd.DataFrame([record for n in range(1, PAGES + 1) for record in _page(n)['records']])
+
+    links, fetches, plan = _flaky_crawl(monkeypatch, {3: PAGE_ATTEMPTS})
+    assert fetches == {1: 1, 2: 1, 3: PAGE_ATTEMPTS}
+    assert (plan.stop_reason, plan.stop_page, plan.failed, plan.skipped) == (FAILED_STOP, 3, 1, 2)
+    assert len(carry_forward(links, previous, [plan])) == PAGE_SIZE * PAGES
+
+
+def test_a_failed_probe_keeps_the_previous_links(monkeypatch):
+    previous = pd.DataFrame(_page(1)['records'])
+
+    links, fetches, plan = _flaky_crawl(monkeypatch, {1: PAGE_ATTEMPTS})
+    assert fetches == {1: PAGE_ATTEMPTS}
+    assert plan.probe_failed and plan.skipped == 1
+    assert carry_forward(links, previous, [plan])['url'].tolist() == previous['url'].tolist()
@@ -0,0 +1,30 @@
+import time
+
+from retry import CircuitBreaker
+
+
+def test_breaker_trips_doubles_its_pause_and_resets_after_a_healthy_window():
+    breaker = CircuitBreaker(window=4, threshold=0.5, min_samples=4, pause=0.01)
+
+    for ok in (True, False, True, False):
+        breaker.record(ok)
+    assert breaker.trips == 1
+    assert breaker._pause == 0.02
+
+    time.sleep(0.03)
+    for _ in range(4):
+        breaker.record(False)
+    assert breaker.trips == 2
+    assert breaker._pause == 0.04
+
+    # Mixed outcomes below the threshold never make a full healthy window
+    time.sleep(0.05)
+    for ok in (True, True, True, False, True, True, True, False):
+        breaker.record(ok)
+    assert breaker.trips == 2
+    assert breaker._pause == 0.04
+
+    for _ in range(4):
+        breaker.record(True)
+    assert breaker._pause == 0.01
+    breaker.wait()